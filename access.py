@@ -1,8 +1,9 @@
 import os
 import time
-import sqlite3
 from typing import Tuple
 
+import db
+
 DB_PATH = os.getenv("ACCESS_DB", "access.sqlite3")
 
 FREE_LIMIT = int(os.getenv("FREE_LIMIT", "15"))
@@ -15,23 +16,8 @@ def _now() -> int:
     return int(time.time())
 
 def _connect():
-    con = sqlite3.connect(DB_PATH)
-    con.execute("PRAGMA journal_mode=WAL;")
-    con.execute("""
-    CREATE TABLE IF NOT EXISTS users(
-        user_id INTEGER PRIMARY KEY,
-        period_start INTEGER NOT NULL,
-        used INTEGER NOT NULL,
-        paid_until INTEGER NOT NULL
-    )
-    """)
-    con.execute("""
-    CREATE TABLE IF NOT EXISTS promo_uses(
-        code TEXT PRIMARY KEY,
-        used INTEGER NOT NULL
-    )
-    """)
-    return con
+    # Схема ведётся миграциями (migrations.py); соединение потока — долгоживущее (db.py)
+    return db.connect(DB_PATH, schema="access")
 
 def _parse_codes():
     """
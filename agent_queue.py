@@ -0,0 +1,117 @@
+"""
+Очередь вызовов tracker_agent.handle по пользователям
+
+Сообщения одного пользователя обрабатываются строго по очереди: параллельные
+вызовы handle читали и дописывали одни и те же заметки и теряли записи.
+Разные пользователи обрабатываются параллельно.
+
+Опционально (AGENT_COALESCE_WINDOW > 0, секунды) сообщения, пришедшие пачкой
+с одинаковым mode_hint, склеиваются в один вызов LLM. Ответ получает последнее
+сообщение пачки, остальные получают {"coalesced": True} и ничего не отвечают.
+"""
+import os
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+import llm_client
+import tracker_agent
+
+AGENT_COALESCE_WINDOW = float(os.getenv("AGENT_COALESCE_WINDOW", "0"))
+AGENT_COALESCE_MAX = int(os.getenv("AGENT_COALESCE_MAX", "5"))
+
+_queues: Dict[int, Deque["_Job"]] = {}
+_workers: Dict[int, asyncio.Task] = {}
+_stats = {"calls": 0, "messages": 0, "coalesced": 0, "max_depth": 0}
+
+
+class _Job:
+    __slots__ = ("text", "mode_hint", "force_mode_hint", "on_partial", "priority", "future")
+
+    def __init__(self, text: str, mode_hint: Optional[str], force_mode_hint: bool,
+                 on_partial: Optional[Callable[[str], Awaitable[None]]], priority: str,
+                 future: asyncio.Future):
+        self.text = text
+        self.mode_hint = mode_hint
+        self.force_mode_hint = force_mode_hint
+        self.on_partial = on_partial
+        self.priority = priority
+        self.future = future
+
+
+def _take_batch(q: Deque[_Job]) -> List[_Job]:
+    first = q.popleft()
+    batch = [first]
+    # Системные вызовы (force_mode_hint) никогда не склеиваем
+    if AGENT_COALESCE_WINDOW <= 0 or first.force_mode_hint:
+        return batch
+    while (q and len(batch) < AGENT_COALESCE_MAX
+           and not q[0].force_mode_hint and q[0].mode_hint == first.mode_hint
+           and q[0].priority == first.priority):
+        batch.append(q.popleft())
+    return batch
+
+
+async def _worker(user_id: int) -> None:
+    q = _queues[user_id]
+    try:
+        while q:
+            if AGENT_COALESCE_WINDOW > 0 and not q[0].force_mode_hint:
+                # Даём пачке сообщений догнать первое
+                await asyncio.sleep(AGENT_COALESCE_WINDOW)
+            batch = _take_batch(q)
+            main = batch[-1]
+            _stats["calls"] += 1
+            _stats["coalesced"] += len(batch) - 1
+            try:
+                result = await tracker_agent.handle(
+                    user_id,
+                    "\n".join(j.text for j in batch),
+                    mode_hint=main.mode_hint,
+                    force_mode_hint=main.force_mode_hint,
+                    on_partial=main.on_partial,
+                    priority=main.priority,
+                )
+            except Exception as e:
+                for j in batch:
+                    if not j.future.done():
+                        j.future.set_exception(e)
+                continue
+            for j in batch[:-1]:
+                if not j.future.done():
+                    j.future.set_result({"reply": "", "writes": [], "coalesced": True})
+            if not main.future.done():
+                main.future.set_result(result)
+    finally:
+        _workers.pop(user_id, None)
+        # Воркер отменён — не оставляем ожидающих навсегда
+        while q:
+            j = q.popleft()
+            if not j.future.done():
+                j.future.cancel()
+        _queues.pop(user_id, None)
+
+
+async def handle(user_id: int, text: str, mode_hint: Optional[str] = None, force_mode_hint: bool = False,
+                 on_partial: Optional[Callable[[str], Awaitable[None]]] = None,
+                 priority: str = llm_client.PRIORITY_INTERACTIVE) -> Dict[str, Any]:
+    """То же, что tracker_agent.handle, но через очередь пользователя"""
+    job = _Job(text, mode_hint, force_mode_hint, on_partial, priority, asyncio.get_running_loop().create_future())
+    q = _queues.setdefault(user_id, deque())
+    q.append(job)
+    _stats["messages"] += 1
+    if len(q) > _stats["max_depth"]:
+        _stats["max_depth"] = len(q)
+    if len(q) > 1:
+        logging.info(f"agent_queue: user {user_id} has {len(q)} pending messages")
+    if user_id not in _workers:
+        _workers[user_id] = asyncio.create_task(_worker(user_id))
+    return await job.future
+
+
+def stats() -> Dict[str, Any]:
+    out: Dict[str, Any] = dict(_stats)
+    out["active_users"] = len(_workers)
+    out["pending"] = sum(len(q) for q in _queues.values())
+    return out
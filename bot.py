@@ -4,7 +4,10 @@ from typing import Optional
 from aiogram import Bot, Dispatcher, F, types, BaseMiddleware
 from aiogram.filters import Command, CommandObject
 from aiogram.filters.command import CommandStart
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo, Message, CallbackQuery
+from aiogram.types import (
+    InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo, Message, CallbackQuery,
+    BufferedInputFile, InputMediaPhoto,
+)
 
 # === PROMO_UNLIMITED v1 ===
 import json
@@ -48,7 +51,11 @@ from paywall import (
     get_expiring_subscriptions, get_expired_subscriptions, mark_auto_renewal_attempted
 )
 
-from tracker_agent import handle as agent_handle
+# Вызовы агента идут через очередь пользователя: сообщения одного юзера обрабатываются по порядку
+from agent_queue import handle as agent_handle
+import db
+import llm_client
+import notes_client
 from menu_button import set_menu_button
 from partners import use_partner_promo
 from user_settings import get_preferences, update_preferences, get_goals, update_goals, track_activity
@@ -63,11 +70,8 @@ from referrals import (
     get_user_profile,
     upsert_user_profile,
 )
-from stats_enhanced import (
-    generate_streak_stats, generate_streak_summary_chart, 
-    generate_streak_chart, generate_timeline_chart,
-    generate_weekly_distribution_chart, generate_stats_summary_text
-)
+import stats_enhanced
+from stats_enhanced import generate_streak_stats, generate_stats_summary_text, render_chart
 import traceback
 
 
@@ -127,7 +131,6 @@ async def stt_oggopus(ogg_bytes: bytes, lang: str | None = None) -> str:
 # menu_kb удалена - кнопки под строкой ввода отключены
 
 
-BOT_TOKEN = os.environ["BOT_TOKEN"]
 WEBAPP_URL = (os.environ.get("WEBAPP_URL") or "").strip() or "https://sport-helper-robot.online/tracker.html"
 
 dp = Dispatcher()
@@ -462,6 +465,9 @@ async def on_voice(message: Message):
         text_to_save = cleaned if cleaned else text
 
         out = await agent_handle(user_id=uid, text=text_to_save, mode_hint=mode)
+        if out.get("coalesced"):
+            # Склеено со следующим сообщением — ответ придёт на него
+            return
         await message.answer(_reply_text(out) or "✅ Готово.")
     except YandexSTTError as e:
         await message.answer(f"⚠️ Не смог распознать: {e}")
@@ -523,6 +529,60 @@ async def _paywall_pay(message: Message):
                 "Попробуйте позже или обратитесь в поддержку."
             )
 
+# Стриминг ответов: плейсхолдер редактируется не чаще раза в STREAM_EDIT_INTERVAL секунд
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "true").lower() == "true"
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+STREAM_MIN_CHARS = int(os.getenv("STREAM_MIN_CHARS", "20"))
+TG_MAX_TEXT = 4096
+
+
+class StreamingReply:
+    """Прогрессивный ответ: первое сообщение с частью текста, дальше edit_text с троттлингом"""
+
+    def __init__(self, message: types.Message):
+        self.message = message
+        self.sent: Optional[types.Message] = None
+        self.shown = ""
+        self.last_edit = 0.0
+
+    async def update(self, text: str) -> None:
+        text = text[:TG_MAX_TEXT]
+        loop = asyncio.get_running_loop()
+        if self.sent is None:
+            if len(text) < STREAM_MIN_CHARS:
+                return
+            self.sent = await self.message.answer(text + " …")
+            self.shown, self.last_edit = text, loop.time()
+            return
+        if text == self.shown or loop.time() - self.last_edit < STREAM_EDIT_INTERVAL:
+            return
+        self.last_edit = loop.time()
+        try:
+            await self.sent.edit_text(text + " …")
+            self.shown = text
+        except Exception:
+            # "message is not modified", flood control и т.п. — просто пропускаем кадр
+            pass
+
+    async def finish(self, text: str) -> None:
+        if self.sent is None:
+            await self.message.answer(text)
+            return
+        try:
+            await self.sent.edit_text(text[:TG_MAX_TEXT])
+        except Exception:
+            await self.message.answer(text)
+
+    async def fail(self, text: str) -> None:
+        if self.sent is None:
+            await self.message.answer(text)
+            return
+        try:
+            await self.sent.edit_text(text)
+        except Exception:
+            await self.message.answer(text)
+
+
 @dp.message(F.text)
 async def on_text(message: types.Message):
     # Пропускаем команды - они обрабатываются отдельными обработчиками
@@ -625,7 +685,8 @@ async def on_text(message: types.Message):
     
     # Сразу показываем typing indicator для мгновенной обратной связи
     await message.bot.send_chat_action(chat_id=message.chat.id, action="typing")
-    
+
+    stream = StreamingReply(message)
     try:
         # Улучшенная система определения режима
         from intent_classifier import get_mode_hint, classify_intent
@@ -647,16 +708,20 @@ async def on_text(message: types.Message):
             await message.answer("📌 План тебе назначает тренер. Ты не можешь создавать новый план.")
             return
 
-        out = await agent_handle(user_id=uid, text=message.text, mode_hint=(mode or ""))
+        out = await agent_handle(user_id=uid, text=message.text, mode_hint=(mode or ""),
+                                 on_partial=stream.update if STREAM_REPLIES else None)
+        if out.get("coalesced"):
+            # Склеено со следующим сообщением — ответ придёт на него
+            return
         reply = (out.get("reply") or "").strip()
         if not reply:
             reply = "Ок."
-        await message.answer(reply)
+        await stream.finish(reply)
     except Exception as e:
 
         traceback.print_exc()
 
-        await message.answer("⚠️ Ошибка. Попробуй ещё раз.\nЕсли повторится — скажи, я посмотрю логи.")
+        await stream.fail("⚠️ Ошибка. Попробуй ещё раз.\nЕсли повторится — скажи, я посмотрю логи.")
 
 async def check_and_renew_subscriptions(bot: Bot):
     """Проверяет подписки и отправляет уведомления о необходимости продления"""
@@ -826,10 +891,19 @@ async def main():
     logger = logging.getLogger(__name__)
     
     logger.info("🚀 Запуск бота...")
-    bot = Bot(token=BOT_TOKEN)  # parse_mode не задаём специально
+    # Схемы всех SQLite-БД — один раз при старте, в обработчиках DDL нет
+    import migrations
+    versions = migrations.run_all()
+    logger.info("🗄 Версии схем БД: " + ", ".join(f"{k}=v{v}" for k, v in versions.items()))
+    bot = Bot(token=os.environ["BOT_TOKEN"])  # parse_mode не задаём специально
     logger.info("✅ Bot создан")
     set_menu_button()           # меню-кнопка тоже "Дневник"
     logger.info("✅ Меню-кнопка установлена")
+    # Размер статических промптов (они собраны при импорте и идут одинаковым префиксом)
+    import prompts
+    logger.info("📝 Промпты (токенов): " + ", ".join(
+        f"{name}={info['tokens']}" for name, info in prompts.stats().items()
+    ))
 
     # Запускаем API для дашборда рефералов (если включено)
     try:
@@ -856,8 +930,17 @@ async def main():
     asyncio.create_task(motivation_notifications_scheduler(bot))
     logger.info("✅ Scheduler мотивирующих уведомлений запущен")
     
+    # Процессы рендера графиков /stats поднимаем заранее, в фоне
+    asyncio.create_task(stats_enhanced.warm_up())
+    
     logger.info("🔄 Начинаю polling...")
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        notes_client.close()
+        llm_client.close()
+        stats_enhanced.close()
+        db.close_all()
 
 
 # MODE_MENU_V2 удален - команды /1, /2, /3, /menu и кнопки отключены
@@ -929,6 +1012,9 @@ async def _paywall_checkpay(call: CallbackQuery):
 
 
 # === СТАТИСТИКА ===
+# dashboard — все графики одной картинкой; album — отдельные графики одной медиагруппой
+STATS_LAYOUT = os.getenv("STATS_LAYOUT", "dashboard").strip().lower()
+
 @dp.message(Command("stats"))
 async def cmd_stats(message: types.Message):
     """Показывает статистику В ударе с красивыми графиками"""
@@ -946,47 +1032,53 @@ async def cmd_stats(message: types.Message):
         await message.answer("📊 Генерирую статистику...")
         logger.info("Сообщение отправлено")
         
-        # Генерируем текстовую сводку
+        # Генерируем текстовую сводку (данные попадают в кэш статистики для графиков)
         try:
-            summary = generate_stats_summary_text(uid, days=90)
+            summary = await asyncio.to_thread(generate_stats_summary_text, uid, 90)
             await message.answer(summary)
         except Exception as e:
             await message.answer(f"⚠️ Ошибка получения статистики: {type(e).__name__}: {e}")
             traceback.print_exc()
             return
         
-        # График с метриками В ударе (круговая диаграмма + метрики)
-        try:
-            summary_chart = generate_streak_summary_chart(uid, days=90)
-            if summary_chart:
-                await message.answer_photo(summary_chart, caption="🔥 Метрики \"В ударе\"")
-        except Exception as e:
-            await message.answer(f"⚠️ Ошибка создания графика метрик: {e}")
-            traceback.print_exc()
-        
-        # Календарь активности
-        try:
-            calendar_chart = generate_streak_chart(uid, days=90)
-            if calendar_chart:
-                await message.answer_photo(calendar_chart, caption="📅 Календарь активности за 90 дней")
-        except Exception as e:
-            traceback.print_exc()
-        
-        # График распределения по дням недели
-        try:
-            weekly_chart = generate_weekly_distribution_chart(uid, days=90)
-            if weekly_chart:
-                await message.answer_photo(weekly_chart, caption="📈 Распределение тренировок по дням недели")
-        except Exception as e:
-            traceback.print_exc()
+        ext = stats_enhanced.CHART_FORMAT
+        if STATS_LAYOUT != "album":
+            # Одна сводная картинка: один рендер в пуле процессов и одна загрузка
+            try:
+                image = await render_chart(uid, "dashboard", days=90)
+                if image:
+                    await message.answer_photo(BufferedInputFile(image, filename=f"stats.{ext}"),
+                                               caption="📊 Статистика \"В ударе\" за 90 дней")
+            except Exception as e:
+                await message.answer(f"⚠️ Ошибка создания графика метрик: {e}")
+                traceback.print_exc()
+            return
         
-        # Timeline график (за 60 дней для детализации)
-        try:
-            timeline_chart = generate_timeline_chart(uid, days=60)
-            if timeline_chart:
-                await message.answer_photo(timeline_chart, caption="⏱️ График активности за последние 60 дней")
-        except Exception as e:
-            traceback.print_exc()
+        # Альбом: графики рисуются параллельно в пуле процессов и уходят одной медиагруппой
+        charts = [
+            ("summary", 90, "🔥 Метрики \"В ударе\""),
+            ("calendar", 90, "📅 Календарь активности за 90 дней"),
+            ("weekly", 90, "📈 Распределение тренировок по дням недели"),
+            ("timeline", 60, "⏱️ График активности за последние 60 дней"),
+        ]
+        results = await asyncio.gather(
+            *(render_chart(uid, chart, days=days) for chart, days, _ in charts),
+            return_exceptions=True,
+        )
+        media = []
+        for (chart, _, caption), image in zip(charts, results):
+            if isinstance(image, BaseException):
+                traceback.print_exception(image)
+                if chart == "summary":
+                    await message.answer(f"⚠️ Ошибка создания графика метрик: {image}")
+                continue
+            if image:
+                media.append(InputMediaPhoto(media=BufferedInputFile(image, filename=f"{chart}.{ext}"),
+                                             caption=caption))
+        if len(media) == 1:
+            await message.answer_photo(media[0].media, caption=media[0].caption)
+        elif media:
+            await message.answer_media_group(media)
             
     except Exception as e:
         traceback.print_exc()
@@ -1123,5 +1215,7 @@ async def _remind_del(call: CallbackQuery):
 
 # Админ-команды партнерской программы удалены
 
+# Всё, что запускает бота (токен, миграции, polling, фоновые задачи), — только в main():
+# процессы пула графиков (spawn) заново импортируют этот файл как __mp_main__
 if __name__ == "__main__":
     asyncio.run(main())
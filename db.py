@@ -0,0 +1,165 @@
+"""
+Общий слой подключений к SQLite
+
+Вместо sqlite3.connect + CREATE TABLE на каждый вызов каждый поток держит
+одно долгоживущее соединение на файл БД. При открытии соединение
+настраивается один раз: WAL (читатели не блокируют писателя),
+synchronous=NORMAL, busy_timeout, mmap_size. Схема файла ведётся миграциями
+(migrations.py): connect(path, schema=<имя БД>) один раз за процесс догоняет
+версию, если старт процесса этого ещё не сделал.
+
+close() у такого соединения ничего не закрывает — только откатывает
+незавершённую транзакцию, поэтому существующий код с try/finally: con.close()
+работает без изменений. Если connect() вызван внутри чужой открытой транзакции
+того же потока (вспомогательная функция посреди цикла INSERT-ов), парный close()
+её не трогает — откатывает только внешний владелец. Реально соединения закрываются, когда завершается
+поток-владелец (anyio гасит простаивающие потоки sync-обработчиков FastAPI),
+или в close_all() при остановке процесса.
+
+Для async-обработчиков FastAPI: await db.run(<имя БД>, fn, *args) выполняет
+синхронную функцию доступа к БД в пуле потоков этой БД (DB_EXECUTOR_WORKERS
+потоков на файл, у каждого своё соединение), не блокируя event loop.
+Пулы раздельные, поэтому медленный запрос к одной БД не занимает потоки другой.
+"""
+import os
+import asyncio
+import sqlite3
+import functools
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+import migrations
+
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(64 * 1024 * 1024)))
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "8192"))
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "4"))
+
+T = TypeVar("T")
+
+
+class SharedConnection(sqlite3.Connection):
+    """Соединение потока: close() возвращает его «в пул» (откат незакоммиченного)"""
+
+    # Сколько connect() выдано внутри уже открытой транзакции и ещё не закрыто
+    nested = 0
+
+    def close(self) -> None:
+        if not self.in_transaction:
+            self.nested = 0
+        elif self.nested > 0:
+            # Транзакция принадлежит внешнему вызову — откатит он сам
+            self.nested -= 1
+        else:
+            self.rollback()
+
+    def really_close(self) -> None:
+        self.closed = True
+        super().close()
+
+
+class _ThreadConns(dict):
+    """Соединения одного потока: закрываются вместе с его threading.local при выходе потока"""
+
+    def __del__(self) -> None:
+        for con in self.values():
+            try:
+                con.really_close()
+            except Exception:
+                pass
+
+
+_local = threading.local()
+_lock = threading.Lock()
+# Слабые ссылки: список для close_all() не держит соединения завершившихся потоков
+_all: "weakref.WeakSet[SharedConnection]" = weakref.WeakSet()
+_schema_done: set = set()
+_executors: Dict[str, ThreadPoolExecutor] = {}
+
+
+def _key(path: str) -> str:
+    return os.path.abspath(path)
+
+
+def _open(path: str) -> SharedConnection:
+    d = os.path.dirname(path)
+    if d and not os.path.isdir(d):
+        os.makedirs(d, exist_ok=True)
+    con = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT_MS / 1000.0,
+                          check_same_thread=False, factory=SharedConnection)
+    con.execute("PRAGMA journal_mode=WAL;")
+    con.execute("PRAGMA synchronous=NORMAL;")
+    con.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS};")
+    con.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE};")
+    con.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB};")
+    con.execute("PRAGMA temp_store=MEMORY;")
+    with _lock:
+        _all.add(con)
+    return con
+
+
+def ensure_schema(con: sqlite3.Connection, path: str, name: str) -> None:
+    """Догоняет миграции БД name для файла один раз за процесс"""
+    key = (_key(path), name)
+    if key in _schema_done:
+        return
+    with _lock:
+        if key in _schema_done:
+            return
+        migrations.migrate(con, name)
+        _schema_done.add(key)
+
+
+def connect(path: str, schema: Optional[str] = None) -> SharedConnection:
+    """Долгоживущее соединение текущего потока к файлу path; schema — имя БД в migrations"""
+    conns: Optional[_ThreadConns] = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = _ThreadConns()
+    key = _key(path)
+    con = conns.get(key)
+    if con is None or getattr(con, "closed", False):
+        con = conns[key] = _open(path)
+    else:
+        # Внутри открытой транзакции потока — вложенный вызов; вне её защищать нечего
+        # (заодно сбрасывается счётчик, если кто-то не вызвал close())
+        con.nested = con.nested + 1 if con.in_transaction else 0
+    if schema is not None:
+        ensure_schema(con, path, schema)
+    return con
+
+
+def executor(name: str) -> ThreadPoolExecutor:
+    """Пул потоков для БД name (создаётся при первом обращении)"""
+    ex = _executors.get(name)
+    if ex is None:
+        with _lock:
+            ex = _executors.get(name)
+            if ex is None:
+                ex = _executors[name] = ThreadPoolExecutor(
+                    max_workers=max(1, DB_EXECUTOR_WORKERS), thread_name_prefix=f"db-{name}"
+                )
+    return ex
+
+
+async def run(name: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Выполняет синхронную fn(*args, **kwargs) в пуле потоков БД name"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor(name), functools.partial(fn, *args, **kwargs))
+
+
+def close_all() -> None:
+    """Закрывает все соединения и пулы потоков (при остановке процесса)"""
+    with _lock:
+        conns = list(_all)
+        _all.clear()
+        executors = list(_executors.values())
+        _executors.clear()
+    for ex in executors:
+        ex.shutdown(wait=False)
+    for con in conns:
+        try:
+            con.really_close()
+        except Exception:
+            pass
@@ -8,11 +8,16 @@ from typing import Optional
 import asyncio
 import os
 
+import db
+import prompts
+from llm_scheduler import PRIORITY_PLAN
+
 router = APIRouter()
 
 # Импортируем tracker_agent для генерации плана
 try:
-    from tracker_agent import handle as agent_handle
+    # Через очередь пользователя, чтобы генерация не пересекалась с другими записями того же юзера
+    from agent_queue import handle as agent_handle
 except ImportError:
     # Если tracker_agent не доступен напрямую, используем альтернативный путь
     agent_handle = None
@@ -23,6 +28,23 @@ except Exception:
     get_user_trainer = None
 
 
+# Шаблоны запроса к агенту (собираются один раз при импорте)
+_WORKOUTS_PROMPT = prompts.register("plan_api.workouts", (
+    "План тренировок на {d}:\n"
+    "{context}"
+    "КРИТИЧЕСКИ ВАЖНО: ОБЯЗАТЕЛЬНО укажи вес в кг для КАЖДОГО упражнения!\n"
+    "Формат каждого упражнения: 'Название: 4 подхода по 8-12 повторений, 80 кг'\n"
+    "Или короткий формат: 'Название: 4х8-12 80кг'\n"
+    "БЕЗ веса план бесполезен - пользователь не знает, с каким весом работать.\n"
+    "Структура: Разминка → Основные упражнения (с весом в кг!) → Добивка → Заминка.\n"
+), static=False)
+
+_MEALS_PROMPT = prompts.register("plan_api.meals", (
+    "Составь подробный план питания на {d}. Включи завтрак, обед, ужин и перекусы с указанием "
+    "продуктов и примерных порций. Сделай план сбалансированным и полезным."
+), static=False)
+
+
 class GeneratePlanRequest(BaseModel):
     d: str  # Дата в формате YYYY-MM-DD
     kind: str  # "workouts" или "meals"
@@ -103,6 +125,70 @@ def _build_fallback_workout_plan(day: str, weights: dict) -> str:
     )
 
 
+def _load_context(user_id: int) -> tuple:
+    """Профиль, рабочие веса и карта последних весов для промпта (синхронно, из БД трекера)"""
+    get_profile, summarize_strength, last_weight_map = _safe_import_context()
+    profile_block = ""
+    if get_profile:
+        try:
+            try:
+                from app.profile_store import profile_to_prompt
+            except Exception:
+                from profile_store import profile_to_prompt
+            profile_block = profile_to_prompt(get_profile(user_id))  # type: ignore
+        except Exception:
+            profile_block = ""
+
+    strength_block = ""
+    if summarize_strength:
+        try:
+            strength_block = summarize_strength(user_id, days=60)  # type: ignore
+        except Exception:
+            strength_block = ""
+
+    weights_map = {}
+    if last_weight_map:
+        try:
+            weights_map = last_weight_map(user_id, days=90)  # type: ignore
+        except Exception:
+            weights_map = {}
+    return profile_block, strength_block, weights_map
+
+
+def _tracker_db():
+    db_path = os.getenv("TRACKER_DB_PATH", "/data/tracker.db")
+    return db.connect(db_path, schema="tracker")
+
+
+def _find_saved_plan(user_id: int, d: str, kind: str) -> str:
+    """Сохранённый агентом план: сначала "plan" (куда ИИ сохраняет), потом нужный kind"""
+    conn = _tracker_db()
+    try:
+        for check_kind in ["plan", kind]:
+            row = conn.execute(
+                "SELECT text FROM notes WHERE user_id=? AND d=? AND kind=?",
+                (str(user_id), d, check_kind)
+            ).fetchone()
+            if row and row[0] and row[0].strip():
+                return row[0]
+        return ""
+    finally:
+        conn.close()
+
+
+def _save_plan_copy(user_id: int, d: str, kind: str, text: str) -> None:
+    """Сохраняем план в нужный kind (workouts/meals) для отображения в правильном разделе"""
+    conn = _tracker_db()
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO notes (user_id, d, kind, text, updated_at) VALUES (?, ?, ?, ?, datetime('now'))",
+            (str(user_id), d, kind, text)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
 def _get_user_id(x_user_id: Optional[str] = Header(None)) -> int:
     """Извлекает user_id из заголовка X-User-Id"""
     if not x_user_id:
@@ -127,37 +213,13 @@ async def generate_plan(
     user_id = _get_user_id(x_user_id)
     kind = request.kind
 
-    if get_user_trainer and get_user_trainer(user_id):
+    if get_user_trainer and await db.run("referrals", get_user_trainer, user_id):
         raise HTTPException(status_code=403, detail="Plan editing is disabled for users bound to a trainer")
     
     if kind not in ["workouts", "meals"]:
         raise HTTPException(status_code=400, detail="kind must be 'workouts' or 'meals'")
     
-    get_profile, summarize_strength, last_weight_map = _safe_import_context()
-    profile_block = ""
-    if get_profile:
-        try:
-            try:
-                from app.profile_store import profile_to_prompt
-            except Exception:
-                from profile_store import profile_to_prompt
-            profile_block = profile_to_prompt(get_profile(user_id))  # type: ignore
-        except Exception:
-            profile_block = ""
-
-    strength_block = ""
-    if summarize_strength:
-        try:
-            strength_block = summarize_strength(user_id, days=60)  # type: ignore
-        except Exception:
-            strength_block = ""
-
-    weights_map = {}
-    if last_weight_map:
-        try:
-            weights_map = last_weight_map(user_id, days=90)  # type: ignore
-        except Exception:
-            weights_map = {}
+    profile_block, strength_block, weights_map = await db.run("tracker", _load_context, user_id)
 
     # Формируем запрос для ИИ - как будто пользователь написал в чат
     # ВАЖНО: для генерации плана используем mode_hint="plan", чтобы ИИ создал план в разделе "plan"
@@ -172,18 +234,11 @@ async def generate_plan(
         context_str = "\n".join(context_parts) if context_parts else ""
         
         # Убираем фразу "Составь план" - она провоцирует копирование
-        prompt = f"План тренировок на {request.d}:\n"
-        if context_str:
-            prompt += f"{context_str}\n"
-        prompt += "КРИТИЧЕСКИ ВАЖНО: ОБЯЗАТЕЛЬНО укажи вес в кг для КАЖДОГО упражнения!\n"
-        prompt += "Формат каждого упражнения: 'Название: 4 подхода по 8-12 повторений, 80 кг'\n"
-        prompt += "Или короткий формат: 'Название: 4х8-12 80кг'\n"
-        prompt += "БЕЗ веса план бесполезен - пользователь не знает, с каким весом работать.\n"
-        prompt += "Структура: Разминка → Основные упражнения (с весом в кг!) → Добивка → Заминка.\n"
+        prompt = _WORKOUTS_PROMPT.render(d=request.d, context=f"{context_str}\n" if context_str else "")
         
         mode_hint = "plan"  # Используем "plan" чтобы ИИ создал план
     else:  # meals
-        prompt = f"Составь подробный план питания на {request.d}. Включи завтрак, обед, ужин и перекусы с указанием продуктов и примерных порций. Сделай план сбалансированным и полезным."
+        prompt = _MEALS_PROMPT.render(d=request.d)
         mode_hint = "plan"  # Используем "plan" чтобы ИИ создал план
     
     try:
@@ -193,6 +248,7 @@ async def generate_plan(
             text=prompt,
             mode_hint=mode_hint,
             force_mode_hint=True,
+            priority=PRIORITY_PLAN,
         )
         
         # Извлекаем сгенерированный текст
@@ -242,21 +298,7 @@ async def generate_plan(
         # Если все еще нет текста, проверяем БД напрямую
         if not generated_text or generated_text.strip() == "":
             try:
-                import sqlite3
-                db_path = os.getenv("TRACKER_DB_PATH", "/data/tracker.db")
-                conn = sqlite3.connect(db_path, check_same_thread=False)
-                cursor = conn.cursor()
-                # Проверяем сначала "plan" (куда ИИ сохраняет), потом нужный kind
-                for check_kind in ["plan", kind]:
-                    cursor.execute(
-                        "SELECT text FROM notes WHERE user_id=? AND d=? AND kind=?",
-                        (str(user_id), request.d, check_kind)
-                    )
-                    row = cursor.fetchone()
-                    if row and row[0] and row[0].strip():
-                        generated_text = row[0]
-                        break
-                conn.close()
+                generated_text = await db.run("tracker", _find_saved_plan, user_id, request.d, kind)
             except Exception as db_e:
                 import logging
                 logging.error(f"DB check error: {db_e}")
@@ -264,17 +306,7 @@ async def generate_plan(
         # Если план найден, но он в kind="plan", копируем его в нужный kind для отображения
         if generated_text and generated_text.strip():
             try:
-                import sqlite3
-                db_path = os.getenv("TRACKER_DB_PATH", "/data/tracker.db")
-                conn = sqlite3.connect(db_path, check_same_thread=False)
-                cursor = conn.cursor()
-                # Сохраняем план в нужный kind (workouts/meals) для отображения в правильном разделе
-                cursor.execute(
-                    "INSERT OR REPLACE INTO notes (user_id, d, kind, text, updated_at) VALUES (?, ?, ?, ?, datetime('now'))",
-                    (str(user_id), request.d, kind, generated_text)
-                )
-                conn.commit()
-                conn.close()
+                await db.run("tracker", _save_plan_copy, user_id, request.d, kind, generated_text)
             except Exception as db_e:
                 import logging
                 logging.error(f"Failed to copy plan to {kind}: {db_e}")
@@ -5,6 +5,8 @@ from fastapi import APIRouter, Header, HTTPException
 from typing import Dict, Any, Optional
 from pydantic import BaseModel
 
+import db
+
 try:
     from app.user_settings import get_goals, update_goals
 except ImportError:
@@ -35,7 +37,7 @@ async def get_user_goals(x_user_id: str = Header(None, alias="X-User-Id")):
     """Получает цели пользователя"""
     user_id = _need_user(x_user_id)
     try:
-        goals = get_goals(user_id)
+        goals = await db.run("user_settings", get_goals, user_id)
         return goals
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get goals: {str(e)}")
@@ -53,8 +55,8 @@ async def update_user_goals(
             goals_dict["weekly_workouts"] = request.weekly_workouts
         
         if goals_dict:
-            update_goals(user_id, goals_dict)
+            await db.run("user_settings", update_goals, user_id, goals_dict)
         
-        return get_goals(user_id)
+        return await db.run("user_settings", get_goals, user_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update goals: {str(e)}")
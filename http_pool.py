@@ -0,0 +1,92 @@
+"""
+Общий пул HTTP-соединений (keep-alive) на базе aiohttp.
+
+Сессия живёт в отдельном фоновом event loop, поэтому одним пулом могут
+пользоваться и async-код бота, и синхронные функции (статистика, API-роутеры),
+и потоки uvicorn — без привязки сессии к чужому loop.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Optional
+
+import aiohttp
+
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int((os.getenv(name) or "").strip() or default)
+    except ValueError:
+        return default
+
+
+class HttpPool:
+    """
+    Пул keep-alive соединений с ограничением параллелизма.
+
+    limit / limit_per_host — лимиты коннектора aiohttp,
+    concurrency — сколько запросов пула может выполняться одновременно.
+    """
+
+    def __init__(self, name: str, limit: int = 100, limit_per_host: int = 50,
+                 concurrency: int = 64, keepalive_timeout: float = 60.0):
+        self.name = name
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.concurrency = concurrency
+        self.keepalive_timeout = keepalive_timeout
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._sem: Optional[asyncio.Semaphore] = None
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                loop = asyncio.new_event_loop()
+                t = threading.Thread(target=loop.run_forever, name=f"http-pool-{self.name}", daemon=True)
+                t.start()
+                self._loop = loop
+            return self._loop
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        # Вызывается только внутри фонового loop — гонок нет
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._sem = asyncio.Semaphore(self.concurrency)
+        return self._session
+
+    async def _run(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        session = await self._get_session()
+        async with self._sem:
+            return await fn(session, *args, **kwargs)
+
+    def submit(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Future:
+        """Запускает fn(session, *args) в loop пула и возвращает concurrent Future"""
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(self._run(fn, *args, **kwargs), loop)
+
+    async def call(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Awaitable-вариант submit для вызова из любого event loop"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def call_sync(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Блокирующий вариант submit для синхронного кода"""
+        return self.submit(fn, *args, **kwargs).result()
+
+    def close(self) -> None:
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        session, self._session = self._session, None
+        if session is not None:
+            asyncio.run_coroutine_threadsafe(session.close(), loop).result(timeout=5)
+        loop.call_soon_threadsafe(loop.stop)
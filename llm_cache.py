@@ -0,0 +1,139 @@
+"""
+Персистентный кэш ответов LLM для детерминированных вызовов (SQLite)
+
+Ключ — sha256 от полного payload (модель + messages + параметры), поэтому
+любое изменение промпта или температуры даёт новый ключ. Записи живут
+LLM_CACHE_TTL секунд, при превышении LLM_CACHE_MAX_ENTRIES вытесняются
+самые давно использованные (LRU по last_used).
+
+Попадание ничего не пишет в БД сразу: время использования копится в памяти
+и сбрасывается пачкой (LLM_CACHE_TOUCH_BATCH записей, раз в
+LLM_CACHE_TOUCH_INTERVAL секунд или перед вытеснением). Из async-кода
+get/put вызываются через asyncio.to_thread (llm_client.chat).
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+DB_PATH = os.getenv("LLM_CACHE_DB", "llm_cache.db")
+CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+TOUCH_BATCH = int(os.getenv("LLM_CACHE_TOUCH_BATCH", "50"))
+TOUCH_INTERVAL = float(os.getenv("LLM_CACHE_TOUCH_INTERVAL", "30"))
+
+_conn: Optional[sqlite3.Connection] = None
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+# key -> last_used, ещё не записанные в БД
+_touched: Dict[str, int] = {}
+_touched_flushed_at = time.monotonic()
+
+
+def _db() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL;")
+        _conn.execute("""
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            key TEXT PRIMARY KEY,
+            response TEXT NOT NULL,
+            created_at INTEGER NOT NULL,
+            last_used INTEGER NOT NULL
+        )
+        """)
+        _conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache(last_used)")
+        _conn.commit()
+    return _conn
+
+
+def make_key(payload: Dict[str, Any]) -> str:
+    """Стабильный хэш payload: сортированные ключи, без пробелов"""
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _flush_touched(conn: sqlite3.Connection) -> None:
+    """Записывает накопленные last_used одним executemany (commit — на вызывающем)"""
+    global _touched_flushed_at
+    if _touched:
+        conn.executemany("UPDATE llm_cache SET last_used=? WHERE key=?",
+                         [(used, key) for key, used in _touched.items()])
+        _touched.clear()
+    _touched_flushed_at = time.monotonic()
+
+
+def get(key: str) -> Optional[str]:
+    """Ответ из кэша или None (просроченные записи удаляются)"""
+    if not CACHE_ENABLED:
+        return None
+    now = int(time.time())
+    with _lock:
+        conn = _db()
+        row = conn.execute("SELECT response, created_at FROM llm_cache WHERE key=?", (key,)).fetchone()
+        if row is None:
+            _stats["misses"] += 1
+            return None
+        response, created_at = row
+        if now - int(created_at) > CACHE_TTL:
+            _touched.pop(key, None)
+            conn.execute("DELETE FROM llm_cache WHERE key=?", (key,))
+            conn.commit()
+            _stats["misses"] += 1
+            return None
+        _touched[key] = now
+        if len(_touched) >= TOUCH_BATCH or time.monotonic() - _touched_flushed_at >= TOUCH_INTERVAL:
+            _flush_touched(conn)
+            conn.commit()
+        _stats["hits"] += 1
+        return response
+
+
+def put(key: str, response: str) -> None:
+    """Сохраняет ответ и вытесняет лишние записи по LRU"""
+    if not CACHE_ENABLED or not response:
+        return
+    now = int(time.time())
+    with _lock:
+        conn = _db()
+        # Свежие last_used — до вытеснения, иначе LRU выкинет только что использованные записи
+        _flush_touched(conn)
+        conn.execute("""
+            INSERT INTO llm_cache (key, response, created_at, last_used) VALUES (?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET response=excluded.response,
+                created_at=excluded.created_at, last_used=excluded.last_used
+        """, (key, response, now, now))
+        cur = conn.execute("""
+            DELETE FROM llm_cache WHERE key IN (
+                SELECT key FROM llm_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+        """, (CACHE_MAX_ENTRIES,))
+        conn.commit()
+        _stats["stores"] += 1
+        _stats["evictions"] += max(cur.rowcount, 0)
+
+
+def purge_expired() -> int:
+    """Удаляет все просроченные записи, возвращает их количество"""
+    with _lock:
+        conn = _db()
+        _flush_touched(conn)
+        cur = conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (int(time.time()) - CACHE_TTL,))
+        conn.commit()
+        return max(cur.rowcount, 0)
+
+
+def stats() -> Dict[str, Any]:
+    """Счётчики попаданий/промахов с момента старта процесса + размер кэша"""
+    with _lock:
+        entries = _db().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        out: Dict[str, Any] = dict(_stats)
+    total = out["hits"] + out["misses"]
+    out["entries"] = entries
+    out["hit_rate"] = round(out["hits"] / total, 3) if total else 0.0
+    return out
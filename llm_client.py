@@ -0,0 +1,268 @@
+"""
+Общий async-клиент chat completions (DeepSeek / OpenAI-совместимый API).
+
+Одна keep-alive сессия на весь процесс, приоритетный планировщик запросов
+(llm_scheduler: LLM_CONCURRENCY, квоты LLM_RPM/LLM_TPM), таймауты и повторы
+с экспоненциальной задержкой для 429/5xx/сетевых ошибок. Используется
+tracker_agent, workout_parser и motivation_messages.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+import aiohttp
+
+import llm_cache
+import prompts
+from http_pool import HttpPool, env_int
+from llm_scheduler import (LLMScheduler, QueueTimeout, PRIORITY_BACKGROUND,  # noqa: F401
+                           PRIORITY_INTERACTIVE, PRIORITY_PLAN)
+
+OPENAI_API_KEY = (os.getenv("OPENAI_API_KEY") or "").strip()          # DeepSeek key (Bearer)
+OPENAI_BASE_URL = (os.getenv("OPENAI_BASE_URL") or "https://api.deepseek.com").strip().rstrip("/")
+OPENAI_MODEL = (os.getenv("OPENAI_MODEL") or "deepseek-chat").strip()
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "12"))
+LLM_RETRIES = env_int("LLM_RETRIES", 2)
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+# JSON mode (response_format=json_object) — меньше кривых ответов и повторных запросов
+LLM_JSON_MODE = (os.getenv("LLM_JSON_MODE") or "true").strip().lower() == "true"
+
+_RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+# Параллелизм ограничивает планировщик (по приоритетам), у пула — только потолок соединений
+_pool = HttpPool(
+    "llm",
+    limit=env_int("LLM_POOL_LIMIT", 32),
+    limit_per_host=env_int("LLM_POOL_PER_HOST", 32),
+    concurrency=env_int("LLM_POOL_LIMIT", 32),
+)
+
+_scheduler = LLMScheduler(
+    concurrency=env_int("LLM_CONCURRENCY", 16),
+    background_concurrency=env_int("LLM_BACKGROUND_CONCURRENCY", 4),
+    rpm=float(os.getenv("LLM_RPM", "0")),
+    tpm=float(os.getenv("LLM_TPM", "0")),
+)
+
+
+class LLMError(RuntimeError):
+    pass
+
+
+def _backoff(attempt: int, retry_after: Optional[str] = None) -> float:
+    if retry_after:
+        try:
+            return min(float(retry_after), 30.0)
+        except ValueError:
+            pass
+    return LLM_BACKOFF_BASE * (2 ** attempt) + random.uniform(0, LLM_BACKOFF_BASE)
+
+
+def _estimate_cost(payload: Dict[str, Any]) -> float:
+    """Оценка токенов запроса для TPM-квоты: промпт + max_tokens"""
+    prompt_tokens = sum(prompts.count_tokens(str(m.get("content") or "")) for m in payload.get("messages") or [])
+    return float(prompt_tokens + int(payload.get("max_tokens") or 0))
+
+
+async def _chat(session: aiohttp.ClientSession, payload: Dict[str, Any], timeout: float, retries: int,
+                priority: str = PRIORITY_INTERACTIVE, queue_timeout: Optional[float] = None) -> str:
+    headers = {
+        "Authorization": f"Bearer {OPENAI_API_KEY}",
+        "Content-Type": "application/json",
+    }
+    url = f"{OPENAI_BASE_URL}/v1/chat/completions"
+    last_error: Optional[BaseException] = None
+    cost = _estimate_cost(payload)
+    for attempt in range(retries + 1):
+        retry_after = None
+        try:
+            async with _scheduler.slot(priority, cost, queue_timeout), \
+                    session.post(url, json=payload, headers=headers,
+                                 timeout=aiohttp.ClientTimeout(total=timeout)) as r:
+                if r.status in _RETRY_STATUSES:
+                    retry_after = r.headers.get("Retry-After")
+                    last_error = LLMError(f"HTTP {r.status}: {(await r.text())[:200]}")
+                elif r.status != 200:
+                    raise LLMError(f"HTTP {r.status}: {(await r.text())[:200]}")
+                else:
+                    j = await r.json(content_type=None)
+                    content = (((j.get("choices") or [{}])[0]).get("message") or {}).get("content") or ""
+                    return content.strip()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            last_error = e
+        if attempt < retries:
+            delay = _backoff(attempt, retry_after)
+            logging.warning(f"LLM request failed ({last_error!r}), retry {attempt + 1}/{retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+    raise LLMError(f"LLM request failed after {retries + 1} attempts: {last_error!r}")
+
+
+async def _chat_stream(session: aiohttp.ClientSession, payload: Dict[str, Any], timeout: float, retries: int,
+                       emit: Callable[[str], None], priority: str = PRIORITY_INTERACTIVE,
+                       queue_timeout: Optional[float] = None) -> None:
+    """SSE-стрим chat completions: каждый кусок content отдаётся в emit. Повтор — только до первого токена."""
+    headers = {
+        "Authorization": f"Bearer {OPENAI_API_KEY}",
+        "Content-Type": "application/json",
+        "Accept": "text/event-stream",
+    }
+    url = f"{OPENAI_BASE_URL}/v1/chat/completions"
+    last_error: Optional[BaseException] = None
+    cost = _estimate_cost(payload)
+    for attempt in range(retries + 1):
+        retry_after = None
+        emitted = False
+        try:
+            async with _scheduler.slot(priority, cost, queue_timeout), \
+                    session.post(url, json=payload, headers=headers,
+                                 timeout=aiohttp.ClientTimeout(sock_connect=timeout, sock_read=timeout)) as r:
+                if r.status in _RETRY_STATUSES:
+                    retry_after = r.headers.get("Retry-After")
+                    last_error = LLMError(f"HTTP {r.status}: {(await r.text())[:200]}")
+                elif r.status != 200:
+                    raise LLMError(f"HTTP {r.status}: {(await r.text())[:200]}")
+                else:
+                    async for raw_line in r.content:
+                        line = raw_line.decode("utf-8", errors="ignore").strip()
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[5:].strip()
+                        if data == "[DONE]":
+                            break
+                        try:
+                            j = json.loads(data)
+                        except ValueError:
+                            continue
+                        delta = (((j.get("choices") or [{}])[0]).get("delta") or {}).get("content") or ""
+                        if delta:
+                            emitted = True
+                            emit(delta)
+                    return
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if emitted:
+                raise LLMError(f"LLM stream interrupted: {e!r}") from e
+            last_error = e
+        if attempt < retries:
+            delay = _backoff(attempt, retry_after)
+            logging.warning(f"LLM stream failed ({last_error!r}), retry {attempt + 1}/{retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+    raise LLMError(f"LLM stream failed after {retries + 1} attempts: {last_error!r}")
+
+
+def _payload(messages: List[Dict[str, str]], temperature: float, max_tokens: int, extra: Dict[str, Any]) -> Dict[str, Any]:
+    if not OPENAI_API_KEY:
+        raise RuntimeError("OPENAI_API_KEY is missing")
+    payload = {
+        "model": OPENAI_MODEL,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+    payload.update(extra)
+    return payload
+
+
+def json_mode_params() -> Dict[str, Any]:
+    """Доп. поля payload для JSON mode (пусто, если LLM_JSON_MODE=false)"""
+    return {"response_format": {"type": "json_object"}} if LLM_JSON_MODE else {}
+
+
+async def chat(messages: List[Dict[str, str]], temperature: float = 0.2, max_tokens: int = 600,
+               timeout: Optional[float] = None, retries: Optional[int] = None, cache: bool = False,
+               priority: str = PRIORITY_INTERACTIVE, queue_timeout: Optional[float] = None,
+               **extra: Any) -> str:
+    """
+    Chat completion, возвращает текст ответа. extra — дополнительные поля payload.
+    cache=True — для детерминированных вызовов: одинаковый payload отдаётся из llm_cache без запроса.
+    priority — класс в планировщике (interactive / plan / background),
+    queue_timeout — сколько максимум ждать слот (QueueTimeout).
+    """
+    payload = _payload(messages, temperature, max_tokens, extra)
+    key = llm_cache.make_key(payload) if cache else None
+    if key:
+        # SQLite кэша — не в event loop
+        cached = await asyncio.to_thread(llm_cache.get, key)
+        if cached is not None:
+            return cached
+    content = await _pool.call(_chat, payload,
+                               LLM_TIMEOUT if timeout is None else timeout,
+                               LLM_RETRIES if retries is None else retries,
+                               priority, queue_timeout)
+    if key:
+        await asyncio.to_thread(llm_cache.put, key, content)
+    return content
+
+
+def chat_sync(messages: List[Dict[str, str]], temperature: float = 0.2, max_tokens: int = 600,
+              timeout: Optional[float] = None, retries: Optional[int] = None, cache: bool = False,
+              priority: str = PRIORITY_INTERACTIVE, queue_timeout: Optional[float] = None,
+              **extra: Any) -> str:
+    """То же самое для синхронного кода (запрос идёт через общую сессию)"""
+    payload = _payload(messages, temperature, max_tokens, extra)
+    key = llm_cache.make_key(payload) if cache else None
+    if key:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            return cached
+    content = _pool.call_sync(_chat, payload,
+                              LLM_TIMEOUT if timeout is None else timeout,
+                              LLM_RETRIES if retries is None else retries,
+                              priority, queue_timeout)
+    if key:
+        llm_cache.put(key, content)
+    return content
+
+
+_STREAM_END = object()
+
+
+async def chat_stream(messages: List[Dict[str, str]], temperature: float = 0.2, max_tokens: int = 600,
+                      timeout: Optional[float] = None, retries: Optional[int] = None,
+                      priority: str = PRIORITY_INTERACTIVE, queue_timeout: Optional[float] = None,
+                      **extra: Any) -> AsyncIterator[str]:
+    """
+    Стриминговый chat completion: async-генератор кусков текста по мере генерации.
+    Запрос выполняется в loop пула, куски передаются в loop вызывающего через очередь.
+    """
+    payload = _payload(messages, temperature, max_tokens, extra)
+    payload["stream"] = True
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def emit(item: Any) -> None:
+        loop.call_soon_threadsafe(queue.put_nowait, item)
+
+    async def _run(session: aiohttp.ClientSession) -> None:
+        try:
+            await _chat_stream(session, payload,
+                               LLM_TIMEOUT if timeout is None else timeout,
+                               LLM_RETRIES if retries is None else retries,
+                               emit, priority, queue_timeout)
+        finally:
+            emit(_STREAM_END)
+
+    fut = _pool.submit(_run)
+    try:
+        while True:
+            item = await queue.get()
+            if item is _STREAM_END:
+                break
+            yield item
+        # Пробрасываем ошибку стрима (если была)
+        await asyncio.wrap_future(fut)
+    finally:
+        if not fut.done():
+            fut.cancel()
+
+
+def scheduler_stats() -> Dict[str, Any]:
+    """Глубина очередей и время ожидания по классам приоритета"""
+    return _scheduler.stats()
+
+
+def close() -> None:
+    _pool.close()
@@ -0,0 +1,246 @@
+"""
+Извлечение и ремонт JSON из ответов LLM
+
+Ступени (от дешёвой к дорогой):
+- strict    — ответ целиком валидный JSON
+- extracted — первый сбалансированный {...} в тексте (markdown-обёртка, текст до/после)
+- repaired  — оборванный/кривой JSON: висячие запятые, незакрытые строки и скобки
+- partial   — из обрывка удалось достать только строковое поле (например, reply)
+
+Счётчики по ступеням (stats()) показывают, как часто модель отвечает криво
+и насколько часто нужен повторный запрос.
+"""
+import re
+import json
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+_JSON_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}
+_CLOSERS = {"{": "}", "[": "]"}
+MAX_REPAIR_CUTS = 12
+
+_lock = threading.Lock()
+_counts: Dict[str, Dict[str, int]] = {}
+
+
+def record(source: str, path: str) -> None:
+    """Учитывает, какой ступенью разобран ответ (path) для вызывающего (source)"""
+    with _lock:
+        bucket = _counts.setdefault(source, {})
+        bucket[path] = bucket.get(path, 0) + 1
+
+
+def stats() -> Dict[str, Dict[str, int]]:
+    with _lock:
+        return {src: dict(paths) for src, paths in _counts.items()}
+
+
+def _loads_obj(text: str) -> Optional[dict]:
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _balanced_objects(text: str) -> Iterable[str]:
+    """Все сбалансированные {...} верхнего уровня (с учётом строк и escape)"""
+    depth = 0
+    start = -1
+    in_str = esc = False
+    for i, ch in enumerate(text):
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+            continue
+        if ch == '"':
+            if depth:
+                in_str = True
+        elif ch == "{":
+            if depth == 0:
+                start = i
+            depth += 1
+        elif ch == "}" and depth:
+            depth -= 1
+            if depth == 0:
+                yield text[start:i + 1]
+
+
+def _strip_trailing_commas(text: str) -> str:
+    """Убирает запятые перед } и ] вне строк"""
+    out: List[str] = []
+    in_str = esc = False
+    for ch in text:
+        if in_str:
+            out.append(ch)
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+            continue
+        if ch in "}]":
+            j = len(out) - 1
+            while j >= 0 and out[j].isspace():
+                j -= 1
+            if j >= 0 and out[j] == ",":
+                del out[j]
+        elif ch == '"':
+            in_str = True
+        out.append(ch)
+    return "".join(out)
+
+
+def _ends_in_string(text: str) -> bool:
+    in_str = esc = False
+    for ch in text:
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+    return in_str
+
+
+def _close(prefix: str) -> str:
+    """Достраивает оборванный JSON: закрывает строку, убирает висячие ',' / ':' и закрывает скобки"""
+    stack: List[str] = []
+    in_str = esc = False
+    for ch in prefix:
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch in _CLOSERS:
+            stack.append(_CLOSERS[ch])
+        elif ch in "}]" and stack:
+            stack.pop()
+    out = prefix
+    if in_str:
+        if esc:
+            out = out[:-1]
+        out += '"'
+    out = out.rstrip()
+    if out.endswith(","):
+        out = out[:-1]
+    elif out.endswith(":"):
+        out += " null"
+    return out + "".join(reversed(stack))
+
+
+def _top_level_cuts(text: str) -> List[int]:
+    """Позиции запятых вне строк — точки, до которых можно обрезать обрывок"""
+    cuts: List[int] = []
+    in_str = esc = False
+    for i, ch in enumerate(text):
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch == ",":
+            cuts.append(i)
+    return cuts
+
+
+def _repair(text: str) -> Optional[dict]:
+    start = text.find("{")
+    if start < 0:
+        return None
+    body = _strip_trailing_commas(text[start:])
+    # Оборванную строку лучше выкинуть целиком, чем записать обрезанный текст
+    truncated_str = _ends_in_string(body)
+    if not truncated_str:
+        data = _loads_obj(_close(body))
+        if data is not None:
+            return data
+    # Отрезаем по последним запятым, пока не получится валидный объект
+    for cut in reversed(_top_level_cuts(body)[-MAX_REPAIR_CUTS:]):
+        data = _loads_obj(_close(body[:cut]))
+        if data is not None:
+            return data
+    return _loads_obj(_close(body)) if truncated_str else None
+
+
+def partial_string_field(raw: str, field: str) -> str:
+    """
+    Значение строкового поля из (возможно, недописанного) JSON.
+    Незавершённая escape-последовательность в конце просто отбрасывается.
+    """
+    m = re.search(r'"%s"\s*:\s*"' % re.escape(field), raw)
+    if not m:
+        return ""
+    out: List[str] = []
+    i, n = m.end(), len(raw)
+    while i < n:
+        ch = raw[i]
+        if ch == '"':
+            break
+        if ch != "\\":
+            out.append(ch)
+            i += 1
+            continue
+        if i + 1 >= n:
+            break
+        esc = raw[i + 1]
+        if esc == "u":
+            if i + 6 > n:
+                break
+            try:
+                out.append(chr(int(raw[i + 2:i + 6], 16)))
+            except ValueError:
+                pass
+            i += 6
+            continue
+        out.append(_JSON_ESCAPES.get(esc, esc))
+        i += 2
+    # 💪 и т.п. — склеиваем суррогатные пары, одиночные выкидываем
+    return "".join(out).encode("utf-16", "surrogatepass").decode("utf-16", "ignore")
+
+
+def parse_object(raw: str, required: Tuple[str, ...] = (),
+                 partial_field: Optional[str] = None) -> Tuple[Dict[str, Any], str]:
+    """
+    Достаёт JSON-объект из ответа модели. Возвращает (data, ступень).
+    required — объект годится, если в нём есть хотя бы одно из этих полей.
+    partial_field — строковое поле, которое можно спасти из обрывка на последней ступени.
+    ValueError — если восстановить ничего не удалось (тогда имеет смысл повторный запрос).
+    """
+    text = (raw or "").strip()
+
+    def ok(data: Optional[dict]) -> bool:
+        return data is not None and (not required or any(k in data for k in required))
+
+    data = _loads_obj(text)
+    if ok(data):
+        return data, "strict"
+    for candidate in _balanced_objects(text):
+        data = _loads_obj(candidate) or _loads_obj(_strip_trailing_commas(candidate))
+        if ok(data):
+            return data, "extracted"
+    data = _repair(text)
+    if ok(data):
+        return data, "repaired"
+    if partial_field:
+        value = partial_string_field(text, partial_field).strip()
+        if value:
+            return {partial_field: value}, "partial"
+    raise ValueError("No JSON object could be recovered")
@@ -0,0 +1,201 @@
+"""
+Приоритетный планировщик запросов к LLM
+
+Все вызовы chat completions проходят через один планировщик (живёт в loop
+пула llm_client), поэтому рассылка мотивашек или фоновый парсинг плана
+не отнимают слоты у пользователей, которые ждут ответа в чате.
+
+- Классы приоритета: interactive (чат) > plan (генерация плана) > background.
+  Ожидающие обслуживаются строго по приоритету, внутри класса — по порядку.
+- LLM_CONCURRENCY — сколько запросов выполняется одновременно; background
+  дополнительно ограничен LLM_BACKGROUND_CONCURRENCY, чтобы всегда оставались
+  свободные слоты для интерактива.
+- Token bucket под квоту провайдера: LLM_RPM (запросов в минуту) и LLM_TPM
+  (токенов в минуту, оценка: промпт + max_tokens). 0 — без ограничения.
+- Метрики: глубина очереди, выполняющиеся, время ожидания по классам (stats()).
+"""
+import asyncio
+import bisect
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_PLAN = "plan"
+PRIORITY_BACKGROUND = "background"
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_PLAN, PRIORITY_BACKGROUND)
+_RANK = {p: i for i, p in enumerate(PRIORITIES)}
+
+SLOW_WAIT_LOG_SEC = 1.0
+
+
+class QueueTimeout(RuntimeError):
+    """Запрос не дождался слота за отведённое время (не сетевой таймаут — не повторяем)"""
+
+
+class _Bucket:
+    """Token bucket: rate_per_min токенов в минуту, ёмкость capacity. rate 0 — без ограничения."""
+
+    def __init__(self, rate_per_min: float, capacity: float):
+        self.rate = rate_per_min / 60.0
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if self.rate > 0:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost: float, now: float) -> float:
+        """Сколько секунд ждать, пока хватит токенов (0 — можно сейчас)"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        # Запрос дороже всей ёмкости всё равно пропускаем при полном ведре
+        need = min(cost, self.capacity)
+        return 0.0 if self.tokens >= need else (need - self.tokens) / self.rate
+
+    def take(self, cost: float) -> None:
+        if self.rate > 0:
+            self.tokens -= min(cost, self.capacity)
+
+
+class _Waiter:
+    __slots__ = ("priority", "cost", "future", "enqueued")
+
+    def __init__(self, priority: str, cost: float, future: asyncio.Future, enqueued: float):
+        self.priority = priority
+        self.cost = cost
+        self.future = future
+        self.enqueued = enqueued
+
+
+class LLMScheduler:
+    """Должен использоваться из одного event loop (loop пула llm_client)"""
+
+    def __init__(self, concurrency: int, background_concurrency: int, rpm: float = 0, tpm: float = 0,
+                 rpm_burst: Optional[float] = None, tpm_burst: Optional[float] = None):
+        self.concurrency = max(1, concurrency)
+        self.class_limits = {
+            PRIORITY_INTERACTIVE: self.concurrency,
+            PRIORITY_PLAN: self.concurrency,
+            PRIORITY_BACKGROUND: max(1, min(background_concurrency, self.concurrency)),
+        }
+        self._rpm = _Bucket(rpm, rpm_burst if rpm_burst else max(1.0, rpm / 6.0))
+        self._tpm = _Bucket(tpm, tpm_burst if tpm_burst else max(1.0, tpm / 6.0))
+        self._waiters: List[Tuple[Tuple[int, int], _Waiter]] = []
+        self._seq = itertools.count()
+        self._inflight = 0
+        self._class_inflight = {p: 0 for p in PRIORITIES}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._metrics = {p: {"granted": 0, "timeouts": 0, "wait_total": 0.0, "wait_max": 0.0}
+                         for p in PRIORITIES}
+
+    def _can_run(self, priority: str) -> bool:
+        return (self._inflight < self.concurrency
+                and self._class_inflight[priority] < self.class_limits[priority])
+
+    def _grant(self, w: _Waiter, now: float) -> None:
+        self._rpm.take(1)
+        self._tpm.take(w.cost)
+        self._inflight += 1
+        self._class_inflight[w.priority] += 1
+        waited = now - w.enqueued
+        m = self._metrics[w.priority]
+        m["granted"] += 1
+        m["wait_total"] += waited
+        m["wait_max"] = max(m["wait_max"], waited)
+        if waited >= SLOW_WAIT_LOG_SEC:
+            logging.info(f"llm_scheduler: {w.priority} waited {waited:.1f}s, depth={self.depth()}")
+        w.future.set_result(None)
+
+    def _dispatch(self) -> None:
+        self._timer = None
+        now = time.monotonic()
+        i = 0
+        while i < len(self._waiters):
+            if self._inflight >= self.concurrency:
+                return
+            w = self._waiters[i][1]
+            if w.future.done():
+                del self._waiters[i]
+                continue
+            if not self._can_run(w.priority):
+                # Класс упёрся в свой лимит — пропускаем к следующим классам
+                i += 1
+                continue
+            delay = max(self._rpm.wait_time(1, now), self._tpm.wait_time(w.cost, now))
+            if delay > 0:
+                # Квота: никого не пропускаем вперёд, ждём пополнения
+                if self._timer is None:
+                    self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            del self._waiters[i]
+            self._grant(w, now)
+
+    def _release(self, priority: str) -> None:
+        self._inflight -= 1
+        self._class_inflight[priority] -= 1
+        self._dispatch()
+
+    async def acquire(self, priority: str = PRIORITY_INTERACTIVE, cost: float = 1.0,
+                      timeout: Optional[float] = None) -> None:
+        """Ждёт слот. timeout — сколько максимум стоять в очереди (QueueTimeout)."""
+        if priority not in _RANK:
+            priority = PRIORITY_INTERACTIVE
+        now = time.monotonic()
+        w = _Waiter(priority, cost, asyncio.get_running_loop().create_future(), now)
+        bisect.insort(self._waiters, ((_RANK[priority], next(self._seq)), w), key=lambda e: e[0])
+        self._dispatch()
+        try:
+            if timeout is None:
+                await w.future
+            else:
+                await asyncio.wait_for(w.future, timeout)
+        except BaseException as e:
+            if w.future.done() and not w.future.cancelled():
+                # Слот уже выдан, но ждущий ушёл — возвращаем
+                self._release(priority)
+            else:
+                w.future.cancel()
+                self._dispatch()
+            if isinstance(e, asyncio.TimeoutError):
+                self._metrics[priority]["timeouts"] += 1
+                raise QueueTimeout(f"no LLM slot for '{priority}' within {timeout}s") from None
+            raise
+
+    @asynccontextmanager
+    async def slot(self, priority: str = PRIORITY_INTERACTIVE, cost: float = 1.0,
+                   timeout: Optional[float] = None) -> AsyncIterator[None]:
+        if priority not in _RANK:
+            priority = PRIORITY_INTERACTIVE
+        await self.acquire(priority, cost, timeout)
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+    def depth(self) -> Dict[str, int]:
+        out = {p: 0 for p in PRIORITIES}
+        for _, w in self._waiters:
+            if not w.future.done():
+                out[w.priority] += 1
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        depth = self.depth()
+        classes = {}
+        for p in PRIORITIES:
+            m = self._metrics[p]
+            classes[p] = {
+                "waiting": depth[p],
+                "inflight": self._class_inflight[p],
+                "granted": m["granted"],
+                "timeouts": m["timeouts"],
+                "wait_avg": round(m["wait_total"] / m["granted"], 3) if m["granted"] else 0.0,
+                "wait_max": round(m["wait_max"], 3),
+            }
+        return {"inflight": self._inflight, "concurrency": self.concurrency, "classes": classes}
@@ -15,6 +15,10 @@ os.environ.setdefault("USER_SETTINGS_DB", str(Path(__file__).parent / "local_dat
 local_data_dir = Path(__file__).parent / "local_data"
 local_data_dir.mkdir(exist_ok=True)
 
+# Миграции схем БД — один раз при старте (пути уже взяты из окружения выше)
+import migrations
+migrations.run_all()
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
@@ -57,6 +61,12 @@ except ImportError:
     print("⚠️ Не удалось импортировать goals_api")
     goals_router = None
 
+try:
+    from notes_api import router as notes_router
+except ImportError:
+    print("⚠️ Не удалось импортировать notes_api")
+    notes_router = None
+
 # Создаем FastAPI приложение
 app = FastAPI(
     title="Fitness Tracker Local API",
@@ -98,6 +108,10 @@ if goals_router:
     app.include_router(goals_router)
     print("✅ Подключен goals_api")
 
+if notes_router:
+    app.include_router(notes_router)
+    print("✅ Подключен notes_api")
+
 # Статические файлы - отдаем через FastAPI
 static_dir = Path(__file__).parent
 
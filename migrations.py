@@ -0,0 +1,376 @@
+"""
+Версионированные миграции схем SQLite
+
+Для каждого файла БД — упорядоченный список миграций (version, описание, шаги).
+Шаг — SQL-строка или функция(con). Применённые версии записываются в таблицу
+schema_version того же файла, поэтому каждая миграция выполняется ровно один раз.
+
+Миграции прогоняются при старте процесса (bot.py, local_server.py: run_all()).
+На случай процессов, которые стартуют иначе (внешний API-сервер с роутерами,
+скрипты), db.connect(path, schema=<имя БД>) один раз за процесс проверяет версию
+и догоняет недостающие миграции. В обработчиках запросов DDL больше нет.
+
+Первые версии написаны через IF NOT EXISTS: существующие боевые БД, созданные
+старым кодом, принимают их без изменений и просто получают запись о версии.
+"""
+import os
+import time
+import logging
+import sqlite3
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import note_activity
+
+Step = Union[str, Callable[[sqlite3.Connection], None]]
+Migration = Tuple[int, str, Sequence[Step]]
+
+# Имя БД -> (переменная окружения с путём, путь по умолчанию)
+DATABASES: Dict[str, Tuple[str, str]] = {
+    "tracker": ("TRACKER_DB_PATH", "/data/tracker.db"),
+    "workout_state": ("WORKOUT_STATE_DB", "/data/workout_state.db"),
+    "paywall": ("PAYWALL_DB", "paywall.db"),
+    "access": ("ACCESS_DB", "access.sqlite3"),
+    "partners": ("PARTNERS_DB", "partners.db"),
+    "referrals": ("REFERRALS_DB", "referrals.db"),
+    "reminders": ("REMINDERS_DB", "reminders.db"),
+    "notifications": ("NOTIFICATIONS_DB", "notifications.db"),
+    "user_settings": ("USER_SETTINGS_DB", "user_settings.db"),
+}
+
+
+def _add_column(table: str, column: str, column_type: str) -> Callable[[sqlite3.Connection], None]:
+    """ALTER TABLE ADD COLUMN, если столбца ещё нет (старые БД могли получить его мягкой миграцией)"""
+    def step(con: sqlite3.Connection) -> None:
+        cols = [row[1] for row in con.execute(f"PRAGMA table_info({table})").fetchall()]
+        if column not in cols:
+            con.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+    step.__name__ = f"add_column_{table}_{column}"
+    return step
+
+
+MIGRATIONS: Dict[str, List[Migration]] = {
+    "tracker": [
+        (1, "notes", ["""
+            CREATE TABLE IF NOT EXISTS notes (
+                user_id TEXT NOT NULL,
+                d TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                text TEXT NOT NULL DEFAULT '',
+                updated_at TEXT,
+                PRIMARY KEY (user_id, d, kind)
+            )
+        """]),
+        (2, "user_profile", ["""
+            CREATE TABLE IF NOT EXISTS user_profile (
+              user_id TEXT PRIMARY KEY,
+              height_cm INTEGER,
+              weight_kg REAL,
+              age INTEGER,
+              sex TEXT,
+              goal TEXT,
+              experience TEXT,
+              injuries TEXT,
+              equipment TEXT,
+              schedule TEXT,
+              updated_at TEXT
+            )
+        """]),
+        # Индекс активности по дням + триггеры на notes; заполняется из существующих заметок
+        (3, "note_activity", [note_activity.CREATE_TABLE, *note_activity.TRIGGERS, note_activity.backfill]),
+        # Счётчик изменений заметок по пользователю — для сверки кэша статистики
+        (4, "note_versions", [note_activity.VERSIONS_TABLE, *note_activity.VERSION_TRIGGERS]),
+        # Разобранный план тренировки на день: переразбирается только при смене текста или парсера
+        (5, "parsed_plans", ["""
+            CREATE TABLE IF NOT EXISTS parsed_plans (
+                user_id TEXT NOT NULL,
+                d TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                parser TEXT NOT NULL,
+                exercises TEXT NOT NULL,
+                updated_at TEXT,
+                PRIMARY KEY (user_id, d)
+            ) WITHOUT ROWID
+        """]),
+        # exercise_count: непустые строки считаются так же, как note_activity.from_texts
+        (6, "note_activity.exercise_count", [*note_activity.DROP_TRIGGERS, *note_activity.TRIGGERS,
+                                             note_activity.backfill]),
+    ],
+    "workout_state": [
+        (1, "workout_state", ["""
+            CREATE TABLE IF NOT EXISTS workout_state (
+                user_id TEXT NOT NULL,
+                date TEXT NOT NULL,
+                exercise_name TEXT NOT NULL,
+                set_number INTEGER NOT NULL,
+                weight TEXT,
+                completed INTEGER DEFAULT 0,
+                skipped INTEGER DEFAULT 0,
+                updated_at TEXT,
+                PRIMARY KEY (user_id, date, exercise_name, set_number)
+            )
+        """]),
+        (2, "workout_state.reps", [_add_column("workout_state", "reps", "TEXT")]),
+    ],
+    "paywall": [
+        (1, "users", ["""
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY,
+                msg_count INTEGER NOT NULL DEFAULT 0,
+                paid_until INTEGER NOT NULL DEFAULT 0,
+                pending_payment_id TEXT DEFAULT NULL,
+                pending_created INTEGER NOT NULL DEFAULT 0
+            )
+        """]),
+    ],
+    "access": [
+        (1, "users, promo_uses", [
+            """
+            CREATE TABLE IF NOT EXISTS users(
+                user_id INTEGER PRIMARY KEY,
+                period_start INTEGER NOT NULL,
+                used INTEGER NOT NULL,
+                paid_until INTEGER NOT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS promo_uses(
+                code TEXT PRIMARY KEY,
+                used INTEGER NOT NULL
+            )
+            """,
+        ]),
+    ],
+    "partners": [
+        (1, "partners, partner_promos", [
+            """
+            CREATE TABLE IF NOT EXISTS partners (
+                partner_id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                contact TEXT,
+                created_at INTEGER NOT NULL,
+                is_active INTEGER NOT NULL DEFAULT 1
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS partner_promos (
+                code TEXT PRIMARY KEY,
+                partner_id TEXT NOT NULL,
+                created_at INTEGER NOT NULL,
+                used_at INTEGER,
+                used_by_user_id INTEGER,
+                is_used INTEGER NOT NULL DEFAULT 0,
+                FOREIGN KEY (partner_id) REFERENCES partners(partner_id)
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_partner_promos_code ON partner_promos(code)",
+            "CREATE INDEX IF NOT EXISTS idx_partner_promos_partner ON partner_promos(partner_id)",
+        ]),
+    ],
+    "referrals": [
+        (1, "trainers, promo codes, auth, sessions, profiles", [
+            """
+            CREATE TABLE IF NOT EXISTS trainers (
+                trainer_id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                created_at INTEGER NOT NULL,
+                is_active INTEGER NOT NULL DEFAULT 1
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS promo_codes (
+                code TEXT PRIMARY KEY,
+                trainer_id TEXT NOT NULL,
+                created_at INTEGER NOT NULL,
+                is_active INTEGER NOT NULL DEFAULT 1,
+                FOREIGN KEY (trainer_id) REFERENCES trainers(trainer_id)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS user_referrals (
+                user_id INTEGER PRIMARY KEY,
+                trainer_id TEXT NOT NULL,
+                promo_code TEXT NOT NULL,
+                bound_at INTEGER NOT NULL,
+                FOREIGN KEY (trainer_id) REFERENCES trainers(trainer_id),
+                FOREIGN KEY (promo_code) REFERENCES promo_codes(code)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS paid_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                trainer_id TEXT NOT NULL,
+                amount_rub REAL NOT NULL,
+                paid_at INTEGER NOT NULL,
+                FOREIGN KEY (trainer_id) REFERENCES trainers(trainer_id)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS trainer_price_promos (
+                code TEXT PRIMARY KEY,
+                trainer_id TEXT NOT NULL,
+                amount_rub REAL NOT NULL,
+                created_at INTEGER NOT NULL,
+                is_active INTEGER NOT NULL DEFAULT 1,
+                used_by_user_id INTEGER,
+                used_at INTEGER,
+                FOREIGN KEY (trainer_id) REFERENCES trainers(trainer_id)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS trainer_auth (
+                trainer_id TEXT PRIMARY KEY,
+                login TEXT NOT NULL UNIQUE,
+                password_salt TEXT NOT NULL,
+                password_hash TEXT NOT NULL,
+                created_at INTEGER NOT NULL,
+                updated_at INTEGER NOT NULL,
+                FOREIGN KEY (trainer_id) REFERENCES trainers(trainer_id)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS trainer_sessions (
+                token TEXT PRIMARY KEY,
+                trainer_id TEXT NOT NULL,
+                created_at INTEGER NOT NULL,
+                expires_at INTEGER NOT NULL,
+                FOREIGN KEY (trainer_id) REFERENCES trainers(trainer_id)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS user_profiles (
+                user_id INTEGER PRIMARY KEY,
+                full_name TEXT NOT NULL,
+                username TEXT,
+                trainer_id TEXT,
+                created_at INTEGER NOT NULL,
+                updated_at INTEGER NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_paid_events_trainer_time ON paid_events(trainer_id, paid_at)",
+            "CREATE INDEX IF NOT EXISTS idx_promo_codes_trainer ON promo_codes(trainer_id)",
+            "CREATE INDEX IF NOT EXISTS idx_price_promos_trainer ON trainer_price_promos(trainer_id)",
+            "CREATE INDEX IF NOT EXISTS idx_trainer_auth_login ON trainer_auth(login)",
+        ]),
+        (2, "trainer_auth.password_plain", [_add_column("trainer_auth", "password_plain", "TEXT")]),
+    ],
+    "reminders": [
+        (1, "reminders", [
+            """
+            CREATE TABLE IF NOT EXISTS reminders (
+                reminder_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                reminder_type TEXT NOT NULL,  -- workout, meal, water, custom
+                message TEXT NOT NULL,
+                time_hour INTEGER NOT NULL,   -- час дня (0-23)
+                time_minute INTEGER NOT NULL DEFAULT 0,  -- минута (0-59)
+                days_of_week TEXT,            -- JSON массив дней недели [0,1,2,3,4,5,6] (0=понедельник)
+                is_active INTEGER NOT NULL DEFAULT 1,
+                created_at INTEGER NOT NULL,
+                last_sent INTEGER DEFAULT 0,
+                next_send INTEGER NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_reminders_user ON reminders(user_id)",
+            "CREATE INDEX IF NOT EXISTS idx_reminders_next_send ON reminders(next_send)",
+        ]),
+    ],
+    "notifications": [
+        (1, "notification_settings", [
+            """
+            CREATE TABLE IF NOT EXISTS notification_settings (
+                user_id INTEGER PRIMARY KEY,
+                frequency TEXT NOT NULL DEFAULT '1_per_day',
+                last_sent INTEGER DEFAULT 0,
+                last_sent_date TEXT DEFAULT '',
+                sent_count_today INTEGER DEFAULT 0,
+                updated_at INTEGER NOT NULL DEFAULT 0
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_notif_user ON notification_settings(user_id)",
+        ]),
+    ],
+    "user_settings": [
+        (1, "user_settings", ["""
+            CREATE TABLE IF NOT EXISTS user_settings (
+                user_id INTEGER PRIMARY KEY,
+                preferences TEXT,  -- JSON с предпочтениями
+                goals TEXT,        -- JSON с целями
+                stats TEXT,        -- JSON со статистикой использования
+                updated_at INTEGER NOT NULL DEFAULT 0
+            )
+        """]),
+    ],
+}
+
+
+def db_path(name: str) -> str:
+    """Путь к файлу БД name из окружения"""
+    env, default = DATABASES[name]
+    return (os.getenv(env) or default).strip()
+
+
+def current_version(con: sqlite3.Connection, name: str) -> int:
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            db TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            description TEXT,
+            applied_at INTEGER NOT NULL,
+            PRIMARY KEY (db, version)
+        )
+    """)
+    row = con.execute("SELECT MAX(version) FROM schema_version WHERE db=?", (name,)).fetchone()
+    return int(row[0]) if row and row[0] is not None else 0
+
+
+def migrate(con: sqlite3.Connection, name: str) -> int:
+    """
+    Применяет недостающие миграции БД name. Возвращает итоговую версию.
+    Всё выполняется в одной транзакции BEGIN IMMEDIATE: второй процесс,
+    стартующий параллельно, дождётся её и увидит уже применённые версии.
+    """
+    migrations = MIGRATIONS[name]
+    if con.in_transaction:
+        con.commit()
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        version = current_version(con, name)
+        for target, description, steps in migrations:
+            if target <= version:
+                continue
+            for step in steps:
+                if callable(step):
+                    step(con)
+                else:
+                    con.execute(step)
+            con.execute(
+                "INSERT INTO schema_version (db, version, description, applied_at) VALUES (?, ?, ?, ?)",
+                (name, target, description, int(time.time())),
+            )
+            logging.info(f"migrations: {name} -> v{target} ({description})")
+            version = target
+        con.commit()
+    except BaseException:
+        con.rollback()
+        raise
+    return version
+
+
+def run_all(names: Optional[List[str]] = None) -> Dict[str, int]:
+    """
+    Прогоняет миграции всех (или перечисленных) БД при старте процесса.
+    Ошибка одной БД логируется и не мешает остальным.
+    """
+    import db
+
+    versions: Dict[str, int] = {}
+    for name in names or list(MIGRATIONS):
+        path = db_path(name)
+        try:
+            con = db.connect(path, schema=name)
+            versions[name] = current_version(con, name)
+            con.commit()
+        except Exception as e:
+            logging.exception(f"migrations: failed for {name} ({path}): {e}")
+    return versions
@@ -0,0 +1,204 @@
+"""
+Индекс активности по дням: note_activity в tracker.db
+
+Одна компактная строка на (user_id, d), где есть хоть одна непустая заметка:
+has_workout / has_meals / has_plan, длина записи тренировки и число непустых
+строк в ней (≈ упражнений). Потребители статистики читают индекс диапазоном
+по первичному ключу вместо того, чтобы тянуть и разбирать текст заметок.
+
+Индекс поддерживают триггеры на notes (создаются миграцией tracker v3),
+поэтому он обновляется при любой записи заметки — в том числе внешним
+API-сервером, который пишет в тот же файл. Для существующей БД или после
+восстановления из копии:
+
+    python note_activity.py backfill [--user USER_ID]
+
+Рядом — note_versions: счётчик изменений заметок пользователя (миграция
+tracker v4). Кэш статистики (stats_cache.py) сверяет с ним версию и не
+отдаёт данные, устаревшие после записи из любого процесса.
+"""
+import sys
+import sqlite3
+from typing import Dict, Optional
+
+# Те же пробельные символы, что снимает str.strip() для ASCII
+_WS = "char(32, 9, 10, 11, 12, 13)"
+_NL = "char(10)"
+# Пробельные символы для from_texts — те же, что в SQL (_WS), без юникодных пробелов
+WS_CHARS = " \t\n\v\f\r"
+
+COLUMNS = ("user_id", "d", "has_workout", "has_meals", "has_plan", "workout_chars", "exercise_count")
+
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS note_activity (
+        user_id TEXT NOT NULL,
+        d TEXT NOT NULL,
+        has_workout INTEGER NOT NULL DEFAULT 0,
+        has_meals INTEGER NOT NULL DEFAULT 0,
+        has_plan INTEGER NOT NULL DEFAULT 0,
+        workout_chars INTEGER NOT NULL DEFAULT 0,
+        exercise_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, d)
+    ) WITHOUT ROWID
+"""
+
+
+def _line_count(expr: str) -> str:
+    """
+    SQL: число непустых строк в уже обрезанном тексте — как count_lines():
+    строки делятся по char(10), строка из одних пробельных символов не считается
+    """
+    # Пробелы внутри строк на подсчёт не влияют — убираем их, пустые строки становятся
+    # переводами строк подряд. Серию переводов строк считаем за один разделитель:
+    # \n -> char(1)char(2), внутренние char(2)char(1) удаляем. Свои char(1)/char(2)
+    # в тексте заранее меняем на 'x' — непробельный символ на непробельный.
+    x = f"replace(replace({expr}, char(1), 'x'), char(2), 'x')"
+    for code in (32, 9, 11, 12, 13):
+        x = f"replace({x}, char({code}), '')"
+    x = f"replace(replace({x}, {_NL}, char(1) || char(2)), char(2) || char(1), '')"
+    return (f"CASE WHEN {expr} = '' THEN 0 "
+            f"ELSE length({x}) - length(replace({x}, char(1), '')) + 1 END")
+
+
+def count_lines(text: str) -> int:
+    """Число непустых строк записи (≈ упражнений) — то же, что считают триггеры"""
+    return sum(1 for line in text.split("\n") if line.strip(WS_CHARS))
+
+
+def _select(where: str) -> str:
+    """Агрегат активности из notes для строк, подходящих под where"""
+    trimmed = f"trim(text, {_WS})"
+    return f"""
+        SELECT user_id, d,
+            MAX(kind = 'workouts' AND {trimmed} != '') AS has_workout,
+            MAX(kind = 'meals' AND {trimmed} != '') AS has_meals,
+            MAX(kind = 'plan' AND {trimmed} != '') AS has_plan,
+            SUM(CASE WHEN kind = 'workouts' THEN length({trimmed}) ELSE 0 END),
+            SUM(CASE WHEN kind = 'workouts' THEN {_line_count(trimmed)} ELSE 0 END)
+        FROM notes
+        WHERE {where}
+        GROUP BY user_id, d
+        HAVING has_workout OR has_meals OR has_plan
+    """
+
+
+def _refresh(ref: str) -> str:
+    """Тело триггера: пересчёт строки индекса для ключа ref (NEW/OLD)"""
+    where = f"user_id = {ref}.user_id AND d = {ref}.d"
+    return (f"DELETE FROM note_activity WHERE {where};\n"
+            f"INSERT INTO note_activity ({', '.join(COLUMNS)}) {_select(where)};")
+
+
+TRIGGERS = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS notes_activity_insert AFTER INSERT ON notes BEGIN
+        {_refresh("NEW")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS notes_activity_update AFTER UPDATE OF user_id, d, kind, text ON notes BEGIN
+        {_refresh("OLD")}
+        {_refresh("NEW")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS notes_activity_delete AFTER DELETE ON notes BEGIN
+        {_refresh("OLD")}
+    END
+    """,
+)
+
+
+# Пересоздание триггеров индекса после смены их SQL (миграция tracker v6)
+DROP_TRIGGERS = tuple(
+    f"DROP TRIGGER IF EXISTS notes_activity_{op}" for op in ("insert", "update", "delete")
+)
+
+
+VERSIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS note_versions (
+        user_id TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+"""
+
+
+def _bump(ref: str) -> str:
+    return (f"INSERT INTO note_versions (user_id, version) VALUES ({ref}.user_id, 1) "
+            f"ON CONFLICT(user_id) DO UPDATE SET version = version + 1;")
+
+
+VERSION_TRIGGERS = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS notes_version_insert AFTER INSERT ON notes BEGIN
+        {_bump("NEW")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS notes_version_update AFTER UPDATE OF user_id, d, kind, text ON notes BEGIN
+        {_bump("OLD")}
+        {_bump("NEW")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS notes_version_delete AFTER DELETE ON notes BEGIN
+        {_bump("OLD")}
+    END
+    """,
+)
+
+
+def read_version(conn: sqlite3.Connection, user_id: str) -> int:
+    """Текущая версия заметок пользователя (0 — ещё не было ни одной записи)"""
+    row = conn.execute("SELECT version FROM note_versions WHERE user_id=?", (str(user_id),)).fetchone()
+    return int(row[0]) if row else 0
+
+
+def backfill(conn: sqlite3.Connection, user_id: Optional[str] = None) -> int:
+    """Пересобирает индекс из notes (целиком или для одного пользователя). Возвращает число строк."""
+    if user_id is None:
+        conn.execute("DELETE FROM note_activity")
+        conn.execute(f"INSERT INTO note_activity ({', '.join(COLUMNS)}) {_select('1')}")
+        row = conn.execute("SELECT COUNT(*) FROM note_activity").fetchone()
+    else:
+        conn.execute("DELETE FROM note_activity WHERE user_id=?", (str(user_id),))
+        conn.execute(f"INSERT INTO note_activity ({', '.join(COLUMNS)}) {_select('user_id = ?')}", (str(user_id),))
+        row = conn.execute("SELECT COUNT(*) FROM note_activity WHERE user_id=?", (str(user_id),)).fetchone()
+    return int(row[0])
+
+
+def from_texts(day: Dict[str, str]) -> Dict[str, int]:
+    """Та же активность, посчитанная по текстам {kind: text} (для API без /api/notes/activity)"""
+    workout = (day.get("workouts") or "").strip(WS_CHARS)
+    return {
+        "has_workout": int(bool(workout)),
+        "has_meals": int(bool((day.get("meals") or "").strip(WS_CHARS))),
+        "has_plan": int(bool((day.get("plan") or "").strip(WS_CHARS))),
+        "workout_chars": len(workout),
+        "exercise_count": count_lines(workout),
+    }
+
+
+def main(argv: list) -> int:
+    import argparse
+    import db
+    import migrations
+
+    parser = argparse.ArgumentParser(description="Индекс активности по дням (note_activity)")
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--user", help="пересобрать только для одного user_id")
+    args = parser.parse_args(argv)
+
+    path = migrations.db_path("tracker")
+    conn = db.connect(path, schema="tracker")
+    try:
+        rows = backfill(conn, args.user)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"note_activity: {rows} rows in {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
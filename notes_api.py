@@ -0,0 +1,174 @@
+"""
+API endpoints для пакетной работы с заметками (notes)
+Дополняют базовые GET/PUT /api/notes: пакетное чтение и атомарное дописывание
+"""
+import os, sqlite3
+from datetime import date, timedelta
+from fastapi import APIRouter, Header, HTTPException, Query
+from typing import Dict, List, Optional
+from pydantic import BaseModel
+
+import db
+import note_activity
+
+DB_PATH = (os.getenv("TRACKER_DB_PATH") or "/data/tracker.db").strip()
+ALLOWED_KINDS = {"workouts", "meals", "plan"}
+MAX_BATCH_DAYS = 400
+
+router = APIRouter()
+
+def _db():
+    # Схема ведётся миграциями (migrations.py); соединение потока — долгоживущее (db.py)
+    return db.connect(DB_PATH, schema="tracker")
+
+def _need_user(x_user_id: str | None):
+    uid = (x_user_id or "").strip()
+    if not uid:
+        raise HTTPException(status_code=422, detail="Missing X-User-Id header")
+    return uid
+
+def _parse_kinds(kinds: str) -> List[str]:
+    out = [k.strip() for k in (kinds or "").split(",") if k.strip()]
+    bad = [k for k in out if k not in ALLOWED_KINDS]
+    if bad or not out:
+        raise HTTPException(status_code=400, detail=f"kinds must be a subset of {sorted(ALLOWED_KINDS)}")
+    return out
+
+def _parse_day(value: str, field: str) -> date:
+    try:
+        return date.fromisoformat(value.strip())
+    except (AttributeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"{field} must be YYYY-MM-DD")
+
+def append_note(conn: sqlite3.Connection, user_id: str, d: str, kind: str, chunk: str, sep: str = "\n\n") -> None:
+    """
+    Атомарно дописывает chunk к заметке одним UPSERT (без чтения текста в Python).
+    Семантика как у старого read-modify-write: rstrip(текущий) + sep + chunk.
+    """
+    conn.execute("""
+        INSERT INTO notes (user_id, d, kind, text, updated_at)
+        VALUES (?, ?, ?, ?, datetime('now'))
+        ON CONFLICT(user_id, d, kind) DO UPDATE SET
+            text = CASE
+                WHEN trim(notes.text, char(32, 9, 10, 13)) = '' THEN excluded.text
+                ELSE rtrim(notes.text, char(32, 9, 10, 13)) || ? || excluded.text
+            END,
+            updated_at = excluded.updated_at
+    """, (user_id, d, kind, chunk, sep))
+
+def read_notes(conn: sqlite3.Connection, user_id: str, kinds: List[str],
+               d_from: str, d_to: str) -> Dict[str, Dict[str, str]]:
+    """Читает заметки пользователя за диапазон дат одним запросом: {d: {kind: text}}"""
+    placeholders = ",".join("?" * len(kinds))
+    rows = conn.execute(
+        f"SELECT d, kind, text FROM notes WHERE user_id=? AND d>=? AND d<=? AND kind IN ({placeholders}) ORDER BY d",
+        (user_id, d_from, d_to, *kinds),
+    ).fetchall()
+    out: Dict[str, Dict[str, str]] = {}
+    for d, kind, text in rows:
+        out.setdefault(d, {})[kind] = text or ""
+    return out
+
+@router.get("/api/notes/batch")
+def get_notes_batch(
+    kinds: str = Query("workouts,meals,plan", description="Список kind через запятую"),
+    d: Optional[str] = Query(None, description="Один день (YYYY-MM-DD)"),
+    d_from: Optional[str] = Query(None, alias="from", description="Начало диапазона"),
+    d_to: Optional[str] = Query(None, alias="to", description="Конец диапазона (включительно)"),
+    x_user_id: str | None = Header(default=None, alias="X-User-Id"),
+):
+    """Возвращает несколько kind и/или несколько дат за один запрос"""
+    uid = _need_user(x_user_id)
+    kind_list = _parse_kinds(kinds)
+
+    if d:
+        start = end = _parse_day(d, "d")
+    elif d_from and d_to:
+        start, end = _parse_day(d_from, "from"), _parse_day(d_to, "to")
+    else:
+        raise HTTPException(status_code=400, detail="either d or from+to is required")
+    if end < start:
+        raise HTTPException(status_code=400, detail="to must not be before from")
+    if (end - start).days + 1 > MAX_BATCH_DAYS:
+        raise HTTPException(status_code=400, detail=f"range is limited to {MAX_BATCH_DAYS} days")
+
+    conn = _db()
+    try:
+        found = read_notes(conn, uid, kind_list, start.isoformat(), end.isoformat())
+    finally:
+        conn.close()
+
+    # Полная сетка дат: отсутствующие заметки — пустые строки, как у GET /api/notes
+    days = {}
+    cur = start
+    while cur <= end:
+        key = cur.isoformat()
+        row = found.get(key, {})
+        days[key] = {k: row.get(k, "") for k in kind_list}
+        cur += timedelta(days=1)
+
+    return {"from": start.isoformat(), "to": end.isoformat(), "kinds": kind_list, "days": days}
+
+
+def read_activity(conn: sqlite3.Connection, user_id: str, d_from: str, d_to: str) -> Dict[str, Dict[str, int]]:
+    """Активные дни пользователя за диапазон из индекса note_activity: {d: {has_workout, ...}}"""
+    rows = conn.execute(
+        "SELECT d, has_workout, has_meals, has_plan, workout_chars, exercise_count "
+        "FROM note_activity WHERE user_id=? AND d>=? AND d<=? ORDER BY d",
+        (user_id, d_from, d_to),
+    ).fetchall()
+    return {
+        d: {"has_workout": hw, "has_meals": hm, "has_plan": hp, "workout_chars": wc, "exercise_count": ec}
+        for d, hw, hm, hp, wc, ec in rows
+    }
+
+@router.get("/api/notes/activity")
+def get_notes_activity(
+    d_from: str = Query(..., alias="from", description="Начало диапазона"),
+    d_to: str = Query(..., alias="to", description="Конец диапазона (включительно)"),
+    x_user_id: str | None = Header(default=None, alias="X-User-Id"),
+):
+    """Только дни с активностью (без текста заметок) — для статистики и серий"""
+    uid = _need_user(x_user_id)
+    start, end = _parse_day(d_from, "from"), _parse_day(d_to, "to")
+    if end < start:
+        raise HTTPException(status_code=400, detail="to must not be before from")
+
+    conn = _db()
+    try:
+        # Версию читаем до дней: если между запросами была запись, дни окажутся новее версии,
+        # и клиентский кэш просто перечитает их на следующем обращении
+        version = note_activity.read_version(conn, uid)
+        days = read_activity(conn, uid, start.isoformat(), end.isoformat())
+    finally:
+        conn.close()
+    return {"from": start.isoformat(), "to": end.isoformat(), "days": days, "version": version}
+
+
+class NoteAppend(BaseModel):
+    text: str
+    sep: str = "\n\n"
+
+@router.post("/api/notes/append")
+def post_note_append(
+    payload: NoteAppend,
+    d: str = Query(..., description="День (YYYY-MM-DD)"),
+    kind: str = Query(..., description="workouts | meals | plan"),
+    x_user_id: str | None = Header(default=None, alias="X-User-Id"),
+):
+    """Дописывает текст к заметке на сервере (O(chunk), без потерь при параллельных записях)"""
+    uid = _need_user(x_user_id)
+    day = _parse_day(d, "d").isoformat()
+    if kind not in ALLOWED_KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of {sorted(ALLOWED_KINDS)}")
+    chunk = (payload.text or "").strip()
+    if not chunk:
+        return {"success": True}
+
+    conn = _db()
+    try:
+        append_note(conn, uid, day, kind, chunk, payload.sep)
+        conn.commit()
+    finally:
+        conn.close()
+    return {"success": True}
@@ -0,0 +1,196 @@
+"""
+Клиент к API заметок (/api/notes) поверх общего keep-alive пула.
+Используется tracker_agent, motivation_messages, stats и stats_enhanced.
+Запись заметок через клиент сбрасывает кэш статистики пользователя (stats_cache).
+"""
+import asyncio
+import json
+import os
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlencode
+
+import aiohttp
+
+import note_activity
+import stats_cache
+from http_pool import HttpPool, env_int
+
+API_BASE_URL = (os.getenv("API_BASE_URL") or "http://api:8000").strip().rstrip("/")
+
+_pool = HttpPool(
+    "notes",
+    limit=env_int("NOTES_API_POOL_LIMIT", 100),
+    limit_per_host=env_int("NOTES_API_POOL_PER_HOST", 50),
+    concurrency=env_int("NOTES_API_CONCURRENCY", 64),
+)
+
+
+async def _request(session: aiohttp.ClientSession, method: str, path: str, user_id: int,
+                   body: Optional[dict], timeout: float) -> dict:
+    headers = {"X-User-Id": str(user_id)}
+    data = None
+    if body is not None:
+        data = json.dumps(body).encode("utf-8")
+        headers["Content-Type"] = "application/json"
+    async with session.request(method, f"{API_BASE_URL}{path}", data=data, headers=headers,
+                               timeout=aiohttp.ClientTimeout(total=timeout)) as r:
+        r.raise_for_status()
+        raw = await r.text()
+        return json.loads(raw) if raw else {}
+
+
+def _after_write(method: str, path: str, user_id: int) -> None:
+    if method.upper() != "GET" and path.startswith("/api/notes"):
+        stats_cache.invalidate(user_id)
+
+
+async def api_req(method: str, path: str, user_id: int, body: Optional[dict] = None, timeout: float = 10) -> dict:
+    """Запрос к API заметок (async). Ошибки HTTP пробрасываются."""
+    try:
+        return await _pool.call(_request, method, path, user_id, body, timeout)
+    finally:
+        _after_write(method, path, user_id)
+
+
+def api_req_sync(method: str, path: str, user_id: int, body: Optional[dict] = None, timeout: float = 10) -> dict:
+    """То же самое для синхронного кода (через тот же пул соединений)"""
+    try:
+        return _pool.call_sync(_request, method, path, user_id, body, timeout)
+    finally:
+        _after_write(method, path, user_id)
+
+
+def _date_range(d_from: str, d_to: str) -> List[str]:
+    start, end = date.fromisoformat(d_from), date.fromisoformat(d_to)
+    return [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+
+
+async def _get_notes(session: aiohttp.ClientSession, user_id: int, kinds: List[str],
+                     d_from: str, d_to: str, timeout: float) -> Dict[str, Dict[str, str]]:
+    query = urlencode({"kinds": ",".join(kinds), "from": d_from, "to": d_to})
+    try:
+        j = await _request(session, "GET", f"/api/notes/batch?{query}", user_id, None, timeout)
+        return j.get("days") or {}
+    except aiohttp.ClientResponseError as e:
+        if e.status not in (404, 405):
+            raise
+
+    # API без /api/notes/batch: по запросу на (день, kind), но параллельно
+    pairs = [(d, k) for d in _date_range(d_from, d_to) for k in kinds]
+    results = await asyncio.gather(
+        *(_request(session, "GET", f"/api/notes?d={d}&kind={k}", user_id, None, timeout) for d, k in pairs),
+        return_exceptions=True,
+    )
+    days: Dict[str, Dict[str, str]] = {}
+    for (d, k), j in zip(pairs, results):
+        text = "" if isinstance(j, BaseException) else (j.get("text") or "")
+        days.setdefault(d, {})[k] = text
+    return days
+
+
+def _range_args(d: Optional[str], d_from: Optional[str], d_to: Optional[str]):
+    if d:
+        return d, d
+    if not (d_from and d_to):
+        raise ValueError("either d or d_from+d_to is required")
+    return d_from, d_to
+
+
+async def get_notes(user_id: int, kinds: Iterable[str], d: Optional[str] = None,
+                    d_from: Optional[str] = None, d_to: Optional[str] = None,
+                    timeout: float = 10) -> Dict[str, Dict[str, str]]:
+    """
+    Пакетное чтение заметок: несколько kind и/или диапазон дат за один запрос.
+    Возвращает {d: {kind: text}} с полной сеткой дат.
+    """
+    start, end = _range_args(d, d_from, d_to)
+    return await _pool.call(_get_notes, user_id, list(kinds), start, end, timeout)
+
+
+def get_notes_sync(user_id: int, kinds: Iterable[str], d: Optional[str] = None,
+                   d_from: Optional[str] = None, d_to: Optional[str] = None,
+                   timeout: float = 10) -> Dict[str, Dict[str, str]]:
+    """То же самое для синхронного кода"""
+    start, end = _range_args(d, d_from, d_to)
+    return _pool.call_sync(_get_notes, user_id, list(kinds), start, end, timeout)
+
+
+def _version(j: dict) -> Optional[int]:
+    version = j.get("version")
+    return int(version) if version is not None else None
+
+
+async def _get_activity_versioned(session: aiohttp.ClientSession, user_id: int, d_from: str, d_to: str,
+                                  timeout: float) -> Tuple[Dict[str, Dict[str, int]], Optional[int]]:
+    query = urlencode({"from": d_from, "to": d_to})
+    try:
+        j = await _request(session, "GET", f"/api/notes/activity?{query}", user_id, None, timeout)
+        return j.get("days") or {}, _version(j)
+    except aiohttp.ClientResponseError as e:
+        if e.status not in (404, 405):
+            raise
+
+    # API без индекса активности: считаем по текстам заметок (версии нет)
+    notes = await _get_notes(session, user_id, ["workouts", "meals", "plan"], d_from, d_to, timeout)
+    days = {d: note_activity.from_texts(kinds) for d, kinds in notes.items()}
+    return {d: a for d, a in days.items() if a["has_workout"] or a["has_meals"] or a["has_plan"]}, None
+
+
+async def _get_activity(session: aiohttp.ClientSession, user_id: int, d_from: str, d_to: str,
+                        timeout: float) -> Dict[str, Dict[str, int]]:
+    days, _ = await _get_activity_versioned(session, user_id, d_from, d_to, timeout)
+    return days
+
+
+async def get_activity(user_id: int, d: Optional[str] = None, d_from: Optional[str] = None,
+                       d_to: Optional[str] = None, timeout: float = 10) -> Dict[str, Dict[str, int]]:
+    """
+    Активность по дням без текста заметок: {d: {has_workout, has_meals, has_plan,
+    workout_chars, exercise_count}}. В ответе только дни, где что-то записано.
+    """
+    start, end = _range_args(d, d_from, d_to)
+    return await _pool.call(_get_activity, user_id, start, end, timeout)
+
+
+def get_activity_sync(user_id: int, d: Optional[str] = None, d_from: Optional[str] = None,
+                      d_to: Optional[str] = None, timeout: float = 10) -> Dict[str, Dict[str, int]]:
+    """То же самое для синхронного кода"""
+    start, end = _range_args(d, d_from, d_to)
+    return _pool.call_sync(_get_activity, user_id, start, end, timeout)
+
+
+def get_activity_versioned_sync(user_id: int, d_from: str, d_to: str,
+                                timeout: float = 10) -> Tuple[Dict[str, Dict[str, int]], Optional[int]]:
+    """То же, что get_activity_sync, плюс версия заметок из того же ответа (None — API её не отдаёт)"""
+    return _pool.call_sync(_get_activity_versioned, user_id, d_from, d_to, timeout)
+
+
+async def _get_version(session: aiohttp.ClientSession, user_id: int, timeout: float) -> Optional[int]:
+    today = date.today().isoformat()
+    query = urlencode({"from": today, "to": today})
+    try:
+        j = await _request(session, "GET", f"/api/notes/activity?{query}", user_id, None, timeout)
+    except aiohttp.ClientResponseError as e:
+        if e.status in (404, 405):
+            return None
+        raise
+    return _version(j)
+
+
+def get_version_sync(user_id: int, timeout: float = 5) -> Optional[int]:
+    """
+    Версия заметок пользователя из note_versions (растёт при каждой записи).
+    None — API старый и версию не отдаёт.
+    """
+    return _pool.call_sync(_get_version, user_id, timeout)
+
+
+async def append_note(user_id: int, d: str, kind: str, chunk: str, timeout: float = 10) -> None:
+    """Серверное дописывание к заметке (POST /api/notes/append)"""
+    path = f"/api/notes/append?{urlencode({'d': d, 'kind': kind})}"
+    await api_req("POST", path, user_id=user_id, body={"text": chunk}, timeout=timeout)
+
+
+def close() -> None:
+    _pool.close()
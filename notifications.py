@@ -3,12 +3,13 @@
 """
 import os
 import json
-import sqlite3
 import time
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Dict, Any, List, Tuple
 from pathlib import Path
 
+import db
+
 DB_PATH = os.getenv("NOTIFICATIONS_DB", "notifications.db")
 
 # Частоты уведомлений
@@ -25,23 +26,8 @@ FREQUENCY_OPTIONS = {
 }
 
 def _connect():
-    con = sqlite3.connect(DB_PATH, check_same_thread=False)
-    con.execute("PRAGMA journal_mode=WAL;")
-    con.execute("""
-        CREATE TABLE IF NOT EXISTS notification_settings (
-            user_id INTEGER PRIMARY KEY,
-            frequency TEXT NOT NULL DEFAULT '1_per_day',
-            last_sent INTEGER DEFAULT 0,
-            last_sent_date TEXT DEFAULT '',
-            sent_count_today INTEGER DEFAULT 0,
-            updated_at INTEGER NOT NULL DEFAULT 0
-        )
-    """)
-    con.execute("""
-        CREATE INDEX IF NOT EXISTS idx_notif_user ON notification_settings(user_id)
-    """)
-    con.commit()
-    return con
+    # Схема ведётся миграциями (migrations.py); соединение потока — долгоживущее (db.py)
+    return db.connect(DB_PATH, schema="notifications")
 
 def _now() -> int:
     return int(time.time())
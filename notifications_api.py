@@ -6,6 +6,8 @@ from fastapi import APIRouter, Header, HTTPException
 from typing import Dict, Any
 from pydantic import BaseModel
 
+import db
+
 # Импортируем notifications модуль
 # Если модуль не найден, используем fallback
 try:
@@ -67,7 +69,7 @@ class NotificationSettingsRequest(BaseModel):
 async def get_notification_settings(x_user_id: str = Header(None, alias="X-User-Id")):
     """Получает настройки уведомлений пользователя"""
     user_id = _need_user(x_user_id)
-    settings = get_settings(user_id)
+    settings = await db.run("notifications", get_settings, user_id)
     return {
         "frequency": settings["frequency"],
         "frequency_label": settings["frequency_label"],
@@ -87,11 +89,11 @@ async def update_notification_settings(
 ):
     """Обновляет настройки уведомлений пользователя"""
     user_id = _need_user(x_user_id)
-    success = set_frequency(user_id, request.frequency)
+    success = await db.run("notifications", set_frequency, user_id, request.frequency)
     if not success:
         raise HTTPException(status_code=400, detail="Invalid frequency value")
     
-    settings = get_settings(user_id)
+    settings = await db.run("notifications", get_settings, user_id)
     return {
         "frequency": settings["frequency"],
         "frequency_label": settings["frequency_label"],
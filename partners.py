@@ -2,54 +2,20 @@
 Партнерская программа для фитнес-клубов
 """
 import os
-import sqlite3
 import time
 import secrets
 import string
 from typing import Optional, Tuple, List, Dict
 from pathlib import Path
 
+import db
+
 DB_PATH = os.getenv("PARTNERS_DB", "partners.db")
 PARTNER_TRIAL_DAYS = int(os.getenv("PARTNER_TRIAL_DAYS", "7"))  # 7 дней тестового периода
 
 def _connect():
-    con = sqlite3.connect(DB_PATH)
-    con.execute("PRAGMA journal_mode=WAL;")
-    
-    # Таблица партнеров (фитнес-клубы)
-    con.execute("""
-    CREATE TABLE IF NOT EXISTS partners (
-        partner_id TEXT PRIMARY KEY,
-        name TEXT NOT NULL,
-        contact TEXT,
-        created_at INTEGER NOT NULL,
-        is_active INTEGER NOT NULL DEFAULT 1
-    )
-    """)
-    
-    # Таблица промокодов партнеров
-    con.execute("""
-    CREATE TABLE IF NOT EXISTS partner_promos (
-        code TEXT PRIMARY KEY,
-        partner_id TEXT NOT NULL,
-        created_at INTEGER NOT NULL,
-        used_at INTEGER,
-        used_by_user_id INTEGER,
-        is_used INTEGER NOT NULL DEFAULT 0,
-        FOREIGN KEY (partner_id) REFERENCES partners(partner_id)
-    )
-    """)
-    
-    # Индекс для быстрого поиска
-    con.execute("""
-    CREATE INDEX IF NOT EXISTS idx_partner_promos_code ON partner_promos(code)
-    """)
-    con.execute("""
-    CREATE INDEX IF NOT EXISTS idx_partner_promos_partner ON partner_promos(partner_id)
-    """)
-    
-    con.commit()
-    return con
+    # Схема ведётся миграциями (migrations.py); соединение потока — долгоживущее (db.py)
+    return db.connect(DB_PATH, schema="partners")
 
 def _now() -> int:
     return int(time.time())
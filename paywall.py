@@ -7,6 +7,8 @@ from typing import Optional, Tuple
 
 import aiohttp
 
+import db
+
 PAY_PRICE_RUB = os.getenv("PAY_PRICE_RUB", "1490.00").strip()
 PAY_FREE_LIMIT = int(os.getenv("PAY_FREE_LIMIT", "15").strip())
 PAY_SUB_DAYS = int(os.getenv("PAY_SUB_DAYS", "30").strip())
@@ -21,23 +23,9 @@ API_BASE = "https://api.yookassa.ru/v3"
 class PaywallError(RuntimeError):
     pass
 
-_conn: Optional[sqlite3.Connection] = None
-
 def _db() -> sqlite3.Connection:
-    global _conn
-    if _conn is None:
-        _conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-        _conn.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY,
-            msg_count INTEGER NOT NULL DEFAULT 0,
-            paid_until INTEGER NOT NULL DEFAULT 0,
-            pending_payment_id TEXT DEFAULT NULL,
-            pending_created INTEGER NOT NULL DEFAULT 0
-        )
-        """)
-        _conn.commit()
-    return _conn
+    # Схема ведётся миграциями (migrations.py); соединение потока — долгоживущее (db.py)
+    return db.connect(DB_PATH, schema="paywall")
 
 def _now_ts() -> int:
     return int(time.time())
@@ -0,0 +1,430 @@
+"""
+Разбор текстовых планов и записей тренировок — общий движок
+
+Один модуль вместо трёх построчных парсеров:
+  - parse_plan()     — план на день для /api/workout-plan/today (workout_plan_api);
+  - parse_simple()   — запасной разбор workout_parser, когда ИИ недоступен;
+  - parse_log_line() — строка журнала тренировок для workout_insights.
+
+Все регулярные выражения скомпилированы один раз при импорте. Каждая строка
+один раз проходит через tokenize(): очистка маркеров, нижний регистр и признаки
+("есть цифры", "есть кг", "есть подход", двоеточие). Дорогие шаблоны запускаются
+только если по признакам могут совпасть, и каждый — не больше одного раза на строку.
+
+Результаты совпадают с прежними парсерами символ в символ. Имена упражнений —
+ключи сохранённого состояния подходов в workout_state, поэтому их менять нельзя.
+Проверка и замер скорости: python plan_parser_bench.py check
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+
+@dataclass(slots=True)
+class SetEntry:
+    """Подход: номер, повторения, вес; info/rpe/rest_sec — для планов"""
+    number: int = 1
+    reps: Any = ""
+    weight_kg: Any = None
+    info: str = ""
+    rpe: str = ""
+    rest_sec: Optional[int] = None
+
+    def plan_dict(self) -> Dict:
+        return {'number': self.number, 'info': self.info, 'reps': self.reps, 'weight_kg': self.weight_kg}
+
+    def simple_dict(self) -> Dict:
+        return {"number": self.number, "reps": self.reps, "weight_kg": self.weight_kg,
+                "rpe": self.rpe, "rest_sec": self.rest_sec}
+
+
+@dataclass(slots=True)
+class ExerciseEntry:
+    name: str
+    sets: List[SetEntry] = field(default_factory=list)
+
+
+# === Шаблоны ===
+
+_I = re.IGNORECASE
+
+# Маркер списка / эмодзи в начале строки (один символ), затем нумерация "1." / "1)"
+_PREFIX_PLAN = re.compile(r'^(?:[🗓️📝•\-\*🏋️🍽️]\s*)?(?:\d+[\.\)]\s*)?')
+_PREFIX_SIMPLE = re.compile(r'^(?:[🗓️📝•\-\*🏋️🍽️🔥💪]\s*)?(?:\d+[\.\)]\s*)?')
+_DASH = re.compile(r'^-\s*')
+_DIGIT = re.compile(r'\d')
+
+
+def _sections(*names: str) -> "re.Pattern":
+    """Заголовки разделов, которые пропускаем: одна проверка вместо цикла по подстрокам"""
+    return re.compile('|'.join(re.escape(name) for name in names))
+
+
+_SKIP_PLAN = _sections('разминка', 'разогрев', 'заминка', 'основная часть', 'основная', 'warm-up', 'cool-down')
+_SKIP_SIMPLE = _sections('разминка', 'разогрев', 'заминка', 'основная часть', 'warm-up', 'cool-down',
+                         'правило прогрессии')
+
+_COLON = re.compile(r'^(.+?):\s*(.+)')
+# "Жим лежа 3 подхода по 50 повторений"
+_NAME_SETS_REPS = re.compile(r'^(.+?)\s+(\d+)\s*подход[а-я]*\s*(?:по\s*)?(.+)$', _I)
+# "100 отжиманий по 3 подхода"
+_REPS_NAME_SETS = re.compile(r'^(\d+)\s+(.+?)\s+по\s+(\d+)\s*подход[а-я]*$', _I)
+# "20 приседаний"
+_REPS_NAME = re.compile(r'^(\d+)\s+([^\d]+)$')
+# "4х8-10 60кг" (группа 2 — повторения вместе с весом, если он идёт сразу за ними)
+_SETS_X = re.compile(r'(\d+)\s*[хx]\s*([\d\-до\s]+(?:[\s,]+)?\d+\s*кг)?', _I)
+_SETS_X_REPS = re.compile(r'(\d+)\s*[хx]\s*([\d\-до\s]+)', _I)
+# "4 подхода по 10-12"
+_SETS_APPROACH = re.compile(r'(\d+)\s*подход[а-я]*\s*(?:по\s*)?([\d\-до\s]+)', _I)
+# "1 подход - 60кг" / "2 подход: 8-10 повторений"
+_SET_LINE = re.compile(r'(\d+)\s*подход[а-я]*\s*[:\-]\s*(.+)', _I)
+
+_WEIGHT_WITH = re.compile(r'(?:с\s+)?весом\s+(\d+(?:[.,]\d+)?)\s*кг', _I)
+_WEIGHT_ANY = re.compile(r'[,\s]+(\d+(?:[.,]\d+)?)\s*кг|^(\d+(?:[.,]\d+)?)\s*кг|(\d+(?:[.,]\d+)?)\s*кг', _I)
+_WEIGHT_WITH_OR_ANY = re.compile(r'(?:с\s+)?весом\s+(\d+(?:[.,]\d+)?)\s*кг|(\d+(?:[.,]\d+)?)\s*кг', _I)
+_WEIGHT_INT = re.compile(r'(\d+)\s*кг', _I)
+_STRIP_WEIGHT = re.compile(r'(?:с\s+)?весом\s+\d+(?:[.,]\d+)?\s*кг|,\s*\d+(?:[.,]\d+)?\s*кг|\d+(?:[.,]\d+)?\s*кг', _I)
+_STRIP_WEIGHT_NO_COMMA = re.compile(r'(?:с\s+)?весом\s+\d+(?:[.,]\d+)?\s*кг|\d+(?:[.,]\d+)?\s*кг', _I)
+_STRIP_WEIGHT_INT = re.compile(r'\s*\d+\s*кг', _I)
+_EDGE_COMMAS = re.compile(r'^,\s*|,\s*$')
+_REPS_WORD = re.compile(r'\s*повторени[яй]?\s*', _I)
+_REPS_BEFORE_WORD = re.compile(r'([\d\-до]+)\s*повторени[яй]?', _I)
+
+# Журнал тренировок (workout_insights)
+_LEADING_SYMBOLS = re.compile(r"^[^\wА-Яа-я]+")
+_FIRST_DIGIT = re.compile(r"\d")
+_SET_HEADING = re.compile(r"^\d+\s*подход\b", _I)
+_LOG_WEIGHT = re.compile(r"(?P<w>\d{1,3}(?:[.,]\d)?)\s*(?:кг|kg)\b", _I)
+_LOG_REPS = re.compile(r"(?P<r>\d{1,2})\s*(?:повт|раз|reps?)\b", _I)
+_LOG_X = re.compile(r"(?P<s>\d{1,2})\s*[xх×]\s*(?P<r>\d{1,2})", _I)
+_NAME_DASHES = re.compile(r"[•\-—–]+")
+_SPACES = re.compile(r"\s+")
+
+_NAME_ALIASES = {
+    "жим лёжа": "жим лежа",
+    "жим штанги лёжа": "жим лежа",
+    "приседания": "присед",
+    "становая": "становая тяга",
+    "тяга становая": "становая тяга",
+}
+
+
+# === Токенизация строки ===
+
+class Line:
+    """Строка плана после очистки и её признаки — считаются один раз"""
+
+    __slots__ = ("text", "lower", "colon", "has_digit", "has_kg", "has_approach")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.lower = text.lower()
+        self.colon = ':' in text
+        self.has_digit = _DIGIT.search(text) is not None
+        self.has_kg = 'кг' in self.lower
+        self.has_approach = 'подход' in self.lower
+
+
+def tokenize(raw: str, prefix: "re.Pattern") -> Optional[Line]:
+    """Пустая строка -> None; иначе строка без маркера списка и нумерации"""
+    line = raw.strip()
+    if not line:
+        return None
+    return Line(line[prefix.match(line).end():].strip())
+
+
+# === Вес и повторения ===
+
+def _int_weight(value: str, fallback: str) -> str:
+    try:
+        return str(int(float(value)))
+    except Exception:
+        return fallback
+
+
+def _plan_weight(tok: Line, sets_info: str) -> Optional[str]:
+    """Вес для формата "N х повторения" / "N подходов": сначала "с весом X кг", затем "X кг" """
+    if not tok.has_kg:
+        return None
+    m = _WEIGHT_WITH.search(sets_info)
+    if m:
+        return _int_weight(m.group(1).replace(',', '.'), m.group(1))
+    m = _WEIGHT_ANY.search(sets_info)
+    if m:
+        weight_str = (m.group(1) or m.group(2) or m.group(3)).replace(',', '.')
+        return _int_weight(weight_str, weight_str)
+    return None
+
+
+def _loose_weight(tok: Line, info: str) -> Optional[str]:
+    if not tok.has_kg:
+        return None
+    m = _WEIGHT_WITH_OR_ANY.search(info)
+    if not m:
+        return None
+    weight_str = (m.group(1) or m.group(2)).replace(',', '.')
+    return _int_weight(weight_str, weight_str)
+
+
+def _plan_reps(reps_info: str) -> str:
+    reps = _STRIP_WEIGHT.sub('', reps_info).strip()
+    reps = _EDGE_COMMAS.sub('', reps).strip()
+    # Исправляем обрезанные фразы типа "до о" -> "до отказа"
+    return "до отказа" if reps == "до о" else reps
+
+
+def _repeat(count: int, reps: str, weight_kg: Optional[str], info: str) -> List[SetEntry]:
+    return [SetEntry(number=i, info=info, reps=reps, weight_kg=weight_kg) for i in range(1, count + 1)]
+
+
+# === План на день (workout_plan_api) ===
+
+def _plan_sets_from_payload(tok: Line, sets_info: str) -> List[SetEntry]:
+    """Правая часть "Упражнение: ...": "4х8-10 60кг", "4 подхода по 10-12", иначе один подход"""
+    m = _SETS_X.search(sets_info) if tok.has_digit else None
+    if m:
+        reps_info = m.group(2).strip() if m.group(2) else sets_info
+        return _repeat(int(m.group(1)), _plan_reps(reps_info), _plan_weight(tok, sets_info), sets_info)
+
+    m = _SETS_APPROACH.search(sets_info) if tok.has_approach else None
+    if m:
+        reps_info = m.group(2).strip()
+        return _repeat(int(m.group(1)), _plan_reps(reps_info), _plan_weight(tok, sets_info), sets_info)
+
+    # Не удалось распарсить — один подход с полной информацией
+    reps = _STRIP_WEIGHT_NO_COMMA.sub('', sets_info).strip() if tok.has_kg else sets_info.strip()
+    reps = _REPS_WORD.sub('', reps).strip()
+    return [SetEntry(number=1, info=sets_info, reps=reps, weight_kg=_loose_weight(tok, sets_info))]
+
+
+def _plan_set_line(tok: Line, text: str, loose_weight: bool) -> Optional[SetEntry]:
+    """Строка отдельного подхода: "1 подход - 20 кг" / "2 подход: 8-10 повторений 60кг" """
+    m = _SET_LINE.search(text)
+    if not m:
+        return None
+    set_info = m.group(2).strip()
+    if loose_weight:
+        weight_kg = _loose_weight(tok, set_info)
+        reps = _STRIP_WEIGHT_NO_COMMA.sub('', set_info).strip() if tok.has_kg else set_info
+    else:
+        wm = _WEIGHT_INT.search(set_info) if tok.has_kg else None
+        weight_kg = wm.group(1) if wm else None
+        reps = _STRIP_WEIGHT_INT.sub('', set_info).strip() if tok.has_kg else set_info
+    reps = _REPS_WORD.sub('', reps).strip()
+    return SetEntry(number=int(m.group(1)), info=set_info, reps=reps, weight_kg=weight_kg)
+
+
+def parse_plan_entries(plan_text: str) -> List[ExerciseEntry]:
+    if not plan_text:
+        return []
+
+    exercises: List[ExerciseEntry] = []
+    current: Optional[ExerciseEntry] = None
+
+    for raw in plan_text.split('\n'):
+        tok = tokenize(raw, _PREFIX_PLAN)
+        if tok is None:
+            continue
+        text, lower = tok.text, tok.lower
+
+        # Заголовки разделов
+        if _SKIP_PLAN.search(lower):
+            if current and current.sets:
+                exercises.append(current)
+                current = None
+            continue
+
+        # Форматы без двоеточия — сразу готовое упражнение
+        # (незавершённое текущее упражнение при этом отбрасывается, как и раньше)
+        if tok.has_approach and tok.has_digit:
+            m = _NAME_SETS_REPS.match(text)
+            if m:
+                reps_info = m.group(3).strip()
+                reps = _REPS_WORD.sub('', reps_info).strip()
+                exercises.append(ExerciseEntry(m.group(1).strip(),
+                                               _repeat(int(m.group(2)), reps, None, reps_info or reps)))
+                current = None
+                continue
+            m = _REPS_NAME_SETS.match(text)
+            if m:
+                reps = m.group(1).strip()
+                exercises.append(ExerciseEntry(m.group(2).strip(),
+                                               _repeat(int(m.group(3)), reps, None, f"{reps} повторений")))
+                current = None
+                continue
+        if tok.has_digit and not tok.has_kg and not tok.has_approach:
+            m = _REPS_NAME.match(text)
+            if m:
+                reps = m.group(1).strip()
+                exercises.append(ExerciseEntry(m.group(2).strip(), _repeat(1, reps, None, f"{reps} повторений")))
+                current = None
+                continue
+
+        # "Упражнение: 4х8-10 60кг" / "Бабочка (сведение рук): 4 подхода по 10-12"
+        m = _COLON.match(text) if tok.colon else None
+        if m:
+            sets = _plan_sets_from_payload(tok, m.group(2).strip())
+            if current and current.sets:
+                exercises.append(current)
+            current = ExerciseEntry(m.group(1).strip(), sets)
+            continue
+
+        if text.startswith('-') or (not tok.colon and not tok.has_approach):
+            name = _DASH.sub('', text)
+            if not tok.has_approach and 'set' not in lower:
+                # Название нового упражнения
+                if current and current.sets:
+                    exercises.append(current)
+                current = ExerciseEntry(name, [])
+            else:
+                if current is None:
+                    current = ExerciseEntry('Упражнение', [])
+                entry = _plan_set_line(tok, name, loose_weight=False)
+                if entry:
+                    current.sets.append(entry)
+        else:
+            if current is None:
+                current = ExerciseEntry('Упражнение', [])
+            entry = _plan_set_line(tok, text, loose_weight=True)
+            if entry:
+                current.sets.append(entry)
+
+    if current:
+        # У упражнения без подходов — один подход "Выполнить"
+        if not current.sets:
+            current.sets = [SetEntry(number=1, info='Выполнить', reps='', weight_kg=None)]
+        exercises.append(current)
+
+    return exercises
+
+
+def parse_plan(plan_text: str) -> List[Dict]:
+    """План на день -> [{'name', 'sets': [{'number', 'info', 'reps', 'weight_kg'}]}]"""
+    return [{'name': ex.name, 'sets': [s.plan_dict() for s in ex.sets]} for ex in parse_plan_entries(plan_text)]
+
+
+# === Запасной разбор workout_parser ===
+
+def parse_simple_entries(plan_text: str) -> List[ExerciseEntry]:
+    if not plan_text:
+        return []
+
+    exercises: List[ExerciseEntry] = []
+    current: Optional[ExerciseEntry] = None
+
+    for raw in plan_text.split('\n'):
+        tok = tokenize(raw, _PREFIX_SIMPLE)
+        if tok is None:
+            continue
+        text, lower = tok.text, tok.lower
+
+        if _SKIP_SIMPLE.search(lower):
+            if current and current.sets:
+                exercises.append(current)
+                current = None
+            continue
+
+        # "Упражнение: 4х8-10 80кг"
+        m = _COLON.match(text) if tok.colon else None
+        if m and tok.has_digit:
+            sets_info = m.group(2).strip()
+            x = _SETS_X_REPS.search(sets_info)
+            if x:
+                wm = _WEIGHT_INT.search(sets_info) if tok.has_kg else None
+                sets = [SetEntry(number=i, reps=x.group(2).strip(), weight_kg=wm.group(1) if wm else None)
+                        for i in range(1, int(x.group(1)) + 1)]
+                if current and current.sets:
+                    exercises.append(current)
+                current = ExerciseEntry(m.group(1).strip(), sets)
+                continue
+
+        # "1 подход - 60кг" / "1 подход: 8-10 повторений 60кг"
+        m = _SET_LINE.search(text) if tok.has_approach else None
+        if m:
+            if current is None:
+                current = ExerciseEntry("Упражнение", [])
+            set_info = m.group(2).strip()
+            wm = _WEIGHT_INT.search(set_info) if tok.has_kg else None
+            rm = _REPS_BEFORE_WORD.search(set_info)
+            current.sets.append(SetEntry(number=int(m.group(1)), reps=rm.group(1) if rm else "",
+                                         weight_kg=wm.group(1) if wm else None))
+            continue
+
+        # Просто название упражнения
+        if not tok.colon and not tok.has_approach:
+            if current and current.sets:
+                exercises.append(current)
+            current = ExerciseEntry(text, [])
+
+    if current:
+        if not current.sets:
+            current.sets = [SetEntry(number=1)]
+        exercises.append(current)
+
+    return exercises
+
+
+def parse_simple(plan_text: str) -> List[Dict]:
+    """План -> [{"name", "sets": [{"number", "reps", "weight_kg", "rpe", "rest_sec"}]}]"""
+    return [{"name": ex.name, "sets": [s.simple_dict() for s in ex.sets]} for ex in parse_simple_entries(plan_text)]
+
+
+# === Журнал тренировок (workout_insights) ===
+
+def normalize_exercise(name: str) -> str:
+    s = (name or "").strip().lower()
+    s = _NAME_DASHES.sub(" ", s)
+    s = _SPACES.sub(" ", s).strip()
+    # легкая нормализация популярных вариантов
+    return _NAME_ALIASES.get(s, s)
+
+
+def parse_log_line(line: str) -> Tuple[Optional[str], List[SetEntry]]:
+    """
+    Упражнение и сеты из одной строки журнала (reps — int, weight_kg — float):
+    "Жим лежа: 4х8 80кг", "🏋️ Жим лежа: 4x8 80 kg", "Присед 3х5 100кг", "Тяга: 8 повторений 60кг"
+    """
+    raw = (line or "").strip()
+    if not raw:
+        return None, []
+
+    # убрать эмодзи в начале
+    raw = _LEADING_SYMBOLS.sub("", raw, count=1).strip()
+
+    # разделение по двоеточию: "Упражнение: ..."
+    if ":" in raw:
+        left, right = raw.split(":", 1)
+        ex = normalize_exercise(left)
+        payload = right.strip()
+    else:
+        # попытаться взять первые слова как упражнение до первой цифры
+        m = _FIRST_DIGIT.search(raw)
+        if not m:
+            return None, []
+        ex = normalize_exercise(raw[: m.start()].strip())
+        payload = raw[m.start():].strip()
+
+    if not ex:
+        return None, []
+    # Отсекаем строки вида "1 подход", "3 подход" и т.п. — это не упражнение
+    if _SET_HEADING.match(ex):
+        return None, []
+
+    mw = _LOG_WEIGHT.search(payload)
+    if not mw:
+        return ex, []
+    w = float(mw.group("w").replace(",", "."))
+
+    # 4х8 80кг
+    mx = _LOG_X.search(payload)
+    if mx:
+        reps = int(mx.group("r"))
+        return ex, [SetEntry(reps=reps, weight_kg=w) for _ in range(max(1, int(mx.group("s"))))]
+
+    # "8 повторений 60кг"
+    mr = _LOG_REPS.search(payload)
+    if mr:
+        return ex, [SetEntry(reps=int(mr.group("r")), weight_kg=w)]
+
+    # только вес (редко)
+    return ex, [SetEntry(reps=None, weight_kg=w)]
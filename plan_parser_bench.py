@@ -0,0 +1,96 @@
+"""
+Эталоны и замер скорости plan_parser
+
+Корпус — plan_parser_corpus.json: реальные форматы планов (промпты tracker_agent,
+сокращённые записи, журнал тренировок) и ожидаемый результат трёх разборов.
+
+  python plan_parser_bench.py check         — сверить с эталонами и замерить время
+  python plan_parser_bench.py update        — перезаписать эталоны (после осознанной смены логики;
+                                              вместе с PLAN_PARSER_VERSION в workout_plan_api)
+  python plan_parser_bench.py check -n 500  — больше повторов для замера
+"""
+import json
+import os
+import sys
+import time
+from typing import Dict, List
+
+import plan_parser
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plan_parser_corpus.json")
+
+
+def _log(text: str) -> List:
+    out = []
+    for line in text.split("\n"):
+        name, sets = plan_parser.parse_log_line(line)
+        if name:
+            out.append([name, [[s.reps, s.weight_kg] for s in sets]])
+    return out
+
+
+PARSERS = {
+    "parse_plan": plan_parser.parse_plan,
+    "parse_simple": plan_parser.parse_simple,
+    "parse_log": _log,
+}
+
+
+def _load() -> List[Dict]:
+    with open(CORPUS_PATH, encoding="utf-8") as f:
+        return json.load(f)["cases"]
+
+
+def update(cases: List[Dict]) -> int:
+    for case in cases:
+        for key, fn in PARSERS.items():
+            case[key] = fn(case["text"])
+    with open(CORPUS_PATH, "w", encoding="utf-8") as f:
+        json.dump({"cases": cases}, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    print(f"plan_parser: {len(cases)} cases written to {CORPUS_PATH}")
+    return 0
+
+
+def check(cases: List[Dict], repeat: int) -> int:
+    failed = 0
+    for case in cases:
+        for key, fn in PARSERS.items():
+            # Через JSON, чтобы сравнивать так же, как записан эталон
+            got = json.loads(json.dumps(fn(case["text"]), ensure_ascii=False))
+            if got != case.get(key):
+                failed += 1
+                print(f"FAIL {case['name']} {key}")
+                print(f"  expected: {json.dumps(case.get(key), ensure_ascii=False)}")
+                print(f"  got:      {json.dumps(got, ensure_ascii=False)}")
+
+    lines = sum(case["text"].count("\n") + 1 for case in cases)
+    for key, fn in PARSERS.items():
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            for case in cases:
+                fn(case["text"])
+        elapsed = time.perf_counter() - t0
+        print(f"{key:13s} {elapsed / (repeat * len(cases)) * 1e6:8.1f} us/plan "
+              f"{elapsed / (repeat * lines) * 1e6:6.2f} us/line")
+
+    print(f"plan_parser: {len(cases)} cases, {failed} mismatches")
+    return 1 if failed else 0
+
+
+def main(argv: list) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Эталоны и замер скорости plan_parser")
+    parser.add_argument("command", choices=["check", "update"])
+    parser.add_argument("-n", "--repeat", type=int, default=200, help="повторов корпуса для замера")
+    args = parser.parse_args(argv)
+
+    cases = _load()
+    if args.command == "update":
+        return update(cases)
+    return check(cases, args.repeat)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -5,6 +5,8 @@ from fastapi import APIRouter, Header, HTTPException
 from typing import Dict, Any, Optional
 from pydantic import BaseModel
 
+import db
+
 try:
     from app.profile_store import get_profile, upsert_profile
 except ImportError:
@@ -41,7 +43,7 @@ class ProfileUpdateRequest(BaseModel):
 async def get_user_profile(x_user_id: str = Header(None, alias="X-User-Id")):
     """Получает профиль пользователя"""
     user_id = _need_user(x_user_id)
-    profile = get_profile(user_id)
+    profile = await db.run("tracker", get_profile, user_id)
     return profile
 
 @router.post("/api/profile")
@@ -56,5 +58,5 @@ async def update_user_profile(
     if not profile_data:
         return {"message": "No data to update"}
     
-    upsert_profile(user_id, profile_data)
-    return get_profile(user_id)
+    await db.run("tracker", upsert_profile, user_id, profile_data)
+    return await db.run("tracker", get_profile, user_id)
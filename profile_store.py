@@ -9,30 +9,14 @@ import os
 import sqlite3
 from typing import Any, Dict, Optional
 
+import db
+
 DB_PATH = (os.getenv("TRACKER_DB_PATH") or "/data/tracker.db").strip()
 
 
 def _db() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS user_profile (
-          user_id TEXT PRIMARY KEY,
-          height_cm INTEGER,
-          weight_kg REAL,
-          age INTEGER,
-          sex TEXT,
-          goal TEXT,
-          experience TEXT,
-          injuries TEXT,
-          equipment TEXT,
-          schedule TEXT,
-          updated_at TEXT
-        )
-        """
-    )
-    conn.commit()
-    return conn
+    # Схема ведётся миграциями (migrations.py); соединение потока — долгоживущее (db.py)
+    return db.connect(DB_PATH, schema="tracker")
 
 
 def get_profile(user_id: int) -> Dict[str, Any]:
@@ -0,0 +1,83 @@
+"""
+Реестр шаблонов промптов
+
+Статические части промптов собираются один раз при импорте модуля-владельца
+и дальше отдаются как есть: строка байт-в-байт одинаковая между запросами,
+поэтому провайдер (context caching у DeepSeek/OpenAI) кэширует префикс
+и не берёт за него полную цену. Динамика подставляется только в шаблоны
+с полями {name}. Для каждого шаблона при регистрации считается длина в токенах.
+"""
+import logging
+import string
+from typing import Any, Dict, Tuple
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+_REGISTRY: Dict[str, "PromptTemplate"] = {}
+
+
+def count_tokens(text: str) -> int:
+    """Количество токенов (tiktoken, если установлен; иначе грубая оценка ~3 символа на токен для кириллицы)"""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return max(1, (len(text) + 2) // 3) if text else 0
+
+
+class PromptTemplate:
+    """Шаблон промпта: статический текст или str.format-шаблон с полями"""
+
+    __slots__ = ("name", "text", "fields", "tokens")
+
+    def __init__(self, name: str, text: str, fields: Tuple[str, ...]):
+        self.name = name
+        self.text = text
+        self.fields = fields
+        # Для шаблонов с полями — длина статического «скелета» без подстановок
+        skeleton = text if not fields else "".join(
+            lit for lit, _, _, _ in string.Formatter().parse(text)
+        )
+        self.tokens = count_tokens(skeleton)
+
+    @property
+    def static(self) -> bool:
+        return not self.fields
+
+    def render(self, **values: Any) -> str:
+        if not self.fields:
+            return self.text
+        return self.text.format(**values)
+
+
+def register(name: str, text: str, static: bool = True) -> PromptTemplate:
+    """
+    Регистрирует шаблон. static=True — текст отдаётся как есть (фигурные скобки
+    в примерах JSON не трогаются); static=False — текст это str.format-шаблон.
+    """
+    fields: Tuple[str, ...] = ()
+    if not static:
+        fields = tuple(f for _, f, _, _ in string.Formatter().parse(text) if f)
+    tpl = PromptTemplate(name, text, fields)
+    if name in _REGISTRY and _REGISTRY[name].text != text:
+        logging.warning(f"prompts: template '{name}' re-registered with different text")
+    _REGISTRY[name] = tpl
+    return tpl
+
+
+def get(name: str) -> PromptTemplate:
+    return _REGISTRY[name]
+
+
+def render(name: str, **values: Any) -> str:
+    return _REGISTRY[name].render(**values)
+
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    """Длина всех зарегистрированных шаблонов: символы, токены, статичность"""
+    return {
+        name: {"chars": len(t.text), "tokens": t.tokens, "static": t.static}
+        for name, t in sorted(_REGISTRY.items())
+    }
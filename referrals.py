@@ -8,108 +8,16 @@ import hmac
 import base64
 from typing import Optional, Dict, List
 
+import db
+
 DB_PATH = os.getenv("REFERRALS_DB", "referrals.db")
 PRICE_PROMO_AMOUNTS = [1000, 2000, 3000, 4000, 5000]
 SESSION_TTL_DAYS = 30
 
 
 def _connect() -> sqlite3.Connection:
-    con = sqlite3.connect(DB_PATH, check_same_thread=False)
-    con.execute("PRAGMA journal_mode=WAL;")
-    con.execute("""
-    CREATE TABLE IF NOT EXISTS trainers (
-        trainer_id TEXT PRIMARY KEY,
-        name TEXT NOT NULL,
-        created_at INTEGER NOT NULL,
-        is_active INTEGER NOT NULL DEFAULT 1
-    )
-    """)
-    con.execute("""
-    CREATE TABLE IF NOT EXISTS promo_codes (
-        code TEXT PRIMARY KEY,
-        trainer_id TEXT NOT NULL,
-        created_at INTEGER NOT NULL,
-        is_active INTEGER NOT NULL DEFAULT 1,
-        FOREIGN KEY (trainer_id) REFERENCES trainers(trainer_id)
-    )
-    """)
-    con.execute("""
-    CREATE TABLE IF NOT EXISTS user_referrals (
-        user_id INTEGER PRIMARY KEY,
-        trainer_id TEXT NOT NULL,
-        promo_code TEXT NOT NULL,
-        bound_at INTEGER NOT NULL,
-        FOREIGN KEY (trainer_id) REFERENCES trainers(trainer_id),
-        FOREIGN KEY (promo_code) REFERENCES promo_codes(code)
-    )
-    """)
-    con.execute("""
-    CREATE TABLE IF NOT EXISTS paid_events (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        trainer_id TEXT NOT NULL,
-        amount_rub REAL NOT NULL,
-        paid_at INTEGER NOT NULL,
-        FOREIGN KEY (trainer_id) REFERENCES trainers(trainer_id)
-    )
-    """)
-    con.execute("""
-    CREATE TABLE IF NOT EXISTS trainer_price_promos (
-        code TEXT PRIMARY KEY,
-        trainer_id TEXT NOT NULL,
-        amount_rub REAL NOT NULL,
-        created_at INTEGER NOT NULL,
-        is_active INTEGER NOT NULL DEFAULT 1,
-        used_by_user_id INTEGER,
-        used_at INTEGER,
-        FOREIGN KEY (trainer_id) REFERENCES trainers(trainer_id)
-    )
-    """)
-    con.execute("""
-    CREATE TABLE IF NOT EXISTS trainer_auth (
-        trainer_id TEXT PRIMARY KEY,
-        login TEXT NOT NULL UNIQUE,
-        password_salt TEXT NOT NULL,
-        password_hash TEXT NOT NULL,
-        password_plain TEXT,
-        created_at INTEGER NOT NULL,
-        updated_at INTEGER NOT NULL,
-        FOREIGN KEY (trainer_id) REFERENCES trainers(trainer_id)
-    )
-    """)
-    con.execute("""
-    CREATE TABLE IF NOT EXISTS trainer_sessions (
-        token TEXT PRIMARY KEY,
-        trainer_id TEXT NOT NULL,
-        created_at INTEGER NOT NULL,
-        expires_at INTEGER NOT NULL,
-        FOREIGN KEY (trainer_id) REFERENCES trainers(trainer_id)
-    )
-    """)
-    con.execute("""
-    CREATE TABLE IF NOT EXISTS user_profiles (
-        user_id INTEGER PRIMARY KEY,
-        full_name TEXT NOT NULL,
-        username TEXT,
-        trainer_id TEXT,
-        created_at INTEGER NOT NULL,
-        updated_at INTEGER NOT NULL
-    )
-    """)
-    con.execute("CREATE INDEX IF NOT EXISTS idx_paid_events_trainer_time ON paid_events(trainer_id, paid_at)")
-    con.execute("CREATE INDEX IF NOT EXISTS idx_promo_codes_trainer ON promo_codes(trainer_id)")
-    con.execute("CREATE INDEX IF NOT EXISTS idx_price_promos_trainer ON trainer_price_promos(trainer_id)")
-    con.execute("CREATE INDEX IF NOT EXISTS idx_trainer_auth_login ON trainer_auth(login)")
-    _ensure_column(con, "trainer_auth", "password_plain", "TEXT")
-    con.commit()
-    return con
-
-
-def _ensure_column(con: sqlite3.Connection, table: str, column: str, column_type: str) -> None:
-    cols = [row[1] for row in con.execute(f"PRAGMA table_info({table})").fetchall()]
-    if column in cols:
-        return
-    con.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+    # Схема ведётся миграциями (migrations.py); соединение потока — долгоживущее (db.py)
+    return db.connect(DB_PATH, schema="referrals")
 
 
 def _ensure_trainer_auth(con: sqlite3.Connection, trainer_id: str) -> tuple[str, str]:
@@ -347,6 +255,8 @@ def create_promo_code(trainer_id: str, code: Optional[str] = None) -> str:
             (code, trainer_id, _now())
         )
         con.commit()
+    finally:
+        con.close()
     return code
 
 
@@ -385,8 +295,6 @@ def add_price_promo(trainer_id: str, amount_rub: float, code: Optional[str] = No
         return {"code": code, "amount_rub": amount_value}
     finally:
         con.close()
-    finally:
-        con.close()
 
 
 def list_trainer_price_promos(trainer_id: str) -> List[Dict]:
@@ -730,7 +638,7 @@ def reset_trainer_password(trainer_id: str) -> Optional[Dict]:
         con.execute(
             "UPDATE trainer_auth SET password_salt=?, password_hash=?, password_plain=?, updated_at=? "
             "WHERE trainer_id=?",
-            (salt_b64, hash_b64, password_value, _now(), trainer_id)
+            (salt_b64, hash_b64, new_password, _now(), trainer_id)
         )
         con.commit()
         return {"trainer_id": trainer_id, "login": row[0], "password": new_password}
@@ -3,9 +3,11 @@ from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
-import sqlite3
 from datetime import datetime, timezone
 
+import db
+from streaks import calculate_streak
+
 from referrals import (
     PRICE_PROMO_AMOUNTS,
     list_trainers_with_stats,
@@ -76,19 +78,8 @@ def _paywall_db_path() -> str:
 
 
 def _read_note(user_id: int, day: str, kind: str) -> str:
-    conn = sqlite3.connect(_tracker_db_path(), check_same_thread=False)
+    conn = db.connect(_tracker_db_path(), schema="tracker")
     try:
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS notes (
-                user_id TEXT NOT NULL,
-                d TEXT NOT NULL,
-                kind TEXT NOT NULL,
-                text TEXT NOT NULL DEFAULT '',
-                updated_at TEXT,
-                PRIMARY KEY (user_id, d, kind)
-            )
-        """)
-        conn.commit()
         row = conn.execute(
             "SELECT text FROM notes WHERE user_id=? AND d=? AND kind=?",
             (str(user_id), day, kind)
@@ -99,19 +90,8 @@ def _read_note(user_id: int, day: str, kind: str) -> str:
 
 
 def _write_note(user_id: int, day: str, kind: str, text: str) -> None:
-    conn = sqlite3.connect(_tracker_db_path(), check_same_thread=False)
+    conn = db.connect(_tracker_db_path(), schema="tracker")
     try:
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS notes (
-                user_id TEXT NOT NULL,
-                d TEXT NOT NULL,
-                kind TEXT NOT NULL,
-                text TEXT NOT NULL DEFAULT '',
-                updated_at TEXT,
-                PRIMARY KEY (user_id, d, kind)
-            )
-        """)
-        conn.commit()
         conn.execute("""
             INSERT OR REPLACE INTO notes (user_id, d, kind, text, updated_at)
             VALUES (?, ?, ?, ?, datetime('now'))
@@ -122,25 +102,19 @@ def _write_note(user_id: int, day: str, kind: str, text: str) -> None:
 
 
 def _workout_days(user_id: int, days: int = 90) -> list[str]:
-    conn = sqlite3.connect(_tracker_db_path(), check_same_thread=False)
+    conn = db.connect(_tracker_db_path(), schema="tracker")
     try:
         rows = conn.execute(
-            "SELECT d, text FROM notes WHERE user_id=? AND kind='workouts' ORDER BY d DESC",
-            (str(user_id),)
+            "SELECT d FROM note_activity WHERE user_id=? AND has_workout=1 ORDER BY d DESC LIMIT ?",
+            (str(user_id), days)
         ).fetchall()
-        result = []
-        for d, text in rows:
-            if text and text.strip():
-                result.append(d)
-            if len(result) >= days:
-                break
-        return result
+        return [d for (d,) in rows]
     finally:
         conn.close()
 
 
 def _paid_until(user_id: int) -> int:
-    conn = sqlite3.connect(_paywall_db_path(), check_same_thread=False)
+    conn = db.connect(_paywall_db_path(), schema="paywall")
     try:
         row = conn.execute(
             "SELECT paid_until FROM users WHERE user_id=?",
@@ -316,6 +290,7 @@ def trainer_client_summary(trainer_id: str, user_id: int, request: Request, days
         "days_left": _days_left(paid_until),
         "workout_days": workout_days,
         "workout_count": len(workout_days),
+        "streak": calculate_streak(workout_days),
     }
 
 
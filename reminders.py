@@ -3,40 +3,18 @@
 """
 import os
 import json
-import sqlite3
 import time
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Tuple
 from pathlib import Path
 
+import db
+
 DB_PATH = os.getenv("REMINDERS_DB", "reminders.db")
 
 def _connect():
-    con = sqlite3.connect(DB_PATH)
-    con.execute("PRAGMA journal_mode=WAL;")
-    con.execute("""
-    CREATE TABLE IF NOT EXISTS reminders (
-        reminder_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        reminder_type TEXT NOT NULL,  -- workout, meal, water, custom
-        message TEXT NOT NULL,
-        time_hour INTEGER NOT NULL,   -- час дня (0-23)
-        time_minute INTEGER NOT NULL DEFAULT 0,  -- минута (0-59)
-        days_of_week TEXT,            -- JSON массив дней недели [0,1,2,3,4,5,6] (0=понедельник)
-        is_active INTEGER NOT NULL DEFAULT 1,
-        created_at INTEGER NOT NULL,
-        last_sent INTEGER DEFAULT 0,
-        next_send INTEGER NOT NULL
-    )
-    """)
-    con.execute("""
-    CREATE INDEX IF NOT EXISTS idx_reminders_user ON reminders(user_id)
-    """)
-    con.execute("""
-    CREATE INDEX IF NOT EXISTS idx_reminders_next_send ON reminders(next_send)
-    """)
-    con.commit()
-    return con
+    # Схема ведётся миграциями (migrations.py); соединение потока — долгоживущее (db.py)
+    return db.connect(DB_PATH, schema="reminders")
 
 def _now() -> int:
     return int(time.time())
@@ -5,6 +5,8 @@ from fastapi import APIRouter, Header, HTTPException
 from typing import Dict, Any
 from pydantic import BaseModel
 
+import db
+
 try:
     from app.user_settings import get_preferences, update_preferences
 except ImportError:
@@ -34,7 +36,7 @@ class RemindersSettingsRequest(BaseModel):
 async def get_reminders_settings(x_user_id: str = Header(None, alias="X-User-Id")):
     """Получает настройки напоминаний пользователя"""
     user_id = _need_user(x_user_id)
-    prefs = get_preferences(user_id)
+    prefs = await db.run("user_settings", get_preferences, user_id)
     return {
         "enabled": prefs.get("reminders_enabled", True)
     }
@@ -47,9 +49,9 @@ async def update_reminders_settings(
     """Обновляет настройки напоминаний пользователя"""
     user_id = _need_user(x_user_id)
     
-    prefs = get_preferences(user_id)
+    prefs = await db.run("user_settings", get_preferences, user_id)
     prefs["reminders_enabled"] = request.enabled
-    update_preferences(user_id, prefs)
+    await db.run("user_settings", update_preferences, user_id, prefs)
     
     return {
         "enabled": request.enabled
@@ -1,13 +1,14 @@
 """
 Модуль для генерации статистики и графиков прогресса
 """
-import os
 import json
 import sqlite3
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 from io import BytesIO
 
+import notes_client
+
 try:
     from matplotlib import pyplot as plt
     from matplotlib import dates as mdates
@@ -16,24 +17,6 @@ try:
 except ImportError:
     MATPLOTLIB_AVAILABLE = False
 
-API_BASE_URL = (os.getenv("API_BASE_URL") or "http://api:8000").strip().rstrip("/")
-
-def _api_req(path: str, user_id: int, timeout: int = 10) -> dict:
-    """Запрос к API для получения данных"""
-    import urllib.request
-    import json as json_lib
-    
-    url = f"{API_BASE_URL}{path}"
-    req = urllib.request.Request(url)
-    req.add_header("X-User-Id", str(user_id))
-    
-    try:
-        with urllib.request.urlopen(req, timeout=timeout) as r:
-            raw = r.read().decode("utf-8")
-            return json_lib.loads(raw) if raw else {}
-    except Exception:
-        return {}
-
 def get_user_stats(user_id: int, days: int = 30) -> Dict:
     """Получает статистику пользователя за период"""
     end_date = datetime.now().date()
@@ -49,18 +32,21 @@ def get_user_stats(user_id: int, days: int = 30) -> Dict:
         "workout_days": set(),
     }
     
-    # Получаем данные за каждый день
+    # Все дни и все kind одним пакетным запросом
+    try:
+        notes = notes_client.get_notes_sync(user_id, ["workouts", "meals", "plan"],
+                                            d_from=start_date.isoformat(), d_to=end_date.isoformat())
+    except Exception:
+        notes = {}
+
     current_date = start_date
     while current_date <= end_date:
         date_str = current_date.isoformat()
+        day = notes.get(date_str) or {}
         
-        workouts_data = _api_req(f"/api/notes?d={date_str}&kind=workouts", user_id)
-        meals_data = _api_req(f"/api/notes?d={date_str}&kind=meals", user_id)
-        plans_data = _api_req(f"/api/notes?d={date_str}&kind=plan", user_id)
-        
-        workouts_text = workouts_data.get("text", "").strip()
-        meals_text = meals_data.get("text", "").strip()
-        plans_text = plans_data.get("text", "").strip()
+        workouts_text = (day.get("workouts") or "").strip()
+        meals_text = (day.get("meals") or "").strip()
+        plans_text = (day.get("plan") or "").strip()
         
         if workouts_text:
             stats["workouts"].append({"date": date_str, "text": workouts_text})
@@ -0,0 +1,127 @@
+"""
+Кэш данных статистики по пользователю (LRU с TTL в памяти процесса)
+
+Для пользователя хранится одна битовая маска активности (streaks.ActivityBits)
+за самый длинный запрошенный период до сегодняшнего дня. Текстовая сводка,
+графики /stats и /api/stats берут из неё окна нужной длины, поэтому данные
+загружаются один раз, а не в каждом генераторе.
+
+Запись устаревает, если:
+  - истёк STATS_CACHE_TTL;
+  - сменился день;
+  - этот процесс записал заметки пользователя (invalidate() из notes_client);
+  - версия из note_versions не совпала с сохранённой (если вызывающий её передал
+    или дал current_version — тогда она проверяется не чаще STATS_VERSION_RECHECK_SEC).
+"""
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Callable, Iterable, Optional, Tuple, Union
+
+from streaks import ActivityBits, DateLike
+
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "300"))
+STATS_CACHE_MAX_USERS = int(os.getenv("STATS_CACHE_MAX_USERS", "2000"))
+# Сверенную версию заметок считаем актуальной столько секунд: один /stats (сводка и все
+# графики) — одна проверка, а не запрос на каждый график
+STATS_VERSION_RECHECK_SEC = float(os.getenv("STATS_VERSION_RECHECK_SEC", "10"))
+
+Loader = Callable[[date, date], Iterable[DateLike]]
+VersionedLoader = Callable[[date, date], Tuple[Iterable[DateLike], Optional[int]]]
+
+
+class _Entry:
+    __slots__ = ("bits", "version", "expires_at", "checked_at")
+
+    def __init__(self, bits: ActivityBits, version: Optional[int], expires_at: float):
+        self.bits = bits
+        self.version = version
+        self.expires_at = expires_at
+        self.checked_at = time.monotonic()
+
+
+_lock = threading.Lock()
+_entries: "OrderedDict[str, _Entry]" = OrderedDict()
+# Поколение пользователя — номер последнего invalidate(): загрузка, начатая до сброса,
+# не попадёт в кэш. Номера растут по всему процессу, поэтому словарь можно ограничить
+# как LRU: для вытесненного ключа поколение — _generation_floor (не меньше его номера)
+_generations: "OrderedDict[str, int]" = OrderedDict()
+_generation_counter = itertools.count(1)
+_generation_floor = 0
+
+
+def _generation(key: str) -> int:
+    return _generations.get(key, _generation_floor)
+
+
+def _fresh(entry: Optional[_Entry], start: date, end: date) -> bool:
+    return (entry is not None and entry.expires_at > time.monotonic()
+            and entry.bits.end == end and entry.bits.start <= start)
+
+
+def activity(user_id: Union[int, str], start: date, end: date, load: Union[Loader, VersionedLoader],
+             version: Optional[int] = None,
+             current_version: Optional[Callable[[], Optional[int]]] = None) -> ActivityBits:
+    """
+    Активность пользователя за [start, end]. При промахе вызывает load(start, end),
+    который возвращает дни с тренировкой, и кладёт результат в кэш.
+
+    version — текущая версия заметок, если она известна даром (своя БД).
+    current_version — если версию нужно запрашивать: тогда load возвращает
+    (дни, версия) одним запросом, а current_version() вызывается только при
+    попадании и не чаще раза в STATS_VERSION_RECHECK_SEC.
+    """
+    key = str(user_id)
+    if version is None and current_version is not None:
+        with _lock:
+            entry = _entries.get(key)
+            recheck = (_fresh(entry, start, end)
+                       and time.monotonic() - entry.checked_at >= STATS_VERSION_RECHECK_SEC)
+        if recheck:
+            # Запрос версии — вне блокировки
+            version = current_version()
+            with _lock:
+                if entry is _entries.get(key) and version is not None and entry.version == version:
+                    entry.checked_at = time.monotonic()
+
+    with _lock:
+        entry = _entries.get(key)
+        if _fresh(entry, start, end) and (version is None or entry.version == version):
+            _entries.move_to_end(key)
+            return entry.bits.window(start, end)
+        generation = _generation(key)
+
+    # Загрузка — вне блокировки: она ходит в БД или по HTTP
+    if current_version is not None:
+        dates, version = load(start, end)
+    else:
+        dates = load(start, end)
+    bits = ActivityBits.from_dates(dates, start, end)
+
+    with _lock:
+        entry = _entries.get(key)
+        # Параллельная загрузка более длинного периода уже в кэше — её не затираем
+        wider = _fresh(entry, start, end) and entry.version == version
+        if _generation(key) == generation and not wider:
+            _entries[key] = _Entry(bits, version, time.monotonic() + STATS_CACHE_TTL)
+            _entries.move_to_end(key)
+            while len(_entries) > STATS_CACHE_MAX_USERS:
+                _entries.popitem(last=False)
+    return bits
+
+
+def invalidate(user_id: Union[int, str]) -> None:
+    """Сбрасывает данные пользователя (вызывается при записи его заметок)"""
+    global _generation_floor
+    key = str(user_id)
+    with _lock:
+        _entries.pop(key, None)
+        _generations[key] = next(_generation_counter)
+        _generations.move_to_end(key)
+        while len(_generations) > STATS_CACHE_MAX_USERS:
+            _, dropped = _generations.popitem(last=False)
+            _generation_floor = max(_generation_floor, dropped)
+
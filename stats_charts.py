@@ -0,0 +1,238 @@
+"""
+Рендер графиков статистики: чистые функции "данные -> картинка".
+
+Выполняются в процессах пула stats_enhanced. Модуль импортирует только
+matplotlib / numpy и не имеет побочных эффектов при импорте, поэтому
+процесс пула не тянет за собой бота и его соединения.
+"""
+import os
+from datetime import date
+from io import BytesIO
+from typing import Dict
+
+CHART_QUALITY = int(os.getenv("CHART_QUALITY", "85"))
+# Timeline на сводной картинке — за последние N дней периода
+DASHBOARD_TIMELINE_DAYS = 60
+
+try:
+    import matplotlib
+    # Без GUI: рендер только в файлы, в том числе в дочерних процессах
+    matplotlib.use("Agg")
+    from matplotlib import pyplot as plt
+    from matplotlib import dates as mdates
+    from matplotlib.colors import ListedColormap, to_rgba
+    from matplotlib.patches import Rectangle
+    import numpy as np
+    MATPLOTLIB_AVAILABLE = True
+    
+    # Настройка стиля для красивых графиков
+    plt.style.use('seaborn-v0_8-darkgrid' if 'seaborn-v0_8-darkgrid' in plt.style.available else 'default')
+except ImportError:
+    MATPLOTLIB_AVAILABLE = False
+
+def _image(fig, fmt: str, dpi: int) -> bytes:
+    """Сохраняет фигуру в PNG / JPEG / WebP и закрывает её"""
+    buf = BytesIO()
+    pil_kwargs = {"quality": CHART_QUALITY} if fmt in ("jpeg", "webp") else None
+    fig.savefig(buf, format=fmt, dpi=dpi, bbox_inches='tight', facecolor='white', pil_kwargs=pil_kwargs)
+    plt.close(fig)
+    return buf.getvalue()
+
+def _day_vector(bits: int, n: int) -> "np.ndarray":
+    """Битовая маска активности -> массив 0/1 длины n (элемент i — день start + i)"""
+    raw = np.frombuffer(bits.to_bytes((n + 7) // 8, "little"), dtype=np.uint8)
+    return np.unpackbits(raw, bitorder="little")[:n]
+
+def _week_grid(start_date: date, bits: int, n: int) -> "np.ndarray":
+    """Сетка недели × день недели: строка — 7-дневный отрезок от start_date, столбец 0 = понедельник"""
+    weeks = -(-n // 7)
+    cells = np.zeros(weeks * 7, dtype=np.uint8)
+    cells[:n] = _day_vector(bits, n)
+    # Столбец j строки — день start_date + j; сдвиг ставит его на свой день недели
+    return np.roll(cells.reshape(weeks, 7), start_date.weekday(), axis=1)
+
+def _draw_calendar(ax, start_date: date, bits: int, n: int, days: int) -> None:
+    """Календарь активности: одна сетка pcolormesh вместо патча на каждый день"""
+    grid = _week_grid(start_date, bits, n)
+    week_count = grid.shape[0]
+    
+    # Палитра цветов
+    colors = ['#ebedf0', '#c6e48b', '#40c463', '#30a14e', '#216e39']
+    
+    # Рисуем календарь: по X — недели, по Y — дни недели (понедельник сверху)
+    ax.pcolormesh(grid.T, cmap=ListedColormap(colors[:2]), vmin=0, vmax=1,
+                  edgecolors='white', linewidth=2)
+    
+    # Настройка осей
+    day_labels = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+    ax.set_yticks(np.arange(7) + 0.5)
+    ax.set_yticklabels(day_labels, fontsize=10)
+    week_ticks = np.arange(0, week_count, max(1, week_count // 12))
+    ax.set_xticks(week_ticks + 0.5)
+    ax.set_xticklabels(week_ticks)
+    ax.set_xlabel('Недели', fontsize=12, fontweight='bold')
+    ax.set_ylabel('День недели', fontsize=12, fontweight='bold')
+    ax.set_title(f'Календарь активности тренировок за {days} дней', 
+                fontsize=16, fontweight='bold', pad=20)
+    
+    # Легенда
+    legend_elements = [
+        Rectangle((0, 0), 1, 1, facecolor=colors[0], edgecolor='gray', label='Нет тренировки'),
+        Rectangle((0, 0), 1, 1, facecolor=colors[1], edgecolor='gray', label='Тренировка')
+    ]
+    ax.legend(handles=legend_elements, loc='upper right', fontsize=10)
+    
+    ax.set_xlim(0, week_count)
+    ax.set_ylim(7, 0)
+    ax.set_aspect('equal')
+
+def _draw_summary(axes, streak: Dict[str, int], total_days: int, percentage: float) -> None:
+    """Метрики В ударе на четырёх осях: текущая и максимальная серия, всего тренировок, процент активности"""
+    ax1, ax2, ax3, ax4 = axes
+    
+    # 1. Текущая серия (большой индикатор)
+    ax1.axis('off')
+    current_streak = streak["current"]
+    max_streak = streak["max"]
+    
+    # Круговая диаграмма прогресса
+    colors_progress = ['#40c463', '#ebedf0']
+    sizes = [current_streak, max(1, max_streak - current_streak)]
+    if current_streak == 0:
+        sizes = [0, 100]
+        colors_progress = ['#ebedf0', '#ebedf0']
+    
+    wedges, texts = ax1.pie(sizes, startangle=90, colors=colors_progress, 
+                            counterclock=False, radius=0.8)
+    
+    # Текст в центре
+    ax1.text(0, 0, f'{current_streak}\nдней', ha='center', va='center',
+            fontsize=32, fontweight='bold', color='#30a14e')
+    ax1.set_title('Текущая серия', fontsize=14, fontweight='bold', pad=20)
+    
+    # 2. Максимальная серия
+    ax2.barh([0], [max_streak], color='#216e39', height=0.5)
+    ax2.set_xlim(0, max(max_streak + 5, 20))
+    ax2.set_yticks([])
+    ax2.set_xlabel('Дни', fontsize=12)
+    ax2.set_title(f'Максимальная серия: {max_streak} дней', fontsize=14, fontweight='bold')
+    ax2.text(max_streak/2, 0, f'{max_streak}', ha='center', va='center',
+            fontsize=24, fontweight='bold', color='white')
+    
+    # 3. Всего тренировок за период
+    total = streak["total"]
+    ax3.bar(['Всего тренировок'], [total], color='#30a14e', width=0.6)
+    ax3.set_ylabel('Количество', fontsize=12)
+    ax3.set_title(f'Всего тренировок: {total} из {total_days} дней', 
+                 fontsize=14, fontweight='bold')
+    ax3.text(0, total/2, f'{total}', ha='center', va='center',
+            fontsize=24, fontweight='bold', color='white')
+    
+    # 4. Процент активности
+    colors_pct = ['#40c463' if percentage >= 50 else '#c6e48b' if percentage >= 30 else '#ebedf0']
+    ax4.bar(['Активность'], [percentage], color=colors_pct[0], width=0.6)
+    ax4.set_ylim(0, 100)
+    ax4.set_ylabel('Процент', fontsize=12)
+    ax4.set_title(f'Процент дней с тренировками: {percentage}%', 
+                 fontsize=14, fontweight='bold')
+    ax4.text(0, percentage/2, f'{percentage}%', ha='center', va='center',
+            fontsize=24, fontweight='bold', color='white')
+
+def _draw_timeline(ax, start_date: date, bits: int, n: int, days: int) -> None:
+    """Активность по дням за последние days + 1 дней окна (timeline)"""
+    shown = min(n, days + 1)
+    workout_counts = _day_vector(bits, n)[n - shown:]
+    dates_list = np.datetime64(start_date, 'D') + np.arange(n - shown, n)
+    
+    # График активности
+    ax.plot(dates_list, workout_counts, color='#40c463', linewidth=2, marker='o', 
+           markersize=4, alpha=0.7, label='Тренировка')
+    ax.fill_between(dates_list, workout_counts, alpha=0.3, color='#40c463')
+    
+    # Настройка осей
+    ax.set_xlabel('Дата', fontsize=12, fontweight='bold')
+    ax.set_ylabel('Активность', fontsize=12, fontweight='bold')
+    ax.set_title(f'График активности тренировок за {days} дней', 
+                fontsize=16, fontweight='bold', pad=15)
+    ax.grid(True, alpha=0.3, linestyle='--')
+    ax.set_ylim(-0.1, 1.1)
+    ax.set_yticks([0, 1])
+    ax.set_yticklabels(['Нет', 'Есть'])
+    
+    # Форматирование дат
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%d.%m'))
+    ax.xaxis.set_major_locator(mdates.DayLocator(interval=max(1, days // 15)))
+    ax.tick_params(axis='x', labelrotation=45)
+
+def _draw_weekly(ax, start_date: date, bits: int, n: int) -> None:
+    """Распределение тренировок по дням недели (0=понедельник, 6=воскресенье)"""
+    workout_days = np.flatnonzero(_day_vector(bits, n))
+    weekday_counts = np.bincount((workout_days + start_date.weekday()) % 7, minlength=7)
+    day_names_short = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+    
+    # Подсветка максимального значения — цветами и толщиной рамки на весь набор столбцов сразу
+    is_max = np.arange(7) == np.argmax(weekday_counts)
+    bar_colors = np.where(is_max[:, None], to_rgba('#40c463', 1.0), to_rgba('#30a14e', 0.8))
+    bars = ax.bar(day_names_short, weekday_counts, color=bar_colors,
+                  edgecolor='#216e39', linewidth=np.where(is_max, 3, 2))
+    
+    # Добавляем значения на столбцы
+    ax.bar_label(bars, fontsize=14, fontweight='bold')
+    
+    ax.set_xlabel('День недели', fontsize=12, fontweight='bold')
+    ax.set_ylabel('Количество тренировок', fontsize=12, fontweight='bold')
+    ax.set_title('Распределение тренировок по дням недели', 
+                fontsize=16, fontweight='bold', pad=15)
+    ax.grid(True, alpha=0.3, axis='y', linestyle='--')
+
+def render_calendar(start_date: date, bits: int, n: int, days: int, fmt: str, dpi: int) -> bytes:
+    fig, ax = plt.subplots(figsize=(14, 8))
+    _draw_calendar(ax, start_date, bits, n, days)
+    plt.tight_layout()
+    return _image(fig, fmt, dpi)
+
+def render_summary(streak: Dict[str, int], total_days: int, percentage: float, fmt: str, dpi: int) -> bytes:
+    fig, axes = plt.subplots(2, 2, figsize=(14, 10))
+    fig.suptitle('📊 Статистика "В ударе"', fontsize=20, fontweight='bold', y=0.98)
+    _draw_summary(axes.flat, streak, total_days, percentage)
+    plt.tight_layout(rect=[0, 0, 1, 0.96])
+    return _image(fig, fmt, dpi)
+
+def render_timeline(start_date: date, bits: int, n: int, days: int, fmt: str, dpi: int) -> bytes:
+    fig, ax = plt.subplots(figsize=(14, 6))
+    _draw_timeline(ax, start_date, bits, n, days)
+    plt.tight_layout()
+    return _image(fig, fmt, dpi)
+
+def render_weekly(start_date: date, bits: int, n: int, fmt: str, dpi: int) -> bytes:
+    fig, ax = plt.subplots(figsize=(12, 6))
+    _draw_weekly(ax, start_date, bits, n)
+    plt.tight_layout()
+    return _image(fig, fmt, dpi)
+
+def render_dashboard(streak: Dict[str, int], total_days: int, percentage: float,
+                      start_date: date, bits: int, n: int, days: int, fmt: str, dpi: int) -> bytes:
+    """Все панели /stats на одной фигуре: метрики, календарь, дни недели, timeline"""
+    fig = plt.figure(figsize=(16, 30))
+    fig.suptitle('📊 Статистика "В ударе"', fontsize=22, fontweight='bold')
+    # Метрики — блок 2×2 сверху, под ним панели на всю ширину
+    grid = fig.add_gridspec(5, 2, height_ratios=[1, 1, 1.3, 1, 1])
+    _draw_summary([fig.add_subplot(grid[r, c]) for r in range(2) for c in range(2)],
+                  streak, total_days, percentage)
+    if bits:
+        _draw_calendar(fig.add_subplot(grid[2, :]), start_date, bits, n, days)
+        _draw_weekly(fig.add_subplot(grid[3, :]), start_date, bits, n)
+        _draw_timeline(fig.add_subplot(grid[4, :]), start_date, bits, n, DASHBOARD_TIMELINE_DAYS)
+    fig.tight_layout(rect=[0, 0, 1, 0.98])
+    return _image(fig, fmt, dpi)
+
+def warm_worker() -> None:
+    """Инициализация процесса пула: шрифты и кэш font_manager грузятся один раз"""
+    fig, ax = plt.subplots(figsize=(2, 2))
+    ax.set_title('Пн Вт Ср 0123456789', fontsize=14, fontweight='bold')
+    fig.canvas.draw()
+    plt.close(fig)
+
+def noop() -> None:
+    """Пустая задача: поднимает процесс пула заранее"""
+    return None
@@ -0,0 +1,123 @@
+"""
+Серии и календарь тренировок на битовой маске
+
+Активность пользователя хранится как int: бит i — день start + i. Серии,
+счётчики за окно, распределение по дням недели и понедельные суммы считаются
+сдвигами, масками и int.bit_count() без разбора дат по одной.
+Общий движок для stats_api, stats_enhanced и сводки клиента в дашборде тренера.
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Union
+
+DateLike = Union[str, date]
+
+
+def _as_date(value: DateLike) -> date:
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+def _every_7th(n: int, offset: int) -> int:
+    """Маска из битов offset, offset+7, ... (< n)"""
+    if offset >= n:
+        return 0
+    count = (n - offset + 6) // 7
+    return int("0000001" * count, 2) << offset & ((1 << n) - 1)
+
+
+class ActivityBits:
+    """Дни с тренировкой в окне [start, end] как битовая маска"""
+
+    __slots__ = ("start", "days", "bits")
+
+    def __init__(self, start: date, end: date, bits: int = 0):
+        self.start = start
+        self.days = max(0, (end - start).days + 1)
+        self.bits = bits & ((1 << self.days) - 1)
+
+    @classmethod
+    def from_dates(cls, dates: Iterable[DateLike], start: DateLike, end: DateLike) -> "ActivityBits":
+        start_d, end_d = _as_date(start), _as_date(end)
+        n = (end_d - start_d).days + 1
+        bits = 0
+        for value in dates:
+            i = (_as_date(value) - start_d).days
+            if 0 <= i < n:
+                bits |= 1 << i
+        return cls(start_d, end_d, bits)
+
+    @property
+    def end(self) -> date:
+        return self.start + timedelta(days=self.days - 1)
+
+    def _index(self, day: DateLike) -> int:
+        return (_as_date(day) - self.start).days
+
+    def has(self, day: DateLike) -> bool:
+        i = self._index(day)
+        return 0 <= i < self.days and bool(self.bits >> i & 1)
+
+    def window(self, first: DateLike, last: DateLike) -> "ActivityBits":
+        """Под-окно [first, last] (дни вне исходного окна — пустые)"""
+        first_d, last_d = _as_date(first), _as_date(last)
+        shift = (first_d - self.start).days
+        bits = self.bits >> shift if shift >= 0 else self.bits << -shift
+        return ActivityBits(first_d, last_d, bits)
+
+    def count(self, first: Optional[DateLike] = None, last: Optional[DateLike] = None) -> int:
+        """Число дней с тренировкой в [first, last] (по умолчанию — всё окно)"""
+        if first is None and last is None:
+            return self.bits.bit_count()
+        return self.window(first or self.start, last or self.end).bits.bit_count()
+
+    def current_streak(self, today: Optional[DateLike] = None) -> int:
+        """Сколько дней подряд заканчивается днём today (0, если сегодня тренировки нет)"""
+        e = self._index(today if today is not None else self.end)
+        if not 0 <= e < self.days:
+            return 0
+        zeros = ~self.bits & ((1 << (e + 1)) - 1)
+        return e + 1 if zeros == 0 else e - (zeros.bit_length() - 1)
+
+    def longest_streak(self) -> int:
+        """Самая длинная серия единиц: x &= x << 1 убирает по одному дню с начала каждой серии"""
+        x, n = self.bits, 0
+        while x:
+            x &= x << 1
+            n += 1
+        return n
+
+    def weekday_histogram(self) -> List[int]:
+        """Тренировки по дням недели (0=понедельник, 6=воскресенье)"""
+        first_wd = self.start.weekday()
+        return [
+            (self.bits & _every_7th(self.days, (wd - first_wd) % 7)).bit_count()
+            for wd in range(7)
+        ]
+
+    def week_buckets(self) -> List[int]:
+        """Суммы по 7-дневным отрезкам от start (последний может быть неполным)"""
+        return [(self.bits >> k & 0x7F).bit_count() for k in range(0, self.days, 7)]
+
+    def dates(self) -> List[str]:
+        out: List[str] = []
+        x = self.bits
+        while x:
+            i = (x & -x).bit_length() - 1
+            out.append((self.start + timedelta(days=i)).isoformat())
+            x &= x - 1
+        return out
+
+    def streak(self, today: Optional[DateLike] = None) -> Dict[str, int]:
+        total = self.count()
+        if not total:
+            return {"current": 0, "max": 0, "total": 0}
+        return {"current": self.current_streak(today), "max": self.longest_streak(), "total": total}
+
+
+def calculate_streak(workout_dates: List[str], today: Optional[date] = None) -> Dict[str, int]:
+    """Вычисляет текущую и максимальную серию дней В ударе"""
+    if not workout_dates:
+        return {"current": 0, "max": 0, "total": 0}
+    today = today or datetime.now().date()
+    parsed = [_as_date(d) for d in workout_dates]
+    bits = ActivityBits.from_dates(parsed, min(parsed), max(max(parsed), today))
+    return bits.streak(today)
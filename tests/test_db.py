@@ -0,0 +1,53 @@
+"""Общее соединение потока: close() вложенного вызова не откатывает чужую транзакцию"""
+import pytest
+
+import db
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / "t.db")
+    con = db.connect(path)
+    con.execute("CREATE TABLE t (x INTEGER)")
+    con.commit()
+    yield path
+    db.connect(path).really_close()
+
+
+def _count(path):
+    return db.connect(path).execute("SELECT COUNT(*) FROM t").fetchone()[0]
+
+
+def test_nested_close_keeps_outer_transaction(path):
+    outer = db.connect(path)
+    outer.execute("INSERT INTO t VALUES (1)")
+    inner = db.connect(path)
+    assert inner is outer
+    inner.execute("SELECT COUNT(*) FROM t").fetchone()
+    inner.close()
+    assert outer.in_transaction
+    outer.execute("INSERT INTO t VALUES (2)")
+    outer.commit()
+    outer.close()
+    assert _count(path) == 2
+
+
+def test_outer_close_rolls_back(path):
+    outer = db.connect(path)
+    outer.execute("INSERT INTO t VALUES (1)")
+    inner = db.connect(path)
+    inner.close()
+    outer.close()
+    assert not outer.in_transaction
+    assert _count(path) == 0
+
+
+def test_missing_close_does_not_disable_rollback(path):
+    leaked = db.connect(path)
+    leaked.execute("INSERT INTO t VALUES (1)")
+    db.connect(path)  # вложенный вызов без close()
+    leaked.commit()
+    con = db.connect(path)
+    con.execute("INSERT INTO t VALUES (2)")
+    con.close()
+    assert _count(path) == 1
@@ -0,0 +1,91 @@
+"""Индекс note_activity, который ведут триггеры, совпадает с note_activity.from_texts"""
+import random
+
+import pytest
+
+import db
+import note_activity
+
+KINDS = ("workouts", "meals", "plan")
+
+CASES = [
+    "",
+    "   ",
+    "a",
+    "a\n  \nb",
+    "a" + "\n" * 20 + "b",
+    "\n\n a \n\n",
+    "a\r\nb\r\n\r\nc",
+    "a\t\n\t\nb \n \f\v\n c",
+    "Жим лёжа: 4х8 80кг\n\n   \nПрисед: 5х5 100кг\n",
+    "a" + " " * 300 + "\n" + "\t" * 70 + "\n" * 129 + "b",
+    "\xa0\n\xa0",
+    "a b",
+]
+
+
+@pytest.fixture
+def conn(tmp_path):
+    con = db.connect(str(tmp_path / "tracker.db"), schema="tracker")
+    yield con
+    con.really_close()
+
+
+def _texts(con, user_id, d):
+    rows = con.execute("SELECT kind, text FROM notes WHERE user_id=? AND d=?", (user_id, d)).fetchall()
+    return {kind: text for kind, text in rows}
+
+
+def _assert_index_matches(con):
+    keys = con.execute("SELECT DISTINCT user_id, d FROM notes").fetchall()
+    for user_id, d in keys:
+        expected = note_activity.from_texts(_texts(con, user_id, d))
+        row = con.execute(
+            f"SELECT {', '.join(note_activity.COLUMNS[2:])} FROM note_activity WHERE user_id=? AND d=?",
+            (user_id, d),
+        ).fetchone()
+        if not (expected["has_workout"] or expected["has_meals"] or expected["has_plan"]):
+            assert row is None, (user_id, d)
+            continue
+        assert row is not None, (user_id, d)
+        assert dict(zip(note_activity.COLUMNS[2:], row)) == expected, _texts(con, user_id, d)
+
+
+def _put(con, user_id, d, kind, text):
+    con.execute(
+        "INSERT INTO notes (user_id, d, kind, text) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(user_id, d, kind) DO UPDATE SET text = excluded.text",
+        (user_id, d, kind, text),
+    )
+
+
+def test_known_cases(conn):
+    for i, text in enumerate(CASES):
+        _put(conn, "u", f"2026-01-{i + 1:02d}", "workouts", text)
+    conn.commit()
+    _assert_index_matches(conn)
+    assert note_activity.count_lines("a\n  \nb") == 2
+    assert note_activity.count_lines("a" + "\n" * 20 + "b") == 2
+
+
+def test_random_writes(conn):
+    rnd = random.Random(7)
+    alphabet = ["a", "б", " ", "\t", "\n", "\r", "\v", "\f", "\xa0", "\n\n\n"]
+    for _ in range(400):
+        user_id, d, kind = f"u{rnd.randint(1, 3)}", f"2026-02-{rnd.randint(1, 5):02d}", rnd.choice(KINDS)
+        if rnd.random() < 0.15:
+            conn.execute("DELETE FROM notes WHERE user_id=? AND d=? AND kind=?", (user_id, d, kind))
+        else:
+            _put(conn, user_id, d, kind, "".join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 40))))
+    conn.commit()
+    _assert_index_matches(conn)
+
+
+def test_backfill_matches_triggers(conn):
+    for i, text in enumerate(CASES):
+        _put(conn, "u", f"2026-03-{i + 1:02d}", "workouts", text)
+    conn.commit()
+    before = conn.execute("SELECT * FROM note_activity ORDER BY user_id, d").fetchall()
+    note_activity.backfill(conn)
+    conn.commit()
+    assert conn.execute("SELECT * FROM note_activity ORDER BY user_id, d").fetchall() == before
@@ -0,0 +1,20 @@
+"""Партнёрские промокоды: все выданные коды лежат в базе"""
+import pytest
+
+import db
+import partners
+
+
+@pytest.fixture
+def partners_db(tmp_path, monkeypatch):
+    path = str(tmp_path / "partners.db")
+    monkeypatch.setattr(partners, "DB_PATH", path)
+    yield path
+    db.connect(path).really_close()
+
+
+def test_create_partner_promos_stores_every_code(partners_db):
+    codes = partners.create_partner_promos("CLUB1", 5)
+    assert len(set(codes)) == 5
+    stored = [row["code"] for row in partners.get_partner_promo_codes("CLUB1")]
+    assert sorted(stored) == sorted(codes)
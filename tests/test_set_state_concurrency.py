@@ -0,0 +1,136 @@
+"""Отметки подходов: одно UPSERT-изменение не затирает параллельные"""
+import sqlite3
+import sys
+import threading
+
+import pytest
+
+import db
+import workout_plan_api
+from workout_plan_api import SetStateUpdate
+
+USER, DAY, EXERCISE = "u", "2026-01-01", "Жим лёжа"
+ROUNDS = 300
+
+
+@pytest.fixture
+def state_db(tmp_path, monkeypatch):
+    path = str(tmp_path / "workout_state.db")
+    monkeypatch.setattr(workout_plan_api, "WORKOUT_STATE_DB", path)
+    yield path
+    # Соединение главного потока долгоживущее — закрываем, чтобы не держать файл
+    db.connect(path).really_close()
+
+
+def _rows(path):
+    con = sqlite3.connect(path)
+    try:
+        return con.execute(
+            "SELECT exercise_name, set_number, weight, reps, completed, skipped "
+            "FROM workout_state ORDER BY exercise_name, set_number"
+        ).fetchall()
+    finally:
+        con.close()
+
+
+def test_write_between_read_and_write_is_kept(state_db):
+    """
+    Детерминированная гонка: правка повторений из другого потока вклинивается прямо
+    перед записью отметки — после всех чтений, которые функция успела сделать.
+    Чтение-потом-запись затирает правку старым значением; один UPSERT — нет.
+    """
+    workout_plan_api._update_set_state(USER, DAY, EXERCISE, 1, reps="8")
+    fired, errors = [], []
+
+    def reps_edit():
+        try:
+            workout_plan_api._update_set_state(USER, DAY, EXERCISE, 1, reps="10")
+        except Exception as e:
+            errors.append(e)
+
+    def trace(sql):
+        if not fired and "workout_state" in sql and not sql.lstrip().upper().startswith("SELECT"):
+            fired.append(sql)
+            t = threading.Thread(target=reps_edit)
+            t.start()
+            t.join()
+
+    con = workout_plan_api._workout_state_db()
+    con.set_trace_callback(trace)
+    try:
+        workout_plan_api._update_set_state(USER, DAY, EXERCISE, 1, completed=True)
+    finally:
+        con.set_trace_callback(None)
+
+    assert fired and errors == []
+    assert _rows(state_db) == [(EXERCISE, 1, "", "10", 1, 0)]
+
+
+def test_concurrent_writes_all_kept(state_db):
+    """Два потока пишут разные поля одних и тех же подходов — в итоге есть каждая запись"""
+    errors = []
+    start = threading.Barrier(2)
+
+    def toggler():
+        try:
+            start.wait()
+            for n in range(1, ROUNDS + 1):
+                workout_plan_api._update_set_state(USER, DAY, EXERCISE, n, completed=True)
+        except Exception as e:
+            errors.append(e)
+
+    def reps_editor():
+        # Правит повторения пачками, как /set-state/batch
+        try:
+            start.wait()
+            for n in range(1, ROUNDS + 1):
+                workout_plan_api._update_set_states(USER, DAY, [
+                    SetStateUpdate(exercise_name=EXERCISE, set_number=n, reps=str(n)),
+                ])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=toggler), threading.Thread(target=reps_editor)]
+    # Частое переключение потоков — чтобы запросы двух потоков действительно перемежались
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert errors == []
+    assert _rows(state_db) == [(EXERCISE, n, "", str(n), 1, 0) for n in range(1, ROUNDS + 1)]
+
+
+def test_sequential_semantics(state_db):
+    update = workout_plan_api._update_set_state
+    # Новая строка только с повторениями: флаги и вес по умолчанию
+    update(USER, DAY, EXERCISE, 1, reps="8")
+    assert _rows(state_db) == [(EXERCISE, 1, "", "8", 0, 0)]
+
+    # Выполненный подход снимает пропуск и наоборот, повторения не трогаются
+    update(USER, DAY, EXERCISE, 1, skipped=True)
+    assert _rows(state_db) == [(EXERCISE, 1, "", "8", 0, 1)]
+    update(USER, DAY, EXERCISE, 1, completed=True)
+    assert _rows(state_db) == [(EXERCISE, 1, "", "8", 1, 0)]
+    update(USER, DAY, EXERCISE, 1, skipped=True)
+    assert _rows(state_db) == [(EXERCISE, 1, "", "8", 0, 1)]
+
+    # Только повторения — флаги остаются как были
+    update(USER, DAY, EXERCISE, 1, reps="10")
+    assert _rows(state_db) == [(EXERCISE, 1, "", "10", 0, 1)]
+
+    # Пачка применяется по порядку, как отдельные запросы
+    workout_plan_api._update_set_states(USER, DAY, [
+        SetStateUpdate(exercise_name=EXERCISE, set_number=1, completed=True),
+        SetStateUpdate(exercise_name=EXERCISE, set_number=2, skipped=True, reps="5"),
+        SetStateUpdate(exercise_name=EXERCISE, set_number=1, completed=False),
+    ])
+    assert _rows(state_db) == [
+        (EXERCISE, 1, "", "10", 0, 0),
+        (EXERCISE, 2, "", "5", 0, 1),
+    ]
@@ -0,0 +1,83 @@
+"""Кэш активности: проверка версии заметок и ограниченный словарь поколений"""
+from datetime import date, timedelta
+
+import pytest
+
+import stats_cache
+
+END = date(2026, 3, 31)
+START = END - timedelta(days=30)
+
+
+@pytest.fixture(autouse=True)
+def clean_cache(monkeypatch):
+    monkeypatch.setattr(stats_cache, "_entries", type(stats_cache._entries)())
+    monkeypatch.setattr(stats_cache, "_generations", type(stats_cache._generations)())
+    monkeypatch.setattr(stats_cache, "_generation_floor", 0)
+
+
+class Notes:
+    """Заметки пользователя на «сервере»: дни с тренировкой и версия"""
+
+    def __init__(self):
+        self.dates, self.version = ["2026-03-30"], 1
+        self.loads = self.checks = 0
+
+    def load(self, start, end):
+        self.loads += 1
+        return list(self.dates), self.version
+
+    def current_version(self):
+        self.checks += 1
+        return self.version
+
+    def write(self, d):
+        self.dates.append(d)
+        self.version += 1
+
+
+def _activity(notes, user_id="u"):
+    return stats_cache.activity(user_id, START, END, notes.load, current_version=notes.current_version)
+
+
+def test_version_rechecked_once_per_window(monkeypatch):
+    notes = Notes()
+    monkeypatch.setattr(stats_cache, "STATS_VERSION_RECHECK_SEC", 3600)
+    for _ in range(5):
+        assert _activity(notes).dates() == ["2026-03-30"]
+    # Версия пришла вместе с данными; в окне повторной проверки запросов нет
+    assert (notes.loads, notes.checks) == (1, 0)
+
+
+def test_version_change_reloads(monkeypatch):
+    notes = Notes()
+    monkeypatch.setattr(stats_cache, "STATS_VERSION_RECHECK_SEC", 0)
+    _activity(notes)
+    _activity(notes)
+    assert (notes.loads, notes.checks) == (1, 1)
+    notes.write("2026-03-31")
+    assert _activity(notes).dates() == ["2026-03-30", "2026-03-31"]
+    assert (notes.loads, notes.checks) == (2, 2)
+
+
+def test_generations_are_bounded(monkeypatch):
+    monkeypatch.setattr(stats_cache, "STATS_CACHE_MAX_USERS", 10)
+    for i in range(100):
+        stats_cache.invalidate(f"u{i}")
+    assert len(stats_cache._generations) == 10
+
+
+def test_load_invalidated_then_evicted_is_not_cached(monkeypatch):
+    monkeypatch.setattr(stats_cache, "STATS_CACHE_MAX_USERS", 2)
+    notes = Notes()
+
+    def load(start, end):
+        # Пока идёт загрузка: запись пользователя, и его поколение вытесняют другие
+        stats_cache.invalidate("u")
+        stats_cache.invalidate("a")
+        stats_cache.invalidate("b")
+        assert "u" not in stats_cache._generations
+        return notes.load(start, end)
+
+    stats_cache.activity("u", START, END, load, current_version=notes.current_version)
+    assert "u" not in stats_cache._entries
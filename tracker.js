@@ -2622,15 +2622,22 @@
   
   // Показ уведомления об успешном переносе
   function showTransferSuccess() {
-    // Создаем временное уведомление
+    showWorkoutNotification("Результаты перенесены в дневник");
+  }
+  
+  // Временное уведомление поверх экрана тренировки
+  function showWorkoutNotification(message, isError = false) {
     const notification = document.createElement('div');
     notification.className = 'transfer-success-notification';
+    notification.classList.toggle('is-error', isError);
+    const iconPath = isError ? "M18 6L6 18M6 6l12 12" : "M20 6L9 17l-5-5";
     notification.innerHTML = `
       <svg width="20" height="20" viewBox="0 0 24 24" fill="none" xmlns="http://www.w3.org/2000/svg">
-        <path d="M20 6L9 17l-5-5" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"/>
+        <path d="${iconPath}" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"/>
       </svg>
-      <span>Результаты перенесены в дневник</span>
+      <span></span>
     `;
+    notification.querySelector('span').textContent = message;
     document.body.appendChild(notification);
     
     // Анимация появления
@@ -3174,6 +3181,11 @@
   let lastRenderedPlanHash = null; // Хеш последнего отрендеренного плана для предотвращения ненужных обновлений
   let hasRenderedWorkoutPlanOnce = false;
   const CACHE_TTL = 3000; // 3 секунды кеш (уменьшено для более актуальных данных)
+  // Пока сервер уточняет разбор плана ИИ (parse_pending), тихо перезапрашиваем план
+  const PLAN_PARSE_POLL_MS = 4000;
+  const PLAN_PARSE_POLL_MAX = 5;
+  let planParsePolls = 0;
+  let planParsePollTimer = null;
   
   function extractRepsValue(set) {
     if (!set) return "";
@@ -3215,7 +3227,7 @@
     if (!data || !data.exercises) return null;
     return JSON.stringify(data.exercises.map(ex => ({
       name: ex.name,
-      sets: ex.sets ? ex.sets.map(s => ({ completed: s.completed, skipped: s.skipped, performed_reps: s.performed_reps || "" })) : []
+      sets: ex.sets ? ex.sets.map(s => ({ completed: s.completed, skipped: s.skipped, performed_reps: s.performed_reps || "", reps: s.reps || "", weight_kg: s.weight_kg || null })) : []
     })));
   }
 
@@ -3232,6 +3244,9 @@
     }
     
     try {
+      // Сначала отправляем накопленные отметки подходов, иначе план придёт со старым состоянием
+      await flushSetStates();
+      
       // Создаем AbortController для таймаута (совместимость с браузерами)
       const controller = new AbortController();
       const timeoutId = setTimeout(() => controller.abort(), 10000);
@@ -3273,9 +3288,9 @@
         return true;
       });
       
-      // Сохраняем в кеш
+      // Сохраняем в кеш (пока разбор уточняется — без TTL, следующий запрос пойдёт на сервер)
       workoutPlanCache = data;
-      workoutPlanCacheTime = Date.now();
+      workoutPlanCacheTime = data.parse_pending ? null : Date.now();
       
       return data;
     } catch (e) {
@@ -3289,48 +3304,123 @@
     }
   }
 
-  async function apiUpdateSetState(exerciseName, setNumber, completed, skipped, reps){
-    const uid = getUserId() || "0"; // Fallback на "0" если нет uid
-    try {
-      const payload = {
-        exercise_name: exerciseName,
-        set_number: setNumber,
-        completed: completed,
-        skipped: skipped
-      };
-      if (reps !== undefined) {
-        payload.reps = reps;
+  // Изменения подходов копятся и уходят одной пачкой на /set-state/batch:
+  // серия нажатий в конце тренировки — несколько запросов вместо десятков
+  const SET_STATE_FLUSH_MS = 400;      // пауза без нажатий перед отправкой
+  const SET_STATE_FLUSH_MAX_MS = 2000; // дольше не копим даже при непрерывных нажатиях
+  const pendingSetStates = new Map();  // "упражнение\u0000подход" -> { update, resolvers }
+  let setStateFlushTimer = null;
+  let setStateFirstPendingAt = 0;
+  let setStateFlushChain = Promise.resolve();
+
+  // Применяет изменение поверх уже накопленного так же, как сервер применил бы их по очереди
+  function mergeSetState(entry, completed, skipped, reps) {
+    const nextCompleted = completed ?? entry.completed;
+    const nextSkipped = skipped ?? entry.skipped;
+    entry.completed = nextCompleted;
+    entry.skipped = nextSkipped;
+    // Выполненный подход снимает пропуск и наоборот
+    if (completed === true) {
+      entry.skipped = false;
+    } else if (skipped === true) {
+      entry.completed = false;
+    }
+    if (reps !== undefined) {
+      entry.reps = reps;
+    }
+  }
+
+  function offlineApplySetState(uid, update) {
+    const plan = offlineGetWorkoutPlan(uid);
+    if (plan && Array.isArray(plan.exercises)) {
+      const ex = plan.exercises.find(item => item && item.name === update.exercise_name);
+      if (ex && Array.isArray(ex.sets)) {
+        const target = ex.sets.find(s => s.number === update.set_number);
+        if (target) {
+          if (update.completed !== null && update.completed !== undefined) target.completed = update.completed;
+          if (update.skipped !== null && update.skipped !== undefined) target.skipped = update.skipped;
+          if (update.reps !== undefined) target.performed_reps = update.reps;
+          offlineSetWorkoutPlan(uid, plan);
+          return true;
+        }
       }
-      const r = await fetch(withApiBase("/api/workout-plan/set-state"), {
+    }
+    return false;
+  }
+
+  // Каждое изменение получает итог своей пачки: ответ сервера, { ok, offline } —
+  // сохранено только на устройстве, null — не сохранено нигде
+  async function sendSetStates(uid, entries, keepalive = false) {
+    const updates = entries.map(entry => entry.update);
+    try {
+      const r = await fetch(withApiBase("/api/workout-plan/set-state/batch"), {
         method: "POST",
         headers: {
           "X-User-Id": uid,
           "Content-Type": "application/json"
         },
-        body: JSON.stringify(payload)
+        body: JSON.stringify({ updates }),
+        keepalive
       });
       if (!r.ok) throw new Error(`HTTP ${r.status}`);
-      return await r.json();
+      const result = await r.json();
+      entries.forEach(entry => entry.resolvers.forEach(resolve => resolve(result)));
+      return result;
     } catch (e) {
       console.error("Update set state error:", e);
-      const plan = offlineGetWorkoutPlan(uid);
-      if (plan && Array.isArray(plan.exercises)) {
-        const ex = plan.exercises.find(item => item && item.name === exerciseName);
-        if (ex && Array.isArray(ex.sets)) {
-          const target = ex.sets.find(s => s.number === setNumber);
-          if (target) {
-            if (completed !== null && completed !== undefined) target.completed = completed;
-            if (skipped !== null && skipped !== undefined) target.skipped = skipped;
-            if (reps !== undefined) target.performed_reps = reps;
-            offlineSetWorkoutPlan(uid, plan);
-            return { ok: true, offline: true };
-          }
-        }
-      }
+      entries.forEach(entry => {
+        const result = offlineApplySetState(uid, entry.update) ? { ok: true, offline: true } : null;
+        entry.resolvers.forEach(resolve => resolve(result));
+      });
+      showWorkoutNotification("Отметки подходов не сохранились на сервере", true);
       return null;
     }
   }
 
+  // Отправляет накопленное; пачки уходят строго по очереди, чтобы не перепутать порядок нажатий
+  function flushSetStates(keepalive = false) {
+    clearTimeout(setStateFlushTimer);
+    setStateFlushTimer = null;
+    if (pendingSetStates.size > 0) {
+      const uid = getUserId() || "0";
+      const entries = Array.from(pendingSetStates.values());
+      pendingSetStates.clear();
+      setStateFlushChain = setStateFlushChain.then(() => sendSetStates(uid, entries, keepalive));
+    }
+    return setStateFlushChain;
+  }
+
+  function apiUpdateSetState(exerciseName, setNumber, completed, skipped, reps){
+    const key = `${exerciseName}\u0000${setNumber}`;
+    let entry = pendingSetStates.get(key);
+    if (!entry) {
+      entry = {
+        update: { exercise_name: exerciseName, set_number: setNumber, completed: null, skipped: null },
+        resolvers: []
+      };
+      pendingSetStates.set(key, entry);
+    }
+    mergeSetState(entry.update, completed, skipped, reps);
+    
+    const now = Date.now();
+    if (!setStateFlushTimer) {
+      setStateFirstPendingAt = now;
+    }
+    clearTimeout(setStateFlushTimer);
+    const wait = Math.max(0, Math.min(SET_STATE_FLUSH_MS, setStateFirstPendingAt + SET_STATE_FLUSH_MAX_MS - now));
+    setStateFlushTimer = setTimeout(() => flushSetStates(), wait);
+    
+    // Отметки в интерфейсе ставятся сразу, не дожидаясь пачки; об ошибке отправки
+    // сообщит sendSetStates. Промис — итог отправки для тех, кому он нужен (правка повторений)
+    return new Promise(resolve => entry.resolvers.push(resolve));
+  }
+
+  // Не теряем накопленные нажатия при сворачивании и закрытии Mini App
+  document.addEventListener("visibilitychange", () => {
+    if (document.visibilityState === "hidden") flushSetStates(true);
+  });
+  window.addEventListener("pagehide", () => flushSetStates(true));
+
   // Обновление прогресса выполнения упражнений
   function updateWorkoutProgress(data) {
     if (!data || !data.exercises) return;
@@ -3708,7 +3798,7 @@
         
         for (const setEl of sets) {
           const setNumber = parseInt(setEl.dataset.set);
-          await apiUpdateSetState(exerciseName, setNumber, newState, false);
+          apiUpdateSetState(exerciseName, setNumber, newState, false);
           
           const wrapperEl = setEl.closest('.workout-set-wrapper');
           const setCheckbox = setEl.querySelector('.workout-set-checkbox');
@@ -3811,13 +3901,8 @@
           } catch (e) {}
         }
         
-        // Обновляем состояние
-        try {
-          await apiUpdateSetState(exerciseName, setNumber, newCompleted, newSkipped);
-        } catch (e) {
-          console.error("Ошибка обновления состояния подхода:", e);
-          return;
-        }
+        // Обновляем состояние (уходит пачкой, интерфейс не ждёт ответа)
+        apiUpdateSetState(exerciseName, setNumber, newCompleted, newSkipped);
         
         // Обновляем UI с плавной анимацией
         const wrapperEl = setEl.closest('.workout-set-wrapper');
@@ -3912,7 +3997,10 @@
         return;
       }
       
-      const result = await apiUpdateSetState(exerciseName, setNumber, null, null, newValue);
+      const pending = apiUpdateSetState(exerciseName, setNumber, null, null, newValue);
+      // Правку повторений отправляем сразу: редактор ждёт ответа, чтобы откатить значение при ошибке
+      flushSetStates();
+      const result = await pending;
       if (!result) {
         inputEl.value = originalValue;
         closeRepsEditor(infoEl);
@@ -4025,6 +4113,19 @@
     });
   }
 
+  function scheduleWorkoutPlanParsePoll(data) {
+    clearTimeout(planParsePollTimer);
+    if (!data || !data.parse_pending) {
+      planParsePolls = 0;
+      return;
+    }
+    if (planParsePolls >= PLAN_PARSE_POLL_MAX) return;
+    planParsePolls += 1;
+    planParsePollTimer = setTimeout(() => {
+      loadWorkoutPlan(false).catch(e => console.warn("Фоновая загрузка плана:", e));
+    }, PLAN_PARSE_POLL_MS);
+  }
+
   async function loadWorkoutPlan(force = false) {
     const loading = $("#workoutPlanLoading");
     const empty = $("#workoutPlanEmpty");
@@ -4053,6 +4154,7 @@
       const data = await apiGetWorkoutPlan(force);
       
       loading.style.display = "none";
+      scheduleWorkoutPlanParsePoll(data);
       
       if (data && data.exercises && Array.isArray(data.exercises) && data.exercises.length > 0) {
         exercises.style.display = "block";
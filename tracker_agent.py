@@ -1,11 +1,12 @@
-import os, json, re, datetime, urllib.request, urllib.error, asyncio
-from typing import Any, Dict, List, Optional
+import re, datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
-OPENAI_API_KEY = (os.getenv("OPENAI_API_KEY") or "").strip()          # DeepSeek key (Bearer)
-OPENAI_BASE_URL = (os.getenv("OPENAI_BASE_URL") or "https://api.deepseek.com").strip().rstrip("/")
-OPENAI_MODEL = (os.getenv("OPENAI_MODEL") or "deepseek-chat").strip()
+import aiohttp
 
-API_BASE_URL = (os.getenv("API_BASE_URL") or "http://api:8000").strip().rstrip("/")
+import llm_client
+import llm_json
+import notes_client
+import prompts
 
 # MSK fixed offset (UTC+3)
 MSK = datetime.timezone(datetime.timedelta(hours=3))
@@ -32,72 +33,104 @@ def _strip_markdown(s: str) -> str:
     s = re.sub(r"\n{3,}", "\n\n", s)
     return s.strip()
 
-def _api_req(method: str, path: str, user_id: int, body: Optional[dict] = None, timeout: int = 10) -> dict:
-    url = f"{API_BASE_URL}{path}"
-    data = None if body is None else json.dumps(body).encode("utf-8")
-    req = urllib.request.Request(url, data=data, method=method)
-    req.add_header("X-User-Id", str(user_id))
-    if data is not None:
-        req.add_header("Content-Type", "application/json")
-    with urllib.request.urlopen(req, timeout=timeout) as r:
-        raw = r.read().decode("utf-8")
-        return json.loads(raw) if raw else {}
-
-def _get_note(user_id: int, d: str, kind: str) -> str:
+async def _api_req(method: str, path: str, user_id: int, body: Optional[dict] = None, timeout: int = 10) -> dict:
+    return await notes_client.api_req(method, path, user_id=user_id, body=body, timeout=timeout)
+
+async def _get_note(user_id: int, d: str, kind: str) -> str:
     try:
-        j = _api_req("GET", f"/api/notes?d={d}&kind={kind}", user_id=user_id)
+        j = await _api_req("GET", f"/api/notes?d={d}&kind={kind}", user_id=user_id)
         return (j.get("text") or "").strip()
     except Exception:
         return ""
 
-def _put_note(user_id: int, d: str, kind: str, text: str) -> None:
-    _api_req("PUT", f"/api/notes?d={d}&kind={kind}", user_id=user_id, body={"text": text})
+async def _get_day_notes(user_id: int, d: str) -> Dict[str, str]:
+    """Все заметки за день (workouts/meals/plan) одним запросом"""
+    try:
+        days = await notes_client.get_notes(user_id, sorted(ALLOWED_KINDS), d=d)
+        row = days.get(d) or {}
+        return {k: (row.get(k) or "").strip() for k in ALLOWED_KINDS}
+    except Exception:
+        return {k: "" for k in ALLOWED_KINDS}
+
+async def _put_note(user_id: int, d: str, kind: str, text: str) -> None:
+    await _api_req("PUT", f"/api/notes?d={d}&kind={kind}", user_id=user_id, body={"text": text})
 
-def _append_note(user_id: int, d: str, kind: str, chunk: str) -> None:
-    cur = _get_note(user_id, d, kind)
+async def _append_note(user_id: int, d: str, kind: str, chunk: str) -> None:
+    try:
+        await notes_client.append_note(user_id, d, kind, chunk.strip())
+        return
+    except aiohttp.ClientResponseError as e:
+        if e.status not in (404, 405):
+            raise
+    # API без /api/notes/append: старый read-modify-write
+    cur = await _get_note(user_id, d, kind)
     if not cur:
-        _put_note(user_id, d, kind, chunk.strip())
+        await _put_note(user_id, d, kind, chunk.strip())
         return
     merged = (cur.rstrip() + "\n\n" + chunk.strip()).strip()
-    _put_note(user_id, d, kind, merged)
-
-def _openai_chat(messages: list, temperature: float = 0.2, max_tokens: int = 600) -> str:
-    if not OPENAI_API_KEY:
-        raise RuntimeError("OPENAI_API_KEY is missing")
-
-    url = f"{OPENAI_BASE_URL}/v1/chat/completions"
-    payload = {
-        "model": OPENAI_MODEL,
-        "messages": messages,
-        "temperature": temperature,
-        "max_tokens": max_tokens,
-    }
-    data = json.dumps(payload).encode("utf-8")
-
-    req = urllib.request.Request(url, data=data, method="POST")
-    req.add_header("Authorization", f"Bearer {OPENAI_API_KEY}")
-    req.add_header("Content-Type", "application/json")
+    await _put_note(user_id, d, kind, merged)
 
+async def _openai_chat(messages: list, temperature: float = 0.2, max_tokens: int = 600, cache: bool = False,
+                       **extra: Any) -> str:
     # Уменьшаем timeout до 12 секунд для ускорения ответа
-    with urllib.request.urlopen(req, timeout=12) as r:
-        j = json.loads(r.read().decode("utf-8"))
-    content = (((j.get("choices") or [{}])[0]).get("message") or {}).get("content") or ""
-    return content.strip()
-
-def _extract_json(text: str) -> dict:
-    text = text.strip()
-    # First try strict json
-    try:
-        return json.loads(text)
-    except Exception:
-        pass
-    # Try find first {...} block
-    m = re.search(r"\{.*\}", text, flags=re.S)
-    if not m:
-        raise ValueError("No JSON found")
-    return json.loads(m.group(0))
-
-def _generate_plan_fallback(user_id: int, user_text: str, today: str, context: Optional[str] = None) -> str:
+    # cache=True — для детерминированных вызовов (одинаковый промпт -> ответ из llm_cache)
+    return await llm_client.chat(messages, temperature=temperature, max_tokens=max_tokens, timeout=12, cache=cache,
+                                 **extra)
+
+async def _openai_chat_stream(messages: list, on_partial: Callable[[str], Awaitable[None]],
+                              temperature: float = 0.2, max_tokens: int = 600, **extra: Any) -> str:
+    """Стриминговый вызов: по мере генерации отдаёт текущий текст reply в on_partial, возвращает весь ответ"""
+    raw = ""
+    shown = ""
+    async for delta in llm_client.chat_stream(messages, temperature=temperature, max_tokens=max_tokens, timeout=12,
+                                              **extra):
+        raw += delta
+        partial = _strip_markdown(llm_json.partial_string_field(raw, "reply"))
+        if partial and partial != shown:
+            shown = partial
+            try:
+                await on_partial(partial)
+            except Exception as e:
+                # Ошибка отображения не должна ломать генерацию
+                import logging
+                logging.warning(f"on_partial failed: {e}")
+    return raw.strip()
+
+def _extract_json(text: str) -> Tuple[dict, str]:
+    """
+    Разбирает ответ модели {"reply": ..., "writes": [...]} с ремонтом обрывков (llm_json).
+    Возвращает (data, ступень разбора); ValueError — только если восстановить нечего.
+    """
+    return llm_json.parse_object(text, required=("reply", "writes"), partial_field="reply")
+
+_PLAN_FALLBACK_SYSTEM = prompts.register(
+    "tracker.plan_fallback.system",
+    "Ты профессиональный фитнес-тренер. Создавай конкретные, практичные планы тренировок с указанием весов и подходов.",
+)
+
+_PLAN_FALLBACK_USER = prompts.register("tracker.plan_fallback.user", (
+    "Ты — фитнес-тренер. Пользователь просит составить план тренировок.\n"
+    "ОБЯЗАТЕЛЬНО создай полноценный план тренировок с:\n"
+    "- Конкретными упражнениями (например: жим лёжа, приседания, тяга штанги)\n"
+    "- Количеством подходов и повторений (например: 4 подхода по 8-12 повторений)\n"
+    "- Весом в килограммах для каждого упражнения (например: 80 кг)\n"
+    "- Структурированным форматом с эмодзи\n\n"
+    "{profile_context}"
+    "ВАЖНО: НЕ копируй запрос пользователя. Сразу создавай готовый план.\n"
+    "Формат ответа: просто текст плана, без JSON, без форматирования markdown.\n"
+    "Пример формата:\n"
+    "🏋️ План тренировок на сегодня:\n\n"
+    "1. Жим лёжа: 4 подхода по 8-12 повторений, 80 кг\n"
+    "2. Приседания: 4 подхода по 10-12 повторений, 100 кг\n"
+    "3. Тяга штанги в наклоне: 4 подхода по 8-10 повторений, 70 кг\n"
+    "4. Жим гантелей сидя: 3 подхода по 10-12 повторений, 20 кг\n"
+    "5. Подъём на бицепс: 3 подхода по 10-12 повторений, 15 кг\n\n"
+    "Запрос пользователя: {user_text}\n\n"
+    "Создай план тренировок прямо сейчас:"
+), static=False)
+
+async def _generate_plan_fallback(user_id: int, user_text: str, today: str, context: Optional[str] = None,
+                                  priority: str = llm_client.PRIORITY_INTERACTIVE) -> str:
     """Генерирует план тренировок через дополнительный запрос к ИИ, если основной запрос не вернул план"""
     try:
         # Получаем профиль пользователя для контекста
@@ -106,34 +139,15 @@ def _generate_plan_fallback(user_id: int, user_text: str, today: str, context: O
             profile_context = f"\nКонтекст пользователя:\n{context}\n"
         
         # Формируем специальный промпт для генерации плана
-        plan_prompt = (
-            "Ты — фитнес-тренер. Пользователь просит составить план тренировок.\n"
-            "ОБЯЗАТЕЛЬНО создай полноценный план тренировок с:\n"
-            "- Конкретными упражнениями (например: жим лёжа, приседания, тяга штанги)\n"
-            "- Количеством подходов и повторений (например: 4 подхода по 8-12 повторений)\n"
-            "- Весом в килограммах для каждого упражнения (например: 80 кг)\n"
-            "- Структурированным форматом с эмодзи\n\n"
-            f"{profile_context}"
-            "ВАЖНО: НЕ копируй запрос пользователя. Сразу создавай готовый план.\n"
-            "Формат ответа: просто текст плана, без JSON, без форматирования markdown.\n"
-            "Пример формата:\n"
-            "🏋️ План тренировок на сегодня:\n\n"
-            "1. Жим лёжа: 4 подхода по 8-12 повторений, 80 кг\n"
-            "2. Приседания: 4 подхода по 10-12 повторений, 100 кг\n"
-            "3. Тяга штанги в наклоне: 4 подхода по 8-10 повторений, 70 кг\n"
-            "4. Жим гантелей сидя: 3 подхода по 10-12 повторений, 20 кг\n"
-            "5. Подъём на бицепс: 3 подхода по 10-12 повторений, 15 кг\n\n"
-            f"Запрос пользователя: {user_text}\n\n"
-            "Создай план тренировок прямо сейчас:"
-        )
+        plan_prompt = _PLAN_FALLBACK_USER.render(profile_context=profile_context, user_text=user_text)
         
         # Вызываем ИИ для генерации плана
         messages = [
-            {"role": "system", "content": "Ты профессиональный фитнес-тренер. Создавай конкретные, практичные планы тренировок с указанием весов и подходов."},
+            {"role": "system", "content": _PLAN_FALLBACK_SYSTEM.text},
             {"role": "user", "content": plan_prompt}
         ]
         
-        generated_plan = _openai_chat(messages, temperature=0.3, max_tokens=800)
+        generated_plan = await _openai_chat(messages, temperature=0.3, max_tokens=800, priority=priority)
         
         # Очищаем от markdown и форматирования
         plan_text = _strip_markdown(generated_plan).strip()
@@ -203,8 +217,9 @@ def _detect_kind_from_text(text: str) -> Optional[str]:
 def _is_plan_request(text: str) -> bool:
     return _detect_kind_from_text(text) == "plan"
 
-def _build_system_prompt() -> str:
-    return (
+# Системный промпт статичен: собирается один раз при импорте и не меняется между запросами,
+# поэтому префикс запроса байт-в-байт одинаковый и попадает в кэш контекста провайдера.
+_SYSTEM_PROMPT = prompts.register("tracker.system", (
         "Ты — ИИ-ассистент для дневника тренировок/питания/плана.\n"
         "ВАЖНО: ты пишешь в Telegram.\n"
         "Запрещено использовать Markdown/разметку и спецсимволы форматирования.\n"
@@ -274,7 +289,43 @@ def _build_system_prompt() -> str:
         "— Строки вида: '🍽️ Завтрак: ...', '🏋️ Жим лёжа: 4х8 80кг', '🗓️ План тренировок на сегодня: ...'\n"
         "— Аккуратные переносы строк, без таблиц и без форматирования.\n"
         "— Для тренировок: формат '🏋️ Название упражнения: подходы х повторения вес'\n"
-    )
+))
+
+def _build_system_prompt() -> str:
+    return _SYSTEM_PROMPT.text
+
+_USER_INSTRUCTIONS = prompts.register("tracker.user_instructions", (
+        "ИНСТРУКЦИИ:\n"
+        "1. Проанализируй сообщение пользователя и определи тип запроса:\n"
+        "   — ТРЕНИРОВКА: если есть упражнения, подходы, повторения, вес\n"
+        "   — ПИТАНИЕ: если есть приемы пищи, продукты, еда\n"
+        "   — ПЛАН: если пользователь ПРОСИТ составить/создать план\n"
+        "\n"
+        "2. Если mode_hint задан, но он противоречит явному запросу пользователя — "
+        "используй тип из запроса пользователя (приоритет у пользователя).\n"
+        "\n"
+        "3. Запиши в правильный kind:\n"
+        "   — kind='workouts' для тренировок (mode='append')\n"
+        "   — kind='meals' для питания (mode='append')\n"
+        "   — kind='plan' для планов (mode='replace')\n"
+        "\n"
+        "4. КРИТИЧЕСКИ ВАЖНО для планов:\n"
+        "   — Если пользователь просит план тренировок, ОБЯЗАТЕЛЬНО создавай полноценный план в writes.\n"
+        "   — План должен содержать конкретные упражнения с подходами, повторениями и весом.\n"
+        "   — НЕ сохраняй запрос пользователя как план. НЕ пиши просто 'План создан' без самого плана.\n"
+        "   — Если writes пустой при запросе плана — это ОШИБКА. Всегда создавай план в writes.\n"
+        "\n"
+        "5. Если это обычный разговор без запроса на запись — просто ответь, writes оставь пустым.\n"
+        "\n"
+        "Верни JSON строго по формату."
+))
+
+_STRICT_SUFFIX = prompts.register(
+    "tracker.strict_suffix",
+    "\n\nСТРОГО: верни только JSON без любого другого текста. Формат: {\"reply\": \"текст\", \"writes\": []}",
+)
+
+_MODE_HINT_LABELS = {"sets": "тренировки", "meals": "питание"}
 
 def _build_user_prompt(user_text: str, mode_hint: Optional[str], today: str, now_str: str,
                        workouts: str, meals: str, plan: str, context: Optional[str] = None,
@@ -289,7 +340,7 @@ def _build_user_prompt(user_text: str, mode_hint: Optional[str], today: str, now
     
     mode_hint_info = f"mode_hint: {mode_hint or 'none'}"
     if mode_hint:
-        mode_hint_info += f" ({'тренировки' if mode_hint == 'sets' else 'питание' if mode_hint == 'meals' else 'план'})"
+        mode_hint_info += f" ({_MODE_HINT_LABELS.get(mode_hint, 'план')})"
     
     return (
         f"Текущее время (МСК): {now_str}\n"
@@ -303,41 +354,28 @@ def _build_user_prompt(user_text: str, mode_hint: Optional[str], today: str, now
         f"План:\n{plan or '(пусто)'}\n\n"
         "Сообщение пользователя:\n"
         f"{user_text}\n\n"
-        "ИНСТРУКЦИИ:\n"
-        "1. Проанализируй сообщение пользователя и определи тип запроса:\n"
-        "   — ТРЕНИРОВКА: если есть упражнения, подходы, повторения, вес\n"
-        "   — ПИТАНИЕ: если есть приемы пищи, продукты, еда\n"
-        "   — ПЛАН: если пользователь ПРОСИТ составить/создать план\n"
-        "\n"
-        "2. Если mode_hint задан, но он противоречит явному запросу пользователя — "
-        "используй тип из запроса пользователя (приоритет у пользователя).\n"
-        "\n"
-        "3. Запиши в правильный kind:\n"
-        "   — kind='workouts' для тренировок (mode='append')\n"
-        "   — kind='meals' для питания (mode='append')\n"
-        "   — kind='plan' для планов (mode='replace')\n"
-        "\n"
-        "4. КРИТИЧЕСКИ ВАЖНО для планов:\n"
-        "   — Если пользователь просит план тренировок, ОБЯЗАТЕЛЬНО создавай полноценный план в writes.\n"
-        "   — План должен содержать конкретные упражнения с подходами, повторениями и весом.\n"
-        "   — НЕ сохраняй запрос пользователя как план. НЕ пиши просто 'План создан' без самого плана.\n"
-        "   — Если writes пустой при запросе плана — это ОШИБКА. Всегда создавай план в writes.\n"
-        "\n"
-        "5. Если это обычный разговор без запроса на запись — просто ответь, writes оставь пустым.\n"
-        "\n"
-        "Верни JSON строго по формату."
+        + _USER_INSTRUCTIONS.text
     )
 
-async def handle(user_id: int, text: str, mode_hint: Optional[str] = None, force_mode_hint: bool = False) -> Dict[str, Any]:
+async def handle(user_id: int, text: str, mode_hint: Optional[str] = None, force_mode_hint: bool = False,
+                 on_partial: Optional[Callable[[str], Awaitable[None]]] = None,
+                 priority: str = llm_client.PRIORITY_INTERACTIVE) -> Dict[str, Any]:
+    """
+    Обрабатывает сообщение пользователя. Если передан on_partial — ответ модели стримится,
+    и в on_partial по мере генерации приходит текущий текст reply.
+    Записи в заметки применяются только после получения и разбора полного JSON.
+    priority — класс запроса в планировщике LLM (чат — interactive, генерация плана из API — plan).
+    """
     user_text = (text or "").strip()
     now = _now_msk()
     today = now.date().isoformat()
     now_str = now.strftime("%Y-%m-%d %H:%M")
 
-    # Pull current notes (context)
-    workouts = _truncate(_get_note(user_id, today, "workouts"))
-    meals = _truncate(_get_note(user_id, today, "meals"))
-    plan = _truncate(_get_note(user_id, today, "plan"))
+    # Pull current notes (context) — один пакетный запрос
+    day_notes = await _get_day_notes(user_id, today)
+    workouts = _truncate(day_notes["workouts"])
+    meals = _truncate(day_notes["meals"])
+    plan = _truncate(day_notes["plan"])
     
     # Получаем контекст пользователя (предпочтения, цели)
     try:
@@ -374,64 +412,52 @@ async def handle(user_id: int, text: str, mode_hint: Optional[str] = None, force
     intent_classification = f"{intent} (confidence: {confidence:.2f})" if intent else None
     user_prompt = _build_user_prompt(user_text, mode_hint, today, now_str, workouts, meals, plan, context, intent_classification)
 
-    # Call DeepSeek in a thread to not block polling
-    def _call():
-        messages = [
-            {"role": "system", "content": sys_prompt},
-            {"role": "user", "content": user_prompt},
-        ]
-        return _openai_chat(messages, temperature=0.15, max_tokens=450)
+    # Call DeepSeek через общий async-клиент (без потоков, с переиспользованием соединения)
+    messages = [
+        {"role": "system", "content": sys_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
 
     raw = ""
+    parse_path = "fallback"
     try:
-        raw = await asyncio.to_thread(_call)
-        data = _extract_json(raw)
-        
-        # Проверяем, что data содержит корректный JSON
-        if not isinstance(data, dict):
-            raise ValueError("Invalid response format")
-        if "reply" not in data and "writes" not in data:
-            raise ValueError("Missing required fields in response")
-            
+        if on_partial is not None:
+            raw = await _openai_chat_stream(messages, on_partial, temperature=0.15, max_tokens=450,
+                                            priority=priority, **llm_client.json_mode_params())
+        else:
+            raw = await _openai_chat(messages, temperature=0.15, max_tokens=450, priority=priority,
+                                     **llm_client.json_mode_params())
+        # Кривой/оборванный JSON чиним локально — повторный запрос только если спасти нечего
+        data, parse_path = _extract_json(raw)
+
     except Exception as e1:
         # second strict retry
         try:
-            def _call2():
-                messages = [
-                    {"role": "system", "content": sys_prompt},
-                    {"role": "user", "content": user_prompt + "\n\nСТРОГО: верни только JSON без любого другого текста. Формат: {\"reply\": \"текст\", \"writes\": []}"},
-                ]
-                return _openai_chat(messages, temperature=0.0, max_tokens=400)
-            raw = await asyncio.to_thread(_call2)
-            data = _extract_json(raw)
-            
-            # Проверяем повторно после retry
-            if not isinstance(data, dict):
-                raise ValueError("Invalid response format after retry")
-            if "reply" not in data and "writes" not in data:
-                raise ValueError("Missing required fields after retry")
-                
+            messages2 = [
+                {"role": "system", "content": sys_prompt},
+                {"role": "user", "content": user_prompt + _STRICT_SUFFIX.text},
+            ]
+            raw = await _openai_chat(messages2, temperature=0.0, max_tokens=400, priority=priority,
+                                     **llm_client.json_mode_params())
+            data, _ = _extract_json(raw)
+            parse_path = "retry"
+
         except Exception as e2:
             # Если оба запроса провалились, создаем минимальный ответ
             import logging
             logging.error(f"Failed to get valid response from AI: {e1}, {e2}")
-            
-            # Пытаемся извлечь хотя бы reply из raw, если он есть
+
             if raw:
-                try:
-                    # Пробуем найти JSON в тексте
-                    import re
-                    json_match = re.search(r'\{[^{}]*"reply"[^{}]*\}', raw, re.DOTALL)
-                    if json_match:
-                        data = json.loads(json_match.group(0))
-                    else:
-                        # Если JSON не найден, создаем ответ из текста
-                        data = {"reply": _strip_markdown(raw)[:200], "writes": []}
-                except:
-                    data = {"reply": "✅ План создан", "writes": []}
+                # JSON не найден — отвечаем текстом модели
+                data = {"reply": _strip_markdown(raw)[:200], "writes": []}
             else:
                 data = {"reply": "✅ План создан", "writes": []}
 
+    llm_json.record("tracker_agent", parse_path)
+    if parse_path != "strict":
+        import logging
+        logging.info(f"tracker_agent: response parsed via '{parse_path}', totals: {llm_json.stats().get('tracker_agent')}")
+
     reply = _strip_markdown(str(data.get("reply") or "")).strip()
     writes = data.get("writes") or []
     if not isinstance(writes, list):
@@ -465,7 +491,7 @@ async def handle(user_id: int, text: str, mode_hint: Optional[str] = None, force
         plan_write = next((w for w in writes if str(w.get("kind")) == "plan"), None)
         plan_text = _strip_markdown(str(plan_write.get("text") if plan_write else "")).strip()
         if not plan_text or len(plan_text) < 50:
-            plan_text = _generate_plan_fallback(user_id, user_text, today)
+            plan_text = await _generate_plan_fallback(user_id, user_text, today, priority=priority)
         writes = [{"d": today, "kind": "plan", "mode": "replace", "text": plan_text}]
         if not reply or "план создан" in reply.lower() or len(reply) < 30:
             reply = plan_text
@@ -482,9 +508,9 @@ async def handle(user_id: int, text: str, mode_hint: Optional[str] = None, force
                 continue
 
             if mode == "replace":
-                _put_note(user_id, d, kind, txt)
+                await _put_note(user_id, d, kind, txt)
             else:
-                _append_note(user_id, d, kind, txt)
+                await _append_note(user_id, d, kind, txt)
             
         except Exception:
             # do not crash bot
@@ -169,6 +169,8 @@ async function loadClientSummary(userId){
   qs("daysLeft").textContent = summary.days_left ?? "0";
   qs("lastPaid").textContent = summary.paid?.last_paid_at ? `${formatDate(summary.paid.last_paid_at)}` : "—";
   qs("workoutCount").textContent = summary.workout_count ?? "0";
+  const streak = summary.streak || {};
+  qs("workoutStreak").textContent = `${streak.current ?? 0} дн. (макс. ${streak.max ?? 0})`;
   const days = (summary.workout_days || []).slice(0, 14);
   qs("workoutDays").innerHTML = days.length
     ? days.map((d) => `<span class="activity-day">${d}</span>`).join("")
@@ -4,27 +4,17 @@
 """
 import os
 import json
-import sqlite3
 import time
 from typing import Optional, Dict, Any
 from pathlib import Path
 
+import db
+
 DB_PATH = os.getenv("USER_SETTINGS_DB", "user_settings.db")
 
 def _connect():
-    con = sqlite3.connect(DB_PATH)
-    con.execute("PRAGMA journal_mode=WAL;")
-    con.execute("""
-    CREATE TABLE IF NOT EXISTS user_settings (
-        user_id INTEGER PRIMARY KEY,
-        preferences TEXT,  -- JSON с предпочтениями
-        goals TEXT,        -- JSON с целями
-        stats TEXT,        -- JSON со статистикой использования
-        updated_at INTEGER NOT NULL DEFAULT 0
-    )
-    """)
-    con.commit()
-    return con
+    # Схема ведётся миграциями (migrations.py); соединение потока — долгоживущее (db.py)
+    return db.connect(DB_PATH, schema="user_settings")
 
 def _now() -> int:
     return int(time.time())
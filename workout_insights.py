@@ -8,63 +8,20 @@
 from __future__ import annotations
 
 import os
-import re
 import sqlite3
-from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 
+import db
+import plan_parser
+from plan_parser import ExerciseEntry, SetEntry
+
 DB_PATH = (os.getenv("TRACKER_DB_PATH") or "/data/tracker.db").strip()
 
 
 def _db() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS notes (
-          user_id TEXT NOT NULL,
-          d TEXT NOT NULL,
-          kind TEXT NOT NULL,
-          text TEXT NOT NULL DEFAULT '',
-          updated_at TEXT,
-          PRIMARY KEY (user_id, d, kind)
-        )
-        """
-    )
-    conn.commit()
-    return conn
-
-
-def _normalize_exercise(name: str) -> str:
-    s = (name or "").strip().lower()
-    s = re.sub(r"[•\-—–]+", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
-    # легкая нормализация популярных вариантов
-    repl = {
-        "жим лёжа": "жим лежа",
-        "жим штанги лёжа": "жим лежа",
-        "приседания": "присед",
-        "становая": "становая тяга",
-        "тяга становая": "становая тяга",
-    }
-    return repl.get(s, s)
-
-
-@dataclass
-class SetEntry:
-    reps: Optional[int]
-    weight_kg: Optional[float]
-
-
-@dataclass
-class ExerciseEntry:
-    name: str
-    sets: List[SetEntry]
-
-
-_RE_WEIGHT = re.compile(r"(?P<w>\d{1,3}(?:[.,]\d)?)\s*(?:кг|kg)\b", re.I)
-_RE_REPS = re.compile(r"(?P<r>\d{1,2})\s*(?:повт|раз|reps?)\b", re.I)
-_RE_X = re.compile(r"(?P<s>\d{1,2})\s*[xх×]\s*(?P<r>\d{1,2})", re.I)
+    # Схема ведётся миграциями (migrations.py); соединение потока — долгоживущее (db.py)
+    return db.connect(DB_PATH, schema="tracker")
 
 
 def _parse_line(line: str) -> Tuple[Optional[str], List[SetEntry]]:
@@ -76,69 +33,7 @@ def _parse_line(line: str) -> Tuple[Optional[str], List[SetEntry]]:
     - "Присед 3х5 100кг"
     - "Тяга: 8 повторений 60кг"
     """
-    raw = (line or "").strip()
-    if not raw:
-        return None, []
-
-    # убрать эмодзи в начале
-    raw = re.sub(r"^[^\wА-Яа-я]+", "", raw).strip()
-
-    # разделение по двоеточию: "Упражнение: ..."
-    if ":" in raw:
-        left, right = raw.split(":", 1)
-        ex = _normalize_exercise(left)
-        payload = right.strip()
-    else:
-        # попытаться взять первые слова как упражнение до первой цифры
-        m = re.search(r"\d", raw)
-        if not m:
-            return None, []
-        ex = _normalize_exercise(raw[: m.start()].strip())
-        payload = raw[m.start() :].strip()
-
-    if not ex:
-        return None, []
-    # Отсекаем строки вида "1 подход", "3 подход" и т.п. — это не упражнение
-    if re.match(r"^\d+\s*подход\b", ex, flags=re.I):
-        return None, []
-
-    sets: List[SetEntry] = []
-
-    # 4х8 80кг
-    mx = _RE_X.search(payload)
-    mw = _RE_WEIGHT.search(payload)
-    if mx and mw:
-        try:
-            s_cnt = int(mx.group("s"))
-            reps = int(mx.group("r"))
-            w = float(mw.group("w").replace(",", "."))
-            for _ in range(max(1, s_cnt)):
-                sets.append(SetEntry(reps=reps, weight_kg=w))
-            return ex, sets
-        except Exception:
-            pass
-
-    # "8 повторений 60кг"
-    mr = _RE_REPS.search(payload)
-    if mr and mw:
-        try:
-            reps = int(mr.group("r"))
-            w = float(mw.group("w").replace(",", "."))
-            sets.append(SetEntry(reps=reps, weight_kg=w))
-            return ex, sets
-        except Exception:
-            pass
-
-    # только вес (редко)
-    if mw:
-        try:
-            w = float(mw.group("w").replace(",", "."))
-            sets.append(SetEntry(reps=None, weight_kg=w))
-            return ex, sets
-        except Exception:
-            pass
-
-    return ex, []
+    return plan_parser.parse_log_line(line)
 
 
 def last_weight_map(user_id: int, days: int = 60) -> Dict[str, float]:
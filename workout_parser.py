@@ -7,35 +7,24 @@ import json
 import re
 from typing import Dict, List, Optional
 
-OPENAI_API_KEY = (os.getenv("OPENAI_API_KEY") or "").strip()
-OPENAI_BASE_URL = (os.getenv("OPENAI_BASE_URL") or "https://api.deepseek.com").strip().rstrip("/")
-OPENAI_MODEL = (os.getenv("OPENAI_MODEL") or "deepseek-chat").strip()
+import llm_json
+import plan_parser
 
 
-def _openai_chat(messages: list, temperature: float = 0.1, max_tokens: int = 800) -> str:
+def _openai_chat(messages: list, temperature: float = 0.1, max_tokens: int = 800,
+                 json_mode: bool = False, **extra) -> str:
     """Вызов DeepSeek API для парсинга плана"""
-    if not OPENAI_API_KEY:
-        raise RuntimeError("OPENAI_API_KEY is missing")
-
-    import urllib.request
-    url = f"{OPENAI_BASE_URL}/v1/chat/completions"
-    payload = {
-        "model": OPENAI_MODEL,
-        "messages": messages,
-        "temperature": temperature,
-        "max_tokens": max_tokens,
-    }
-    data = json.dumps(payload).encode("utf-8")
-
-    req = urllib.request.Request(url, data=data, method="POST")
-    req.add_header("Authorization", f"Bearer {OPENAI_API_KEY}")
-    req.add_header("Content-Type", "application/json")
-
     try:
-        with urllib.request.urlopen(req, timeout=8) as r:  # Короткий таймаут с fallback
-            j = json.loads(r.read().decode("utf-8"))
-        content = (((j.get("choices") or [{}])[0]).get("message") or {}).get("content") or ""
-        return content.strip()
+        # llm_client тянет aiohttp — импортируем только когда ИИ-парсер действительно нужен,
+        # чтобы workout_plan_api грузился и без него (локальный прототип)
+        import llm_client
+        if json_mode:
+            extra.update(llm_client.json_mode_params())
+        # Короткий таймаут и без повторов — у парсера есть быстрый fallback.
+        # Один и тот же план парсится при каждой загрузке /today — ответ берём из llm_cache
+        # Приоритет как у генерации плана; в очереди стоим недолго — у парсера есть regex-fallback
+        return llm_client.chat_sync(messages, temperature=temperature, max_tokens=max_tokens, timeout=8, retries=0,
+                                    cache=True, priority=llm_client.PRIORITY_PLAN, queue_timeout=2, **extra)
     except Exception as e:
         # Если таймаут или другая ошибка - возвращаем пустую строку для fallback
         import logging
@@ -43,7 +32,11 @@ def _openai_chat(messages: list, temperature: float = 0.1, max_tokens: int = 800
         raise  # Пробрасываем исключение для fallback
 
 
-def parse_workout_plan_with_ai(plan_text: str) -> List[Dict]:
+# Короче этого план разбирается без ИИ — регулярных выражений хватает
+AI_MIN_PLAN_CHARS = 50
+
+
+def parse_workout_plan_with_ai(plan_text: str, fallback: bool = True) -> Optional[List[Dict]]:
     """
     Парсит план тренировок с помощью ИИ и возвращает структурированные данные.
     
@@ -58,6 +51,9 @@ def parse_workout_plan_with_ai(plan_text: str) -> List[Dict]:
         - weight_kg: вес в кг (число или None)
         - rpe: RPE (Rate of Perceived Exertion, например, "7-8", "≤8")
         - rest_sec: отдых в секундах (число или None)
+
+    fallback=False — без запасного разбора: None, если ИИ не дал результата
+    (фоновый разбор в workout_plan_api, где regex-разбор уже отдан).
     """
     if not plan_text or not plan_text.strip():
         return []
@@ -66,11 +62,11 @@ def parse_workout_plan_with_ai(plan_text: str) -> List[Dict]:
     use_ai = os.getenv("USE_AI_PARSER", "true").lower() == "true"
     if not use_ai:
         # Если отключен - сразу используем fallback
-        return _fallback_parse(plan_text)
+        return _fallback_parse(plan_text) if fallback else None
     
     # Если план очень короткий или простой - используем fallback сразу
-    if len(plan_text.strip()) < 50:
-        return _fallback_parse(plan_text)
+    if len(plan_text.strip()) < AI_MIN_PLAN_CHARS:
+        return _fallback_parse(plan_text) if fallback else None
     
     # Промпт для ИИ
     system_prompt = """Ты — эксперт по парсингу планов тренировок. Твоя задача — извлечь из текста плана все упражнения с их параметрами.
@@ -131,14 +127,15 @@ def parse_workout_plan_with_ai(plan_text: str) -> List[Dict]:
         ]
         
         # Уменьшаем таймаут и токены для ускорения
-        response = _openai_chat(messages, temperature=0.1, max_tokens=600)
-        
-        # Извлекаем JSON из ответа (на случай если ИИ добавил markdown)
-        json_match = re.search(r'\{.*\}', response, re.DOTALL)
-        if json_match:
-            response = json_match.group(0)
+        response = _openai_chat(messages, temperature=0.1, max_tokens=600, json_mode=True)
         
-        data = json.loads(response)
+        # Извлекаем JSON из ответа (markdown, текст вокруг, оборванный хвост)
+        try:
+            data, path = llm_json.parse_object(response, required=("exercises",))
+        except ValueError:
+            llm_json.record("workout_parser", "fallback")
+            return _fallback_parse(plan_text) if fallback else None
+        llm_json.record("workout_parser", path)
         
         # Валидация и нормализация данных
         exercises = data.get("exercises", [])
@@ -200,120 +197,17 @@ def parse_workout_plan_with_ai(plan_text: str) -> List[Dict]:
         
     except json.JSONDecodeError as e:
         # Если ИИ вернул невалидный JSON, используем fallback парсер
-        return _fallback_parse(plan_text)
+        return _fallback_parse(plan_text) if fallback else None
     except Exception as e:
         # В случае любой ошибки используем fallback
         import logging
         logging.error(f"AI parsing error: {e}")
-        return _fallback_parse(plan_text)
+        return _fallback_parse(plan_text) if fallback else None
 
 
 def _fallback_parse(plan_text: str) -> List[Dict]:
     """
     Простой fallback парсер на случай если ИИ не сработал.
-    Использует базовые регулярные выражения.
+    Использует базовые регулярные выражения (plan_parser.parse_simple).
     """
-    if not plan_text:
-        return []
-    
-    exercises = []
-    lines = plan_text.split('\n')
-    current_exercise = None
-    skip_sections = ['разминка', 'разогрев', 'заминка', 'основная часть', 'warm-up', 'cool-down', 'правило прогрессии']
-    
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        
-        # Убираем эмодзи и маркеры
-        line_clean = re.sub(r'^[🗓️📝•\-\*🏋️🍽️🔥💪]\s*', '', line)
-        line_clean = re.sub(r'^\d+[\.\)]\s*', '', line_clean).strip()
-        
-        line_lower = line_clean.lower()
-        if any(section in line_lower for section in skip_sections):
-            if current_exercise and current_exercise['sets']:
-                exercises.append(current_exercise)
-                current_exercise = None
-            continue
-        
-        # Формат "Упражнение: 4х8-10 80кг"
-        colon_match = re.match(r'^(.+?):\s*(.+)', line_clean)
-        if colon_match:
-            ex_name = colon_match.group(1).strip()
-            sets_info = colon_match.group(2).strip()
-            
-            # Парсим "4х8-10 80кг"
-            x_match = re.search(r'(\d+)\s*[хx]\s*([\d\-до\s]+)', sets_info, re.IGNORECASE)
-            weight_match = re.search(r'(\d+)\s*кг', sets_info, re.IGNORECASE)
-            
-            if x_match:
-                num_sets = int(x_match.group(1))
-                reps = x_match.group(2).strip()
-                weight_kg = weight_match.group(1) if weight_match else None
-                
-                sets = []
-                for i in range(1, num_sets + 1):
-                    sets.append({
-                        "number": i,
-                        "reps": reps,
-                        "weight_kg": weight_kg,
-                        "rpe": "",
-                        "rest_sec": None
-                    })
-                
-                if current_exercise and current_exercise['sets']:
-                    exercises.append(current_exercise)
-                
-                current_exercise = {
-                    "name": ex_name,
-                    "sets": sets
-                }
-                continue
-        
-        # Формат "1 подход - 60кг" или "1 подход: 8-10 повторений 60кг"
-        set_match = re.search(r'(\d+)\s*подход[а-я]*\s*[:\-]\s*(.+)', line_clean, re.IGNORECASE)
-        if set_match:
-            if current_exercise is None:
-                current_exercise = {"name": "Упражнение", "sets": []}
-            
-            set_num = int(set_match.group(1))
-            set_info = set_match.group(2).strip()
-            
-            weight_match = re.search(r'(\d+)\s*кг', set_info, re.IGNORECASE)
-            reps_match = re.search(r'([\d\-до]+)\s*повторени[яй]?', set_info, re.IGNORECASE)
-            
-            weight_kg = weight_match.group(1) if weight_match else None
-            reps = reps_match.group(1) if reps_match else ""
-            
-            current_exercise['sets'].append({
-                "number": set_num,
-                "reps": reps,
-                "weight_kg": weight_kg,
-                "rpe": "",
-                "rest_sec": None
-            })
-            continue
-        
-        # Просто название упражнения
-        if not ':' in line_clean and not 'подход' in line_lower:
-            if current_exercise and current_exercise['sets']:
-                exercises.append(current_exercise)
-            
-            current_exercise = {
-                "name": line_clean,
-                "sets": []
-            }
-    
-    if current_exercise:
-        if not current_exercise['sets']:
-            current_exercise['sets'] = [{
-                "number": 1,
-                "reps": "",
-                "weight_kg": None,
-                "rpe": "",
-                "rest_sec": None
-            }]
-        exercises.append(current_exercise)
-    
-    return exercises
+    return plan_parser.parse_simple(plan_text)
@@ -3,14 +3,20 @@ API endpoint для работы с планом тренировок на се
 Извлекает упражнения из плана и управляет состоянием выполнения
 """
 import os
-import sqlite3
-import re
 import json
+import time
+import asyncio
+import hashlib
+import logging
 from datetime import datetime, timezone, timedelta
 from fastapi import APIRouter, Header, HTTPException
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from pydantic import BaseModel
 
+import db
+import plan_parser
+import workout_parser
+
 # Импорт tracker_agent для генерации плана
 agent_handle = None
 try:
@@ -32,43 +38,12 @@ WORKOUT_STATE_DB = (os.getenv("WORKOUT_STATE_DB") or "/data/workout_state.db").s
 router = APIRouter()
 
 def _db():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS notes (
-            user_id TEXT NOT NULL,
-            d TEXT NOT NULL,
-            kind TEXT NOT NULL,
-            text TEXT NOT NULL DEFAULT '',
-            updated_at TEXT,
-            PRIMARY KEY (user_id, d, kind)
-        )
-    """)
-    conn.commit()
-    return conn
+    # Схема ведётся миграциями (migrations.py); соединение потока — долгоживущее (db.py)
+    return db.connect(DB_PATH, schema="tracker")
 
 def _workout_state_db():
     """База данных для хранения состояния выполнения упражнений"""
-    conn = sqlite3.connect(WORKOUT_STATE_DB, check_same_thread=False)
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS workout_state (
-            user_id TEXT NOT NULL,
-            date TEXT NOT NULL,
-            exercise_name TEXT NOT NULL,
-            set_number INTEGER NOT NULL,
-            weight TEXT,
-            reps TEXT,
-            completed INTEGER DEFAULT 0,
-            skipped INTEGER DEFAULT 0,
-            updated_at TEXT,
-            PRIMARY KEY (user_id, date, exercise_name, set_number)
-        )
-    """)
-    # Мягкая миграция для старых БД без столбца reps
-    cols = [row[1] for row in conn.execute("PRAGMA table_info(workout_state)").fetchall()]
-    if "reps" not in cols:
-        conn.execute("ALTER TABLE workout_state ADD COLUMN reps TEXT")
-    conn.commit()
-    return conn
+    return db.connect(WORKOUT_STATE_DB, schema="workout_state")
 
 def _need_user(x_user_id: str | None):
     uid = (x_user_id or "").strip()
@@ -76,384 +51,205 @@ def _need_user(x_user_id: str | None):
         raise HTTPException(status_code=422, detail="Missing X-User-Id header")
     return uid
 
-def _parse_plan(plan_text: str) -> List[Dict]:
+# Меняется вместе с логикой _parse_plan — старые разборы в parsed_plans перестают совпадать
+PLAN_PARSER_VERSION = 1
+REGEX_PARSER = f"regex/{PLAN_PARSER_VERSION}"
+AI_PARSER = f"ai/{PLAN_PARSER_VERSION}"
+
+# background — /today сразу отдаёт regex-разбор, ИИ разбирает план в фоне и подменяет
+# сохранённый разбор; sync — прежний блокирующий вызов ИИ внутри запроса
+AI_PARSER_MODE = (os.getenv("AI_PARSER_MODE") or "background").strip().lower()
+AI_PARSE_CONCURRENCY = int(os.getenv("AI_PARSE_CONCURRENCY", "2"))
+# Пауза перед повторной попыткой, если ИИ не разобрал этот текст
+AI_PARSE_RETRY_SEC = float(os.getenv("AI_PARSE_RETRY_SEC", "600"))
+# Больше изменений подходов в одном запросе /set-state/batch не принимаем
+SET_STATE_BATCH_MAX = int(os.getenv("SET_STATE_BATCH_MAX", "200"))
+
+def _use_ai_parser() -> bool:
+    return os.getenv("USE_AI_PARSER", "false").lower() == "true"
+
+def _background_ai() -> bool:
+    return _use_ai_parser() and AI_PARSER_MODE == "background"
+
+def _text_hash(plan_text: str) -> str:
+    return hashlib.sha1(plan_text.encode("utf-8")).hexdigest()
+
+def _parse_plan_ai(plan_text: str, fallback: bool = True) -> Optional[List[Dict]]:
+    """ИИ-разбор в формате _parse_plan; fallback=False — None, если ИИ не дал результата"""
+    exercises = workout_parser.parse_workout_plan_with_ai(plan_text, fallback=fallback)
+    if exercises is None:
+        return None
+
+    # Конвертируем формат для совместимости со старым кодом
+    result = []
+    for ex in exercises:
+        sets = []
+        for set_data in ex.get("sets", []):
+            # Формируем info для обратной совместимости
+            info_parts = []
+            if set_data.get("reps"):
+                info_parts.append(set_data["reps"])
+            if set_data.get("weight_kg"):
+                info_parts.append(f"{set_data['weight_kg']}кг")
+            if set_data.get("rpe"):
+                info_parts.append(f"RPE {set_data['rpe']}")
+            
+            info = " ".join(info_parts) if info_parts else ""
+            
+            sets.append({
+                "number": set_data.get("number", 1),
+                "info": info,
+                "reps": set_data.get("reps", ""),
+                "weight_kg": set_data.get("weight_kg")
+            })
+        
+        result.append({
+            "name": ex["name"],
+            "sets": sets
+        })
+    
+    return result
+
+def _parse_plan(plan_text: str) -> Tuple[List[Dict], str]:
     """
-    Парсит план тренировок.
+    Парсит план тренировок: (exercises, parser).
     Сначала пытается использовать ИИ-парсер, но при таймауте сразу переходит на fallback.
+    parser — кто на самом деле разобрал план: разбор после неудачи ИИ помечается REGEX_PARSER.
     """
     if not plan_text:
-        return []
+        return [], REGEX_PARSER
     
     # ИИ-парсер отключен по умолчанию из-за таймаутов
     # Используем быстрый fallback парсер для мгновенной загрузки
     # Включить можно через USE_AI_PARSER=true в .env (для сложных случаев)
-    use_ai_parser = os.getenv("USE_AI_PARSER", "false").lower() == "true"
-    
-    if use_ai_parser:
+    if _use_ai_parser():
         # Используем ИИ-парсер только если явно включен
         try:
-            try:
-                from app.workout_parser import parse_workout_plan_with_ai
-            except ImportError:
-                from workout_parser import parse_workout_plan_with_ai
-            
-            exercises = parse_workout_plan_with_ai(plan_text)
-            
-            # Конвертируем формат для совместимости со старым кодом
-            result = []
-            for ex in exercises:
-                sets = []
-                for set_data in ex.get("sets", []):
-                    # Формируем info для обратной совместимости
-                    info_parts = []
-                    if set_data.get("reps"):
-                        info_parts.append(set_data["reps"])
-                    if set_data.get("weight_kg"):
-                        info_parts.append(f"{set_data['weight_kg']}кг")
-                    if set_data.get("rpe"):
-                        info_parts.append(f"RPE {set_data['rpe']}")
-                    
-                    info = " ".join(info_parts) if info_parts else ""
-                    
-                    sets.append({
-                        "number": set_data.get("number", 1),
-                        "info": info,
-                        "reps": set_data.get("reps", ""),
-                        "weight_kg": set_data.get("weight_kg")
-                    })
-                
-                result.append({
-                    "name": ex["name"],
-                    "sets": sets
-                })
-            
-            return result
+            exercises = _parse_plan_ai(plan_text, fallback=False)
+            if exercises:
+                return exercises, AI_PARSER
+            logging.warning("AI parser returned nothing, using fallback")
         except Exception as e:
-            import logging
             logging.warning(f"AI parser error: {e}, using fallback")
             # Продолжаем на fallback
     
-    # Используем быстрый fallback парсер (по умолчанию)
+    # Быстрый разбор регулярными выражениями (по умолчанию) — общий движок plan_parser
+    return plan_parser.parse_plan(plan_text), REGEX_PARSER
+
+def _get_plan_text(conn, user_id: str, date: str) -> str:
+    """Текст плана на дату: kind='plan', fallback на legacy kind='workouts'"""
+    row = conn.execute("""
+        SELECT text FROM notes
+        WHERE user_id = ? AND d = ? AND kind = 'plan'
+    """, (user_id, date)).fetchone()
+    plan_text = row[0] if row else ""
     if not plan_text:
-        return []
-    
-    exercises = []
-    current_exercise = None
-    lines = plan_text.split('\n')
-    skip_sections = ['разминка', 'разогрев', 'заминка', 'основная часть', 'основная', 'warm-up', 'cool-down']
-    
-    def _build_sets(num_sets: int, reps: str = "", weight_kg: Optional[str] = None, info: str = "") -> List[Dict]:
-        sets = []
-        for i in range(1, num_sets + 1):
-            sets.append({
-                'number': i,
-                'info': info or reps,
-                'reps': reps,
-                'weight_kg': weight_kg
-            })
-        return sets
+        row = conn.execute("""
+            SELECT text FROM notes
+            WHERE user_id = ? AND d = ? AND kind = 'workouts'
+        """, (user_id, date)).fetchone()
+        plan_text = row[0] if row else ""
+    return plan_text
 
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        
-        # Убираем эмодзи и маркеры списка
-        line_clean = re.sub(r'^[🗓️📝•\-\*🏋️🍽️]\s*', '', line)
-        line_clean = re.sub(r'^\d+[\.\)]\s*', '', line_clean)
-        line_clean = line_clean.strip()
-        
-        # Пропускаем заголовки разделов
-        line_lower = line_clean.lower()
-        if any(section in line_lower for section in skip_sections):
-            # Если есть текущее упражнение без подходов, сохраняем его
-            if current_exercise and current_exercise['sets']:
-                exercises.append(current_exercise)
-                current_exercise = None
-            continue
-        
-        # Паттерны без двоеточия:
-        # 1) "Жим лежа 3 подхода по 50 повторений"
-        m = re.match(r'^(.+?)\s+(\d+)\s*подход[а-я]*\s*(?:по\s*)?(.+)$', line_clean, re.IGNORECASE)
-        if m:
-            exercise_name = m.group(1).strip()
-            num_sets = int(m.group(2))
-            reps_info = m.group(3).strip()
-            reps = re.sub(r'\s*повторени[яй]?\s*', '', reps_info, flags=re.IGNORECASE).strip()
-            current_exercise = {
-                'name': exercise_name,
-                'sets': _build_sets(num_sets, reps=reps, info=reps_info)
-            }
-            exercises.append(current_exercise)
-            current_exercise = None
-            continue
-
-        # 2) "100 отжиманий по 3 подхода"
-        m = re.match(r'^(\d+)\s+(.+?)\s+по\s+(\d+)\s*подход[а-я]*$', line_clean, re.IGNORECASE)
-        if m:
-            reps = m.group(1).strip()
-            exercise_name = m.group(2).strip()
-            num_sets = int(m.group(3))
-            current_exercise = {
-                'name': exercise_name,
-                'sets': _build_sets(num_sets, reps=reps, info=f"{reps} повторений")
-            }
-            exercises.append(current_exercise)
-            current_exercise = None
-            continue
-
-        # 3) "20 приседаний" / "20 отжиманий"
-        m = re.match(r'^(\d+)\s+([^\d]+)$', line_clean)
-        if m and "кг" not in line_lower and "подход" not in line_lower:
-            reps = m.group(1).strip()
-            exercise_name = m.group(2).strip()
-            current_exercise = {
-                'name': exercise_name,
-                'sets': _build_sets(1, reps=reps, info=f"{reps} повторений")
-            }
-            exercises.append(current_exercise)
-            current_exercise = None
-            continue
-
-        # Проверяем формат: "Упражнение: 4х8-10" или "Упражнение: 4 подхода по 10-12"
-        # Улучшенный паттерн для поддержки названий в скобках: "Бабочка (сведение рук): 4х8-10"
-        colon_match = re.match(r'^(.+?):\s*(.+)', line_clean)
-        if colon_match:
-            exercise_name = colon_match.group(1).strip()
-            sets_info = colon_match.group(2).strip()
-            
-            # Парсим информацию о подходах
-            # Формат: "4х8-10" или "4 подхода по 10-12 повторений" или "3хдо отказа"
-            sets = []
-            
-            # Формат "4х8-10" или "4x8-10" или "4х8-10 60кг" или "4х8-10, 60кг"
-            x_match = re.search(r'(\d+)\s*[хx]\s*([\d\-до\s]+(?:[\s,]+)?\d+\s*кг)?', sets_info, re.IGNORECASE)
-            if not x_match:
-                # Попробуем найти вес отдельно: "4х8-10, 60 кг"
-                x_match = re.search(r'(\d+)\s*[хx]\s*([\d\-до\s]+)', sets_info, re.IGNORECASE)
-            
-            if x_match:
-                num_sets = int(x_match.group(1))
-                reps_info = x_match.group(2).strip() if x_match.group(2) else sets_info
-                
-                # Ищем вес в разных форматах: "60кг", "60 кг", ", 60кг", "с весом 70 кг", "весом 70 кг"
-                weight_kg = None
-                # Сначала ищем "с весом X кг" или "весом X кг"
-                weight_match = re.search(r'(?:с\s+)?весом\s+(\d+(?:[.,]\d+)?)\s*кг', sets_info, re.IGNORECASE)
-                if weight_match:
-                    weight_kg = weight_match.group(1).replace(',', '.')
-                    try:
-                        weight_kg = str(int(float(weight_kg)))  # Конвертируем в целое число
-                    except:
-                        weight_kg = weight_match.group(1)
-                
-                # Если не нашли, ищем стандартные форматы: "60кг", "60 кг", ", 60кг", ", 60 кг"
-                if not weight_kg:
-                    weight_match = re.search(r'[,\s]+(\d+(?:[.,]\d+)?)\s*кг|^(\d+(?:[.,]\d+)?)\s*кг|(\d+(?:[.,]\d+)?)\s*кг', sets_info, re.IGNORECASE)
-                    if weight_match:
-                        weight_str = weight_match.group(1) or weight_match.group(2) or weight_match.group(3)
-                        weight_str = weight_str.replace(',', '.')
-                        try:
-                            weight_kg = str(int(float(weight_str)))  # Конвертируем в целое число
-                        except:
-                            weight_kg = weight_str
-                
-                # Если вес не найден в строке с подходами, ищем в конце всей строки
-                if not weight_kg:
-                    weight_match = re.search(r'(\d+(?:[.,]\d+)?)\s*кг', sets_info, re.IGNORECASE)
-                    if weight_match:
-                        weight_str = weight_match.group(1).replace(',', '.')
-                        try:
-                            weight_kg = str(int(float(weight_str)))
-                        except:
-                            weight_kg = weight_match.group(1)
-                
-                # Убираем вес из строки с повторениями (включая "с весом X кг")
-                reps = re.sub(r'(?:с\s+)?весом\s+\d+(?:[.,]\d+)?\s*кг|,\s*\d+(?:[.,]\d+)?\s*кг|\d+(?:[.,]\d+)?\s*кг', '', reps_info, flags=re.IGNORECASE).strip()
-                reps = re.sub(r'^,\s*|,\s*$', '', reps).strip()  # Убираем запятые по краям
-                
-                # Исправляем обрезанные фразы типа "до о" -> "до отказа"
-                if reps == "до о":
-                    reps = "до отказа"
-                
-                for i in range(1, num_sets + 1):
-                    sets.append({
-                        'number': i,
-                        'info': sets_info,  # Сохраняем оригинальную строку
-                        'reps': reps,
-                        'weight_kg': weight_kg
-                    })
-            else:
-                # Формат "4 подхода по 10-12 повторений" или "4 подхода по 10-12 60кг"
-                approach_match = re.search(r'(\d+)\s*подход[а-я]*\s*(?:по\s*)?([\d\-до\s]+)', sets_info, re.IGNORECASE)
-                if approach_match:
-                    num_sets = int(approach_match.group(1))
-                    reps_info = approach_match.group(2).strip()
-                    
-                    # Ищем вес в разных форматах
-                    weight_kg = None
-                    # Сначала ищем "с весом X кг" или "весом X кг"
-                    weight_match = re.search(r'(?:с\s+)?весом\s+(\d+(?:[.,]\d+)?)\s*кг', sets_info, re.IGNORECASE)
-                    if weight_match:
-                        weight_str = weight_match.group(1).replace(',', '.')
-                        try:
-                            weight_kg = str(int(float(weight_str)))
-                        except:
-                            weight_kg = weight_match.group(1)
-                    
-                    # Если не нашли, ищем стандартные форматы
-                    if not weight_kg:
-                        weight_match = re.search(r'[,\s]+(\d+(?:[.,]\d+)?)\s*кг|^(\d+(?:[.,]\d+)?)\s*кг|(\d+(?:[.,]\d+)?)\s*кг', sets_info, re.IGNORECASE)
-                        if weight_match:
-                            weight_str = weight_match.group(1) or weight_match.group(2) or weight_match.group(3)
-                            weight_str = weight_str.replace(',', '.')
-                            try:
-                                weight_kg = str(int(float(weight_str)))
-                            except:
-                                weight_kg = weight_str
-                    
-                    # Убираем вес из строки с повторениями (включая "с весом X кг")
-                    reps = re.sub(r'(?:с\s+)?весом\s+\d+(?:[.,]\d+)?\s*кг|,\s*\d+(?:[.,]\d+)?\s*кг|\d+(?:[.,]\d+)?\s*кг', '', reps_info, flags=re.IGNORECASE).strip()
-                    reps = re.sub(r'^,\s*|,\s*$', '', reps).strip()
-                    
-                    # Исправляем обрезанные фразы типа "до о" -> "до отказа"
-                    if reps == "до о":
-                        reps = "до отказа"
-                    
-                    for i in range(1, num_sets + 1):
-                        sets.append({
-                            'number': i,
-                            'info': sets_info,  # Сохраняем оригинальную строку
-                            'reps': reps,
-                            'weight_kg': weight_kg
-                        })
-                else:
-                    # Если не удалось распарсить, создаем один подход с полной информацией
-                    weight_kg = None
-                    # Ищем вес в разных форматах
-                    weight_match = re.search(r'(?:с\s+)?весом\s+(\d+(?:[.,]\d+)?)\s*кг|(\d+(?:[.,]\d+)?)\s*кг', sets_info, re.IGNORECASE)
-                    if weight_match:
-                        weight_str = (weight_match.group(1) or weight_match.group(2)).replace(',', '.')
-                        try:
-                            weight_kg = str(int(float(weight_str)))
-                        except:
-                            weight_kg = weight_str
-                    
-                    # Убираем вес из строки с повторениями
-                    reps = re.sub(r'(?:с\s+)?весом\s+\d+(?:[.,]\d+)?\s*кг|\d+(?:[.,]\d+)?\s*кг', '', sets_info, flags=re.IGNORECASE).strip()
-                    reps = re.sub(r'\s*повторени[яй]?\s*', '', reps, flags=re.IGNORECASE).strip()
-                    
-                    sets.append({
-                        'number': 1,
-                        'info': sets_info,
-                        'reps': reps,
-                        'weight_kg': weight_kg
-                    })
-            
-            # Сохраняем предыдущее упражнение
-            if current_exercise and current_exercise['sets']:
-                exercises.append(current_exercise)
-            
-            # Создаем новое упражнение
-            current_exercise = {
-                'name': exercise_name,
-                'sets': sets
-            }
-            continue
-        
-        # Проверяем, является ли строка упражнением (начинается с дефиса или содержит только название)
-        if line_clean.startswith('-') or (not ':' in line_clean and not 'подход' in line_lower):
-            # Убираем дефис в начале
-            line_clean = re.sub(r'^-\s*', '', line_clean)
-            
-            # Если это не подход, то это новое упражнение
-            if 'подход' not in line_lower and 'set' not in line_lower:
-                # Сохраняем предыдущее упражнение
-                if current_exercise and current_exercise['sets']:
-                    exercises.append(current_exercise)
-                
-                # Создаем новое упражнение
-                current_exercise = {
-                    'name': line_clean,
-                    'sets': []
-                }
-            else:
-                # Это подход в формате "1 подход - 20 кг"
-                if current_exercise is None:
-                    current_exercise = {
-                        'name': 'Упражнение',
-                        'sets': []
-                    }
-                
-                # Парсим подход: "1 подход - 20 кг" или "1 подход - 8-10 повторений 60кг"
-                set_match = re.search(r'(\d+)\s*подход[а-я]*\s*[:\-]\s*(.+)', line_clean, re.IGNORECASE)
-                if set_match:
-                    set_num = int(set_match.group(1))
-                    set_info = set_match.group(2).strip()
-                    
-                    # Парсим вес и повторения отдельно
-                    weight_match = re.search(r'(\d+)\s*кг', set_info, re.IGNORECASE)
-                    weight_kg = weight_match.group(1) if weight_match else None
-                    reps = re.sub(r'\s*\d+\s*кг', '', set_info, flags=re.IGNORECASE).strip()
-                    # Убираем слова "повторений", "повторения" и т.д.
-                    reps = re.sub(r'\s*повторени[яй]?\s*', '', reps, flags=re.IGNORECASE).strip()
-                    
-                    current_exercise['sets'].append({
-                        'number': set_num,
-                        'info': set_info,
-                        'reps': reps,
-                        'weight_kg': weight_kg
-                    })
-        else:
-            # Это подход в другом формате
-            if current_exercise is None:
-                current_exercise = {
-                    'name': 'Упражнение',
-                    'sets': []
-                }
-            
-            # Парсим подход: "1 подход - 20 кг" или "1 подход: 20 кг"
-            set_match = re.search(r'(\d+)\s*подход[а-я]*\s*[:\-]\s*(.+)', line_clean, re.IGNORECASE)
-            if set_match:
-                set_num = int(set_match.group(1))
-                set_info = set_match.group(2).strip()
-                
-                # Парсим вес и повторения отдельно
-                weight_kg = None
-                # Ищем вес в разных форматах
-                weight_match = re.search(r'(?:с\s+)?весом\s+(\d+(?:[.,]\d+)?)\s*кг|(\d+(?:[.,]\d+)?)\s*кг', set_info, re.IGNORECASE)
-                if weight_match:
-                    weight_str = (weight_match.group(1) or weight_match.group(2)).replace(',', '.')
-                    try:
-                        weight_kg = str(int(float(weight_str)))
-                    except:
-                        weight_kg = weight_str
-                
-                # Убираем вес из строки с повторениями
-                reps = re.sub(r'(?:с\s+)?весом\s+\d+(?:[.,]\d+)?\s*кг|\d+(?:[.,]\d+)?\s*кг', '', set_info, flags=re.IGNORECASE).strip()
-                # Убираем слова "повторений", "повторения" и т.д.
-                reps = re.sub(r'\s*повторени[яй]?\s*', '', reps, flags=re.IGNORECASE).strip()
-                
-                current_exercise['sets'].append({
-                    'number': set_num,
-                    'info': set_info,
-                    'reps': reps,
-                    'weight_kg': weight_kg
-                })
-    
-    # Добавляем последнее упражнение
-    if current_exercise:
-        # Если у упражнения нет подходов, но есть название - создаем один подход
-        if not current_exercise['sets']:
-            current_exercise['sets'] = [{
-                'number': 1,
-                'info': 'Выполнить',
-                'reps': '',
-                'weight_kg': None
-            }]
-        exercises.append(current_exercise)
-    
-    return exercises
+def _get_plan(user_id: str, date: str):
+    """
+    Текст плана и его сохранённый разбор, если он сделан по этому же тексту
+    и той же версией парсера: (plan_text, exercises | None, parser | None).
+    С ИИ-парсером подходит и regex-разбор: в фоновом режиме его отдают, пока ИИ-разбор
+    в работе, в синхронном — это разбор после неудачи ИИ.
+    """
+    conn = _db()
+    try:
+        plan_text = _get_plan_text(conn, user_id, date)
+        if not plan_text:
+            return plan_text, [], None
+        accepted = (AI_PARSER, REGEX_PARSER) if _use_ai_parser() else (REGEX_PARSER,)
+        row = conn.execute(f"""
+            SELECT exercises, parser FROM parsed_plans
+            WHERE user_id = ? AND d = ? AND text_hash = ? AND parser IN ({', '.join('?' * len(accepted))})
+        """, (user_id, date, _text_hash(plan_text), *accepted)).fetchone()
+        return (plan_text, json.loads(row[0]), row[1]) if row else (plan_text, None, None)
+    finally:
+        conn.close()
+
+def _save_parsed_plan(user_id: str, date: str, plan_text: str, exercises: List[Dict],
+                      parser: str, same_text_only: bool = False) -> None:
+    """
+    same_text_only — не затирать разбор другого текста: фоновый ИИ-разбор
+    мог закончиться уже после того, как план переписали
+    """
+    conn = _db()
+    try:
+        conn.execute(f"""
+            INSERT INTO parsed_plans (user_id, d, text_hash, parser, exercises, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(user_id, d) DO UPDATE SET
+                text_hash = excluded.text_hash,
+                parser = excluded.parser,
+                exercises = excluded.exercises,
+                updated_at = excluded.updated_at
+            {"WHERE parsed_plans.text_hash = excluded.text_hash" if same_text_only else ""}
+        """, (user_id, date, _text_hash(plan_text), parser,
+              json.dumps(exercises, ensure_ascii=False), datetime.now().isoformat()))
+        conn.commit()
+    finally:
+        conn.close()
+
+# === Фоновый ИИ-разбор ===
+# Задачи живут в процессе API: один разбор на (пользователь, дата, текст),
+# не больше AI_PARSE_CONCURRENCY вызовов ИИ одновременно
+
+_ai_jobs: Dict[tuple, asyncio.Task] = {}
+_ai_retry_at: Dict[tuple, float] = {}
+_ai_slots: Optional[asyncio.Semaphore] = None
+
+def _schedule_ai_parse(user_id: str, date: str, plan_text: str) -> bool:
+    """Ставит ИИ-разбор плана в фон. True — разбор в работе (клиент перезапросит план)"""
+    global _ai_slots
+    if len(plan_text.strip()) < workout_parser.AI_MIN_PLAN_CHARS:
+        return False
+    key = (user_id, date, _text_hash(plan_text))
+    if key in _ai_jobs:
+        return True
+    if _ai_retry_at.get(key, 0) > time.monotonic():
+        return False
+    if _ai_slots is None:
+        _ai_slots = asyncio.Semaphore(AI_PARSE_CONCURRENCY)
+    task = asyncio.create_task(_ai_parse_job(key, plan_text))
+    _ai_jobs[key] = task
+    task.add_done_callback(lambda _t: _ai_jobs.pop(key, None))
+    return True
+
+async def _ai_parse_job(key: tuple, plan_text: str) -> None:
+    user_id, date, _ = key
+    async with _ai_slots:
+        try:
+            exercises = await asyncio.to_thread(_parse_plan_ai, plan_text, False)
+        except Exception as e:
+            logging.warning(f"Background AI parser error: {e}")
+            exercises = None
+    if not exercises:
+        # Остаёмся на regex-разборе; повторим не раньше чем через AI_PARSE_RETRY_SEC
+        now = time.monotonic()
+        for stale in [k for k, t in _ai_retry_at.items() if t <= now]:
+            del _ai_retry_at[stale]
+        _ai_retry_at[key] = now + AI_PARSE_RETRY_SEC
+        return
+    # Пока шёл разбор, пользователь мог отметить подходы по regex-названиям упражнений —
+    # подмена разбора оставила бы эти отметки без упражнений
+    if await db.run("workout_state", _has_workout_state, user_id, date):
+        return
+    await db.run("tracker", _save_parsed_plan, user_id, date, plan_text, exercises, AI_PARSER, True)
+
+def _has_workout_state(user_id: str, date: str) -> bool:
+    """Есть ли на дату хоть одна отметка подхода"""
+    conn = _workout_state_db()
+    try:
+        row = conn.execute("SELECT 1 FROM workout_state WHERE user_id = ? AND date = ? LIMIT 1",
+                           (user_id, date)).fetchone()
+        return row is not None
+    finally:
+        conn.close()
 
 def _get_workout_state(user_id: str, date: str) -> Dict:
     """Получает состояние выполнения упражнений на дату"""
@@ -481,48 +277,59 @@ def _get_workout_state(user_id: str, date: str) -> Dict:
     finally:
         conn.close()
 
+# Одно изменение подхода — один оператор: без SELECT перед записью параллельные
+# нажатия не затирают друг друга. NULL в параметре — «поле не меняется».
+# Новая строка: NULL -> 0 / ''. Выполненный подход снимает пропуск и наоборот.
+_SET_STATE_UPSERT = """
+    INSERT INTO workout_state (user_id, date, exercise_name, set_number, weight, reps, completed, skipped, updated_at)
+    VALUES (:user_id, :date, :exercise_name, :set_number, COALESCE(:weight, ''), COALESCE(:reps, ''),
+            COALESCE(:completed, 0), COALESCE(:skipped, 0), :now)
+    ON CONFLICT(user_id, date, exercise_name, set_number) DO UPDATE SET
+        completed = CASE WHEN :completed IS NOT NULL THEN :completed
+                         WHEN :skipped = 1 THEN 0
+                         ELSE completed END,
+        skipped = CASE WHEN :completed = 1 THEN 0
+                       ELSE COALESCE(:skipped, skipped) END,
+        weight = COALESCE(:weight, weight),
+        reps = COALESCE(:reps, reps),
+        updated_at = :now
+"""
+
+def _set_state_params(user_id: str, date: str, exercise_name: str, set_number: int, now: str,
+                      completed: Optional[bool] = None, skipped: Optional[bool] = None, weight: Optional[str] = None, reps: Optional[str] = None) -> Dict:
+    return {
+        "user_id": user_id, "date": date, "exercise_name": exercise_name, "set_number": set_number, "now": now,
+        "completed": None if completed is None else int(completed),
+        "skipped": None if skipped is None else int(skipped),
+        "weight": weight, "reps": reps,
+    }
+
 def _update_set_state(user_id: str, date: str, exercise_name: str, set_number: int, 
                      completed: Optional[bool] = None, skipped: Optional[bool] = None, weight: Optional[str] = None, reps: Optional[str] = None):
     """Обновляет состояние подхода"""
     conn = _workout_state_db()
+    try:
+        conn.execute(_SET_STATE_UPSERT, _set_state_params(user_id, date, exercise_name, set_number,
+                                                          datetime.now().isoformat(), completed, skipped, weight, reps))
+        conn.commit()
+    finally:
+        conn.close()
+
+def _update_set_states(user_id: str, date: str, updates: List["SetStateUpdate"]) -> int:
+    """
+    Пачка изменений подходов одной транзакцией, в порядке нажатий.
+    Ошибка на любом элементе откатывает всю пачку (close() без commit).
+    """
+    conn = _workout_state_db()
     try:
         now = datetime.now().isoformat()
-        
-        # Получаем текущее состояние
-        row = conn.execute("""
-            SELECT completed, skipped, weight, reps
-            FROM workout_state
-            WHERE user_id = ? AND date = ? AND exercise_name = ? AND set_number = ?
-        """, (user_id, date, exercise_name, set_number)).fetchone()
-        
-        if row:
-            current_completed, current_skipped, current_weight, current_reps = row
-            new_completed = completed if completed is not None else current_completed
-            new_skipped = skipped if skipped is not None else current_skipped
-            new_weight = weight if weight is not None else current_weight
-            new_reps = reps if reps is not None else current_reps
-            
-            # Если отмечаем как выполненный, снимаем пропуск и наоборот
-            if completed is True:
-                new_skipped = False
-            elif skipped is True:
-                new_completed = False
-            
-            conn.execute("""
-                UPDATE workout_state
-                SET completed = ?, skipped = ?, weight = ?, reps = ?, updated_at = ?
-                WHERE user_id = ? AND date = ? AND exercise_name = ? AND set_number = ?
-            """, (new_completed, new_skipped, new_weight, new_reps, now, user_id, date, exercise_name, set_number))
-        else:
-            # Создаем новую запись
-            new_completed = 1 if completed else 0
-            new_skipped = 1 if skipped else 0
-            conn.execute("""
-                INSERT INTO workout_state (user_id, date, exercise_name, set_number, weight, reps, completed, skipped, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (user_id, date, exercise_name, set_number, weight or '', reps or '', new_completed, new_skipped, now))
-        
+        conn.executemany(_SET_STATE_UPSERT, [
+            _set_state_params(user_id, date, update.exercise_name, update.set_number, now,
+                              update.completed, update.skipped, reps=update.reps)
+            for update in updates
+        ])
         conn.commit()
+        return len(updates)
     finally:
         conn.close()
 
@@ -535,28 +342,24 @@ async def get_today_workout_plan(x_user_id: str = Header(None, alias="X-User-Id"
     moscow_tz = timezone(timedelta(hours=3))
     today = datetime.now(moscow_tz).strftime("%Y-%m-%d")
     
-    # Получаем план на сегодня (kind='plan', fallback на legacy kind='workouts')
-    conn = _db()
-    try:
-        row = conn.execute("""
-            SELECT text FROM notes
-            WHERE user_id = ? AND d = ? AND kind = 'plan'
-        """, (user_id, today)).fetchone()
-        plan_text = row[0] if row else ""
-        if not plan_text:
-            row = conn.execute("""
-                SELECT text FROM notes
-                WHERE user_id = ? AND d = ? AND kind = 'workouts'
-            """, (user_id, today)).fetchone()
-            plan_text = row[0] if row else ""
-    finally:
-        conn.close()
+    # Получаем план на сегодня (kind='plan', fallback на legacy kind='workouts') и его готовый разбор
+    plan_text, exercises, parser = await db.run("tracker", _get_plan, user_id, today)
     
-    # Парсим план
-    exercises = _parse_plan(plan_text)
+    # Парсим план только если текст изменился с прошлого разбора
+    if exercises is None:
+        if _background_ai():
+            # Сразу отдаём быстрый разбор — ИИ-разбор подменит его в фоне
+            exercises, parser = plan_parser.parse_plan(plan_text), REGEX_PARSER
+        else:
+            exercises, parser = await asyncio.to_thread(_parse_plan, plan_text)
+        await db.run("tracker", _save_parsed_plan, user_id, today, plan_text, exercises, parser)
     
     # Получаем состояние выполнения
-    state = _get_workout_state(user_id, today)
+    state = await db.run("workout_state", _get_workout_state, user_id, today)
+    
+    # Отметки подходов привязаны к названиям из текущего разбора — с ними разбор уже не подменяем
+    parse_pending = (parser == REGEX_PARSER and _background_ai() and not state
+                     and _schedule_ai_parse(user_id, today, plan_text))
     
     # Объединяем упражнения с состоянием
     result = []
@@ -632,7 +435,9 @@ async def get_today_workout_plan(x_user_id: str = Header(None, alias="X-User-Id"
     return {
         'date': today,
         'exercises': result,
-        'has_plan': has_plan
+        'has_plan': has_plan,
+        # true — идёт ИИ-разбор плана, стоит перезапросить /today через несколько секунд
+        'parse_pending': parse_pending
     }
 
 
@@ -656,7 +461,8 @@ async def update_set_state(
     moscow_tz = timezone(timedelta(hours=3))
     today = datetime.now(moscow_tz).strftime("%Y-%m-%d")
     
-    _update_set_state(
+    await db.run(
+        "workout_state", _update_set_state,
         user_id, today,
         update.exercise_name,
         update.set_number,
@@ -666,3 +472,28 @@ async def update_set_state(
     )
     
     return {"success": True}
+
+
+class SetStateBatch(BaseModel):
+    updates: List[SetStateUpdate]
+
+@router.post("/api/workout-plan/set-state/batch")
+async def update_set_states(
+    batch: SetStateBatch,
+    x_user_id: str = Header(None, alias="X-User-Id")
+):
+    """
+    Несколько изменений подходов за один запрос: tracker.js копит нажатия
+    и отправляет их пачкой вместо отдельного POST на каждое
+    """
+    user_id = _need_user(x_user_id)
+    if len(batch.updates) > SET_STATE_BATCH_MAX:
+        raise HTTPException(status_code=422, detail=f"Too many updates (max {SET_STATE_BATCH_MAX})")
+    moscow_tz = timezone(timedelta(hours=3))
+    today = datetime.now(moscow_tz).strftime("%Y-%m-%d")
+    
+    applied = 0
+    if batch.updates:
+        applied = await db.run("workout_state", _update_set_states, user_id, today, batch.updates)
+    
+    return {"success": True, "applied": applied}
@@ -4,11 +4,12 @@ Webhook endpoint для YooKassa
 """
 import os
 import json
-import sqlite3
 import time
 from datetime import datetime, timezone, timedelta
 from fastapi import APIRouter, Request, HTTPException
 
+import db
+
 router = APIRouter()
 
 PAY_SUB_DAYS = int(os.getenv("PAY_SUB_DAYS", "30").strip())
@@ -16,20 +17,8 @@ PAYWALL_DB = os.getenv("PAYWALL_DB", "/root/ai_trainer_cursor/paywall.db")
 
 def activate_paid(user_id: int, days: int = PAY_SUB_DAYS) -> int:
     """Активирует подписку для пользователя"""
-    conn = sqlite3.connect(PAYWALL_DB, check_same_thread=False)
+    conn = db.connect(PAYWALL_DB, schema="paywall")
     try:
-        # Создаем таблицу, если её нет
-        conn.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY,
-            msg_count INTEGER NOT NULL DEFAULT 0,
-            paid_until INTEGER NOT NULL DEFAULT 0,
-            pending_payment_id TEXT DEFAULT NULL,
-            pending_created INTEGER NOT NULL DEFAULT 0
-        )
-        """)
-        conn.commit()
-        
         paid_until = int((datetime.now(timezone.utc) + timedelta(days=days)).timestamp())
         conn.execute(
             "INSERT INTO users(user_id, msg_count, paid_until, pending_payment_id, pending_created) VALUES(?,?,?,?,?) "
@@ -75,15 +64,15 @@ async def yookassa_webhook(request: Request):
         
         # Если платеж успешен, активируем подписку
         if status == "succeeded":
-            paid_until = activate_paid(user_id, PAY_SUB_DAYS)
+            paid_until = await db.run("paywall", activate_paid, user_id, PAY_SUB_DAYS)
             try:
                 from referrals import record_paid_event, mark_price_promo_used
                 amount = float((payment_data.get("amount") or {}).get("value") or 0)
                 if amount:
-                    record_paid_event(user_id, amount)
+                    await db.run("referrals", record_paid_event, user_id, amount)
                 promo_code = (metadata.get("promo_code") or "").strip()
                 if promo_code:
-                    mark_price_promo_used(promo_code, user_id, int(time.time()))
+                    await db.run("referrals", mark_price_promo_used, promo_code, user_id, int(time.time()))
             except Exception:
                 pass
             return {